@@ -0,0 +1,169 @@
+"""
+Benchmark the processing pipeline on synthetic runs.
+
+Generates Neptune-style runs with `docs_helpers.generate_run_data`, times each processing stage of
+each engine separately, records peak memory, and writes the results as JSON so they can be compared
+between versions. For example:
+
+    python benchmarks/benchmark.py --sizes 50 500 5000 --output results.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "docs"))
+
+from docs_helpers import generate_run_data  # noqa: E402
+from icpmsprocess import (  # noqa: E402
+    DataProcessor,
+    InstrumentationSink,
+    ProcessingSettings,
+    RecordingSink,
+)
+from icpmsprocess.lib import NIST610, Pb_Pb  # noqa: E402
+from icpmsprocess.utils import load_samples  # noqa: E402
+
+
+def settings_for(n_cycles: int) -> ProcessingSettings:
+    """Processing settings matching the blank and signal windows of the generated data"""
+    return ProcessingSettings(
+        intensity_metric="208Pb",
+        min_signal_intensity=1,
+        low_cycles_warning_frac=0.1,
+        max_blank_intensity=5e-4,
+        blank_cycles=n_cycles // 2 - 2,
+        signal_cycles=(n_cycles // 2 + 1, n_cycles - 2),
+    )
+
+
+def load(data_dir: str, fast_load: bool, workers: int) -> list:
+    """Load the generated run"""
+    kwargs = {"intensity_metric": "208Pb", "workers": workers} if fast_load else {}
+    return load_samples(
+        data_dir, os.path.join(data_dir, "sample_map.csv"), Pb_Pb, **kwargs
+    )
+
+
+ENGINES = {"sample": "process", "batch": "process_batch"}
+
+
+def benchmark(
+    data_dir: str,
+    engine: str,
+    n_cycles: int,
+    fast_load: bool,
+    workers: int,
+    repeats: int,
+    measure_memory: bool,
+) -> dict:
+    """Time each stage of an engine (best of `repeats`) and optionally measure its peak memory"""
+    best: dict[str, float] = {}
+    for _ in range(repeats):
+        sink = RecordingSink()
+        processor = DataProcessor(settings_for(n_cycles), NIST610, sink)
+        start = time.perf_counter()
+        samples = load(data_dir, fast_load, workers)
+        timings = {"load": time.perf_counter() - start}
+        getattr(processor, ENGINES[engine])(samples)
+        timings.update(dict(sink.timings))
+        for stage, seconds in timings.items():
+            best[stage] = min(best.get(stage, np.inf), seconds)
+
+    result = {"stages": best, "total": sum(best.values())}
+
+    if measure_memory:
+        processor = DataProcessor(
+            settings_for(n_cycles), NIST610, InstrumentationSink()
+        )
+        tracemalloc.start()
+        getattr(processor, ENGINES[engine])(load(data_dir, fast_load, workers))
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+
+def main(argv: list[str] | None = None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--cycles", type=int, nargs="+", default=[60])
+    parser.add_argument("--extra-isotopes", type=int, nargs="+", default=[0])
+    parser.add_argument("--standard-spacing", type=int, nargs="+", default=[10])
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument(
+        "--fast-load", action="store_true", help="column-pruned loading"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="loader workers")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory")
+    parser.add_argument("--output", help="JSON file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    environment = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+
+    results = []
+    configurations = itertools.product(
+        args.sizes, args.cycles, args.extra_isotopes, args.standard_spacing
+    )
+    for size, n_cycles, n_extra, spacing in configurations:
+        with tempfile.TemporaryDirectory() as data_dir:
+            np.random.seed(42)
+            generate_run_data(size, data_dir, n_cycles, n_extra, spacing)
+            for engine in args.engines:
+                timing = benchmark(
+                    data_dir,
+                    engine,
+                    n_cycles,
+                    args.fast_load,
+                    args.workers,
+                    args.repeats,
+                    not args.no_memory,
+                )
+                results.append(
+                    {
+                        "engine": engine,
+                        "analyses": size,
+                        "cycles": n_cycles,
+                        "extra_isotopes": n_extra,
+                        "standard_spacing": spacing,
+                        "fast_load": args.fast_load,
+                        "workers": args.workers,
+                        **timing,
+                        "environment": environment,
+                    }
+                )
+                print(
+                    f"{engine:>6} {size:>6} analyses: {timing['total']:.3f} s",
+                    file=sys.stderr,
+                )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
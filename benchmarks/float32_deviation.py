@@ -0,0 +1,111 @@
+"""
+Measure how far results processed from float32 intensities are from the float64 results.
+
+Generates synthetic runs, processes each with `storage_dtype="float64"` and `"float32"` (both
+engines), and reports the worst deviation of the corrected ratios and their errors, relative to the
+float64 values and to the float64 errors, along with the bytes the loaded intensities take in each (the
+float columns of every sample, not their index, cycle times or anything allocated while parsing). Fails
+if any ratio moves by more than the given fraction of its error. For example:
+
+    python benchmarks/float32_deviation.py --sizes 200 2000 --max-error-fraction 0.01
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from dataclasses import replace
+
+import numpy as np
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "docs"))
+
+from benchmark import settings_for  # noqa: E402
+from docs_helpers import generate_run_data  # noqa: E402
+from icpmsprocess import DataProcessor, InstrumentationSink  # noqa: E402
+from icpmsprocess.lib import NIST610, Pb_Pb  # noqa: E402
+from icpmsprocess.utils import load_samples  # noqa: E402
+
+
+def process(data_dir: str, n_cycles: int, engine: str, storage_dtype: str):
+    """Load and process a run with a storage dtype, returning the results and the bytes its intensities take"""
+    settings = replace(settings_for(n_cycles), storage_dtype=storage_dtype)
+    samples = load_samples(
+        data_dir,
+        os.path.join(data_dir, "sample_map.csv"),
+        Pb_Pb,
+        intensity_metric="208Pb",
+        storage_dtype=storage_dtype,
+    )
+    intensity_bytes = sum(
+        int(s.timeseries_data.select_dtypes("floating").memory_usage(index=False).sum())
+        for s in samples
+    )
+    results = getattr(DataProcessor(settings, NIST610, InstrumentationSink()), engine)(
+        samples
+    )
+    return results, intensity_bytes
+
+
+def deviation(data_dir: str, n_cycles: int, engine: str) -> dict:
+    """The worst deviation of the float32 results of a run from the float64 ones"""
+    exact, exact_bytes = process(data_dir, n_cycles, engine, "float64")
+    approx, approx_bytes = process(data_dir, n_cycles, engine, "float32")
+    errors = [c for c in exact.columns if c.endswith("_err")]
+    ratios = [c[: -len("_err")] for c in errors]
+
+    values = exact[ratios].to_numpy()
+    value_errors = exact[errors].to_numpy()
+    shift = np.abs(approx[ratios].to_numpy() - values)
+    error_shift = np.abs(approx[errors].to_numpy() - value_errors)
+    return {
+        "max_relative_deviation": float(np.nanmax(shift / np.abs(values))),
+        "max_deviation_in_errors": float(np.nanmax(shift / value_errors)),
+        "max_relative_error_deviation": float(np.nanmax(error_shift / value_errors)),
+        "intensity_bytes_float64": exact_bytes,
+        "intensity_bytes_float32": approx_bytes,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200])
+    parser.add_argument("--cycles", type=int, default=60)
+    parser.add_argument(
+        "--max-error-fraction",
+        type=float,
+        default=0.01,
+        help="largest deviation allowed, as a fraction of the ratio's error",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as data_dir:
+            np.random.seed(42)
+            generate_run_data(size, data_dir, args.cycles)
+            for engine in ("process", "process_batch"):
+                results.append(
+                    {
+                        "engine": engine,
+                        "analyses": size,
+                        **deviation(data_dir, args.cycles, engine),
+                    }
+                )
+    print(json.dumps(results, indent=2))
+
+    worst = max(result["max_deviation_in_errors"] for result in results)
+    if worst > args.max_error_fraction:
+        print(
+            f"float32 results deviate by up to {worst:.2g} of their errors, over {args.max_error_fraction}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Check the time taken to import icpmsprocess against a budget.
+
+Imports the package in fresh interpreters, and reports the best time, and how much of it is the
+package itself rather than numpy and pandas. Fails if that is over the budget, or if importing the
+package also imports an optional dependency, which should only be imported when it's used. For example:
+
+    python benchmarks/import_time.py --budget 0.1
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# needed by only some paths, e.g. pyarrow to write Parquet files
+OPTIONAL_DEPENDENCIES = ["pyarrow", "scipy", "matplotlib"]
+
+_TIME_IMPORT = """
+import sys, time
+{preload}
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(",".join(sorted(name for name in sys.modules if "." not in name)))
+"""
+
+
+def time_import(module: str, repeats: int, preload: str = "") -> tuple[float, set]:
+    """The best time to import a module in a fresh interpreter, after importing `preload`, and the top-level modules loaded"""
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                _TIME_IMPORT.format(
+                    module=module, preload=f"import {preload}" if preload else ""
+                ),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=REPO_DIR,
+        ).stdout.splitlines()
+        times.append(float(output[0]))
+    return min(times), set(output[1].split(","))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.1,
+        help="seconds allowed for the package on top of numpy and pandas",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    total, modules = time_import("icpmsprocess", args.repeats)
+    package, _ = time_import("icpmsprocess", args.repeats, preload="numpy, pandas")
+    optional = sorted(modules.intersection(OPTIONAL_DEPENDENCIES))
+    result = {
+        "import_seconds": round(total, 4),
+        "package_seconds": round(package, 4),
+        "budget_seconds": args.budget,
+        "optional_dependencies_imported": optional,
+    }
+    print(json.dumps(result, indent=2))
+
+    ok = result["package_seconds"] <= args.budget and not optional
+    if not ok:
+        print("Import time budget exceeded", file=sys.stderr)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
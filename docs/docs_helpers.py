@@ -7,11 +7,11 @@ from datetime import datetime, timedelta
 np.random.seed(42)
 
 
-def generate_file(file_name, num, is_std):
+def generate_file(file_name, num, is_std, n_cycles=60, n_extra_isotopes=0):
     time_start = datetime.now() - timedelta(days=2) + timedelta(seconds=80 * num)
     times = [
         (time_start + timedelta(seconds=1.12 * i)).strftime("%H:%M:%S:%f")[:-3]
-        for i in range(60)
+        for i in range(n_cycles)
     ]
     text = ["lorem", "ipsum", "dolor", "sit", "amet"]
     df_list = ["Neptune Analysis Data Report"]
@@ -19,23 +19,27 @@ def generate_file(file_name, num, is_std):
 
     data = pd.DataFrame(
         {
-            "Cycle": range(1, 61),
+            "Cycle": range(1, n_cycles + 1),
             "Time": times,
-            "202Hg": 7e-3 + (randn() - 0.5) * 1e-3 + (randn(60) - 0.5) * 1e-2,
-            "204Pb": 1.4 + (randn() - 0.5) * 0.005 + (randn(60) - 0.5) * 0.005,
-            "206Pb": 24 + (randn() - 0.5) * 0.08 + (randn(60) - 0.5) * 0.02,
-            "207Pb": 22 + (randn() - 0.5) * 0.00002 + (randn(60) - 0.5) * 0.02,
-            "208Pb": 52 + (randn() - 0.5) * 2 + (randn(60) - 0.5) * 0.1,
+            "202Hg": 7e-3 + (randn() - 0.5) * 1e-3 + (randn(n_cycles) - 0.5) * 1e-2,
+            "204Pb": 1.4 + (randn() - 0.5) * 0.005 + (randn(n_cycles) - 0.5) * 0.005,
+            "206Pb": 24 + (randn() - 0.5) * 0.08 + (randn(n_cycles) - 0.5) * 0.02,
+            "207Pb": 22 + (randn() - 0.5) * 0.00002 + (randn(n_cycles) - 0.5) * 0.02,
+            "208Pb": 52 + (randn() - 0.5) * 2 + (randn(n_cycles) - 0.5) * 0.1,
         }
     )
+    # other measured masses, which aren't part of the Pb-Pb system
+    for i in range(n_extra_isotopes):
+        data[f"{210 + i}X"] = 5 + (randn(n_cycles) - 0.5) * 0.1
 
-    data.iloc[0:29, 2:] *= 1e-6  # make the blank tiny
+    half = n_cycles // 2
+    data.iloc[0 : half - 1, 2:] *= 1e-6  # make the blank tiny
 
     # simulate a difference between the standard and the samples
     if not is_std:
-        data.iloc[30:, 4] += 2.7  # 206Pb
-        data.iloc[30:, 5] += 0.1  # 207Pb
-        data.iloc[30:, 6] += 4  # 208Pb
+        data.iloc[half:, 4] += 2.7  # 206Pb
+        data.iloc[half:, 5] += 0.1  # 207Pb
+        data.iloc[half:, 6] += 4  # 208Pb
 
     df_list = df_list + data.to_csv(index=False, sep="\t").split(os.linesep)
     df_list = df_list + ["*** Some more lines"] * 12 + [""] * 2
@@ -44,32 +48,52 @@ def generate_file(file_name, num, is_std):
         f.write("\n".join(df_list))
 
 
-def generate_run_data(run_len: int = 50) -> None:
-    """Generate example run data files"""
+def generate_run_data(
+    run_len: int = 50,
+    data_dir: str = "example-data",
+    n_cycles: int = 60,
+    n_extra_isotopes: int = 0,
+    standard_spacing: int = 10,
+) -> None:
+    """
+    Generate example run data files
+
+    The blank is the first half of the cycles and the signal the second half, so for processing use
+    `blank_cycles=n_cycles // 2 - 2` and `signal_cycles=(n_cycles // 2 + 1, n_cycles - 2)`. A standard
+    is measured every `standard_spacing` analyses, and a control every `2 * standard_spacing`.
+    """
     sample_map = []
     std_counter = 1
     ctrl_counter = 1
     smpl_counter = 1
+    width = max(3, len(str(run_len)))  # so file names sort in run order
 
-    os.makedirs("example-data", exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
 
     for i in range(1, run_len + 1):
-        file_name = f"S-{i:03d}.exp"
+        file_name = f"S-{i:0{width}d}.exp"
+        file_path = os.path.join(data_dir, file_name)
 
-        if i <= 2 or i > run_len - 2 or (i + 3) % 10 == 0:
-            sample_map.append([file_name, f"NIST610_{std_counter:03d}", "standard"])
+        if i <= 2 or i > run_len - 2 or (i + 3) % standard_spacing == 0:
+            sample_map.append(
+                [file_name, f"NIST610_{std_counter:0{width}d}", "standard"]
+            )
             std_counter += 1
-            generate_file(f"example-data/{file_name}", i, is_std=True)
-        elif (i + 4) % 20 == 0:
-            sample_map.append([file_name, f"NIST612_{ctrl_counter:03d}", "control"])
+            generate_file(file_path, i, True, n_cycles, n_extra_isotopes)
+        elif (i + 4) % (2 * standard_spacing) == 0:
+            sample_map.append(
+                [file_name, f"NIST612_{ctrl_counter:0{width}d}", "control"]
+            )
             ctrl_counter += 1
-            generate_file(f"example-data/{file_name}", i, is_std=True)
+            generate_file(file_path, i, True, n_cycles, n_extra_isotopes)
         else:
-            sample_map.append([file_name, f"my_smpl_{smpl_counter:03d}", "sample"])
+            sample_map.append(
+                [file_name, f"my_smpl_{smpl_counter:0{width}d}", "sample"]
+            )
             smpl_counter += 1
-            generate_file(f"example-data/{file_name}", i, is_std=False)
+            generate_file(file_path, i, False, n_cycles, n_extra_isotopes)
 
     sample_map_df = pd.DataFrame(
         sample_map, columns=["file_name", "sample_name", "type"]
     )
-    sample_map_df.to_csv("example-data/sample_map.csv", index=False)
+    sample_map_df.to_csv(os.path.join(data_dir, "sample_map.csv"), index=False)
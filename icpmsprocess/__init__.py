@@ -1,53 +1,462 @@
-import copy
-from typing import List
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
 import pandas as pd
 
+from icpmsprocess.export import ResultWriter
+from icpmsprocess.instrumentation import (
+    InstrumentationSink,
+    RecordingSink,
+    StageTimer,
+    WarningSink,
+)
 from icpmsprocess.mstypes import (
+    IsotopeSystem,
     ProcessingSettings,
     Sample,
     ReferenceMaterial,
+    RunStore,
+    SampleBatch,
 )
+from icpmsprocess.plan import ProcessingPlan, compile_plan
 from icpmsprocess.processors import (
     InternalCorrector,
     MassBiasCorrector,
     RatioCalculator,
 )
+from icpmsprocess.uncertainty import UNCERTAINTY_METHODS, monte_carlo_errors
+from icpmsprocess.utils import acquisition_times, check_storage_dtype, pack_samples
 
 
 class DataProcessor:
-    """Main processing orchestrator"""
+    """
+    Main processing orchestrator
+
+    Problems found while processing (e.g. all cycles of a sample below the intensity threshold) are
+    sent to `sink` as events; by default they are raised as warnings. A sink can also receive the time
+    spent in each processing stage and how many cycles of each sample were dropped and kept, e.g. a
+    `RecordingSink` for profiling or QC. Pass `InstrumentationSink()` to ignore everything.
+    """
 
     def __init__(
         self,
         settings: ProcessingSettings,
         correction_reference_material: ReferenceMaterial,
+        sink: InstrumentationSink | None = None,
     ):
+        if settings.uncertainty not in UNCERTAINTY_METHODS:
+            raise ValueError(
+                f"Unknown uncertainty method '{settings.uncertainty}', expected one of {UNCERTAINTY_METHODS}"
+            )
+        check_storage_dtype(settings.storage_dtype)
         self.settings = settings
-        self.internal_corrector = InternalCorrector(settings)
+        self.sink = sink if sink is not None else WarningSink()
+        self.internal_corrector = InternalCorrector(settings, self.sink)
         self.ratio_calculator = RatioCalculator()
-        self.mass_bias_corrector = MassBiasCorrector(correction_reference_material)
-
-    def process(self, samples: List[Sample]) -> pd.DataFrame:
-        processed_data = []
-        for sample in copy.deepcopy(samples):
-            sample = self.internal_corrector.correct(sample)
-            if sample.isotope_system.peak_strip is not None:
-                sample = self.ratio_calculator.strip_peaks(sample)
-            sample = self.ratio_calculator.reduce(sample)
-            processed_data.append(sample)
-
-        corrected_data = self.mass_bias_corrector.correct(processed_data)
-
-        # Convert the list of samples to a DataFrame
-        metadata = {
-            "name": [sample.name for sample in corrected_data],
-            "type": [sample.type for sample in corrected_data],
-        }
+        self.mass_bias_corrector = MassBiasCorrector(
+            correction_reference_material, settings.bracketing, self.sink
+        )
+
+    def process(self, samples: List[Sample] | RunStore) -> pd.DataFrame:
+        """
+        Process the run one sample at a time.
+
+        Each stage returns new samples rather than modifying its input, so the given samples are left
+        untouched without copying them, and only the reduced data of each sample is kept.
+        Monte Carlo uncertainties need the whole run at once, so use `process_batch` for them.
+        """
+        self._check_sem_uncertainty("process")
+        timer = StageTimer(self.sink)
+        plans: Dict[int, ProcessingPlan] = {}  # by isotope system, usually just one
+        # the ratios of all the systems, by name, in the order they are first seen
+        ratio_names: List[str] = []
+        reference_values: List[float] = []
+        # the results columns of each system's ratios
+        ratio_columns: Dict[int, np.ndarray] = {}
+        names, types = [], []
+        # preallocate the results, rather than keeping a Series per sample
+        means = np.full((len(samples), 0), np.nan)
+        errors = np.full_like(means, np.nan)
+        for i, sample in enumerate(samples):
+            key = id(sample.isotope_system)
+            plan = plans.get(key)
+            if plan is None:
+                plan = plans[key] = self.compile_plan(sample.isotope_system)
+                for name, value in zip(plan.ratio_names, plan.reference_values):
+                    if name not in ratio_names:
+                        ratio_names.append(name)
+                        reference_values.append(value)
+                ratio_columns[key] = np.array(
+                    [ratio_names.index(name) for name in plan.ratio_names], dtype=int
+                )
+                # a system with new ratios: NaN for them in the samples before
+                new_columns = len(ratio_names) - means.shape[1]
+                means = np.pad(
+                    means, ((0, 0), (0, new_columns)), constant_values=np.nan
+                )
+                errors = np.pad(
+                    errors, ((0, 0), (0, new_columns)), constant_values=np.nan
+                )
+
+            corrected = timer.time(
+                "internal_correction", self.internal_corrector.correct, sample, plan
+            )
+            if plan.strips_peaks:
+                corrected = timer.time(
+                    "peak_strip", self.ratio_calculator.strip_peaks, corrected, plan
+                )
+            means[i, ratio_columns[key]], errors[i, ratio_columns[key]] = timer.time(
+                "reduce", self.ratio_calculator.reduce_values, corrected, plan
+            )
+            names.append(sample.name)
+            types.append(sample.type)
+        if len(names) == 0:
+            raise ValueError("No samples to process")
+
+        is_standard = np.array([sample_type == "standard" for sample_type in types])
+        corrected_values = timer.time(
+            "mass_bias",
+            self.mass_bias_corrector.correct_arrays,
+            means,
+            is_standard,
+            ratio_names,
+            acquisition_times(samples),
+            names=names,
+            reference_values=np.array(reference_values, dtype=np.float64),
+        )
+        result = timer.time(
+            "assembly",
+            self.assemble_results,
+            names,
+            types,
+            is_standard,
+            corrected_values,
+            errors,
+            ratio_names,
+        )
+
+        timer.report()
+        return result
+
+    def process_batch(self, samples: List[Sample] | RunStore) -> pd.DataFrame:
+        """
+        Process the whole run at once as a (samples, cycles, isotopes) array.
+
+        Gives the same results as `process`, but avoids the per-sample overhead of pandas, so is much
+        faster for long runs. All samples must share the same isotope system. Given a RunStore, the
+        array is gathered straight from its block.
+        """
+        timer = StageTimer(self.sink)
+        batch = timer.time(
+            "pack",
+            pack_samples,
+            samples,
+            self.settings.intensity_metric,
+            storage_dtype=self.settings.storage_dtype,
+        )
+        plan = self.compile_plan(batch.isotope_system, batch.columns)
+        batch = timer.time(
+            "internal_correction", self.internal_corrector.correct_batch, batch, plan
+        )
+        result = self._reduce_batch(batch, plan, self.mass_bias_corrector, timer)
+
+        timer.report()
+        return result
+
+    def process_systems(
+        self,
+        samples: List[Sample] | RunStore,
+        systems: List[Tuple[IsotopeSystem, ReferenceMaterial]],
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Process the whole run for several isotope systems in one pass, e.g. Pb-Pb and another system
+        measured in the same session.
+
+        The run is packed, and the blank and signal windows and intensity limits applied, once for the
+        columns of all the systems. Outlier removal, blank subtraction, ratios and mass bias correction
+        are then done for each system on its own columns, with its own reference material, so each
+        table is the same as `process_batch` gives for that system alone. The samples must hold the
+        columns of every system: if loading only the columns needed for processing, pass the other
+        systems to `load_samples` as `extra_isotope_systems`.
+
+        Args:
+            samples (List[Sample] | RunStore): The samples of the run, in run order.
+            systems (List[Tuple[IsotopeSystem, ReferenceMaterial]]): Each isotope system to process, with the reference material to correct its mass bias.
+        Returns:
+            Dict[str, pd.DataFrame]: The results table of each system, by system name.
+        """
+        isotope_systems = [isotope_system for isotope_system, _ in systems]
+        plans = [
+            compile_plan(isotope_system, self.settings.intensity_metric, ref_mat)
+            for isotope_system, ref_mat in systems
+        ]
+        system_names = [isotope_system.name for isotope_system in isotope_systems]
+        if len(set(system_names)) != len(system_names):
+            raise ValueError("Isotope system names must be unique")
+
+        timer = StageTimer(self.sink)
+        batch = timer.time(
+            "pack",
+            pack_samples,
+            samples,
+            self.settings.intensity_metric,
+            isotope_systems,
+            self.settings.storage_dtype,
+        )
+        system_batches = timer.time(
+            "internal_correction",
+            self.internal_corrector.correct_batch_systems,
+            batch,
+            plans,
+        )
 
-        # Unpack reduced_data series into the DataFrame
-        reduced_data_df = pd.DataFrame(
-            [sample.reduced_data for sample in corrected_data]
+        results = {}
+        for system_batch, plan in zip(system_batches, plans):
+            mass_bias_corrector = MassBiasCorrector(
+                plan.reference_material, self.settings.bracketing, self.sink
+            )
+            results[plan.isotope_system.name] = self._reduce_batch(
+                system_batch, plan, mass_bias_corrector, timer
+            )
+
+        timer.report()
+        return results
+
+    def process_to(
+        self,
+        samples: List[Sample] | RunStore,
+        writer: ResultWriter,
+        chunk_size: int = 1000,
+    ) -> int:
+        """
+        Process the whole run in chunks, writing the corrected unknowns of each chunk as soon as it is done.
+
+        Chunks are about `chunk_size` samples and end at a standard, which also brackets the start of
+        the next chunk, so the results are the same as `process_batch` gives, plus a `cycles_used`
+        column (the signal cycles retained for each unknown). Only one chunk is processed at a time,
+        and given a RunStore, e.g. an opened session file, only one chunk of its data is read at a time.
+        As for `process_batch`, all samples must share the same isotope system.
+
+        Args:
+            samples (List[Sample] | RunStore): The samples of the run, in run order.
+            writer (ResultWriter): Where to write the results, e.g. from `icpmsprocess.export.open_writer`.
+            chunk_size (int, optional): The number of samples to process at a time. Defaults to 1000.
+        Returns:
+            int: The number of results written.
+        """
+        self._check_sem_uncertainty("process_to")
+        if isinstance(samples, RunStore):
+            types = [info.type for info in samples.info]
+        else:
+            types = [sample.type for sample in samples]
+            # checked up front, as pack_samples only sees one chunk at a time
+            if any(
+                sample.isotope_system != samples[0].isotope_system for sample in samples
+            ):
+                raise ValueError(
+                    "All samples in a run must share the same isotope system"
+                )
+        is_standard = np.array([sample_type == "standard" for sample_type in types])
+        if not is_standard.any():
+            raise ValueError("No standards found in dataset")
+
+        timer = StageTimer(self.sink)
+        n_written = 0
+        # the name, mean ratios and acquisition time of the standard ending the last chunk
+        prev_standard = None
+        for start, stop in _chunk_bounds(is_standard, chunk_size):
+            batch = timer.time(
+                "pack",
+                pack_samples,
+                samples[start:stop],
+                self.settings.intensity_metric,
+                storage_dtype=self.settings.storage_dtype,
+            )
+            plan = self.compile_plan(batch.isotope_system, batch.columns)
+            batch = timer.time(
+                "internal_correction",
+                self.internal_corrector.correct_batch,
+                batch,
+                plan,
+            )
+            if plan.strips_peaks:
+                batch = timer.time(
+                    "peak_strip", self.ratio_calculator.strip_peaks_batch, batch, plan
+                )
+            means, errors = timer.time(
+                "reduce", self.ratio_calculator.reduce_batch_values, batch, plan
+            )
+
+            chunk_is_standard = is_standard[start:stop]
+            bracket_names, bracket_means = batch.names, means
+            bracket_is_standard = chunk_is_standard
+            bracket_times = batch.acquisition_times
+            if prev_standard is not None:
+                bracket_names = [prev_standard[0]] + batch.names
+                bracket_means = np.vstack([prev_standard[1], means])
+                bracket_is_standard = np.concatenate([[True], chunk_is_standard])
+                if bracket_times is not None and prev_standard[2] is not None:
+                    bracket_times = np.concatenate([[prev_standard[2]], bracket_times])
+                else:
+                    bracket_times = None
+            corrected_values = timer.time(
+                "mass_bias",
+                self.mass_bias_corrector.correct_arrays,
+                bracket_means,
+                bracket_is_standard,
+                list(plan.ratio_names),
+                bracket_times,
+                names=bracket_names,
+                reference_values=plan.reference_values,
+            )
+            result = timer.time(
+                "assembly",
+                self.assemble_results,
+                batch.names,
+                batch.types,
+                chunk_is_standard,
+                corrected_values,
+                errors,
+                plan.ratio_names,
+                batch.cycle_mask.sum(axis=1),
+            )
+            if len(result) > 0:
+                timer.time("write", writer.write, result)
+                n_written += len(result)
+
+            standard_indices = np.flatnonzero(chunk_is_standard)
+            if len(standard_indices) > 0:
+                last = standard_indices[-1]
+                prev_standard = (
+                    batch.names[last],
+                    means[last],
+                    (
+                        None
+                        if batch.acquisition_times is None
+                        else batch.acquisition_times[last]
+                    ),
+                )
+
+        timer.report()
+        return n_written
+
+    def compile_plan(
+        self, isotope_system: IsotopeSystem, columns: List[str] | None = None
+    ) -> ProcessingPlan:
+        """Compile the processing plan of an isotope system with this processor's settings and reference material (cached, see `compile_plan`)"""
+        return compile_plan(
+            isotope_system,
+            self.settings.intensity_metric,
+            self.mass_bias_corrector.ref_mat,
+            columns,
         )
-        result_df = pd.DataFrame(metadata).join(reduced_data_df)
 
-        return result_df
+    def _reduce_batch(
+        self,
+        batch: SampleBatch,
+        plan: ProcessingPlan,
+        mass_bias_corrector: MassBiasCorrector,
+        timer: StageTimer,
+    ) -> pd.DataFrame:
+        """Peak strip, reduce and mass bias correct a blank-corrected batch, and build its results table"""
+        if plan.strips_peaks:
+            batch = timer.time(
+                "peak_strip", self.ratio_calculator.strip_peaks_batch, batch, plan
+            )
+        means, errors = timer.time(
+            "reduce", self.ratio_calculator.reduce_batch_values, batch, plan
+        )
+
+        is_standard = np.array(
+            [sample_type == "standard" for sample_type in batch.types]
+        )
+        corrected_values = timer.time(
+            "mass_bias",
+            mass_bias_corrector.correct_arrays,
+            means,
+            is_standard,
+            list(plan.ratio_names),
+            batch.acquisition_times,
+            names=batch.names,
+            reference_values=plan.reference_values,
+        )
+        if self.settings.uncertainty == "monte_carlo":
+            errors = errors.copy()
+            errors[~is_standard] = timer.time(
+                "uncertainty",
+                monte_carlo_errors,
+                self.ratio_calculator.ratios_batch(batch, plan),
+                batch.cycle_mask,
+                mass_bias_corrector.bracket(is_standard, batch.acquisition_times),
+                mass_bias_corrector,
+                plan.reference_values,
+                plan.reference_uncertainties,
+                self.settings.uncertainty_draws,
+                self.settings.random_seed,
+            )
+        return timer.time(
+            "assembly",
+            self.assemble_results,
+            batch.names,
+            batch.types,
+            is_standard,
+            corrected_values,
+            errors,
+            plan.ratio_names,
+        )
+
+    def _check_sem_uncertainty(self, method: str) -> None:
+        """Monte Carlo uncertainties are only calculated over a whole run"""
+        if self.settings.uncertainty != "sem":
+            raise ValueError(
+                f"{method} only gives 'sem' uncertainties, use process_batch for '{self.settings.uncertainty}'"
+            )
+
+    def assemble_results(
+        self,
+        names: Sequence[str],
+        types: Sequence[str],
+        is_standard: np.ndarray,
+        corrected_values: np.ndarray,
+        errors: np.ndarray,
+        ratio_names: Sequence[str],
+        cycles_used: np.ndarray | None = None,
+    ) -> pd.DataFrame:
+        """
+        Build the results DataFrame of the unknowns in a run, column by column, as the process methods return it.
+
+        Args:
+            names (Sequence[str]): The name of each measurement, in run order.
+            types (Sequence[str]): The type of each measurement.
+            is_standard (np.ndarray): Whether each measurement is a standard, shape (measurements,).
+            corrected_values (np.ndarray): The mass bias corrected ratios of the unknowns, shape (unknowns, ratios).
+            errors (np.ndarray): The errors of every measurement's ratios, shape (measurements, ratios).
+            ratio_names (Sequence[str]): The names of the ratios, in the order of the columns.
+            cycles_used (np.ndarray, optional): The number of signal cycles used for each measurement, added as a column if given.
+        Returns:
+            pd.DataFrame: A row for each unknown, with its name, type, and each ratio and its error.
+        """
+        is_unknown = ~is_standard
+        columns = {
+            "name": np.array(names, dtype=object)[is_unknown],
+            "type": np.array(types, dtype=object)[is_unknown],
+        }
+        unknown_errors = errors[is_unknown]
+        for i, name in enumerate(ratio_names):
+            columns[name] = corrected_values[:, i]
+            columns[f"{name}_err"] = unknown_errors[:, i]
+        if cycles_used is not None:
+            columns["cycles_used"] = cycles_used[is_unknown]
+        return pd.DataFrame(columns)
+
+
+def _chunk_bounds(is_standard: np.ndarray, chunk_size: int) -> List[Tuple[int, int]]:
+    """Split a run into chunks of at least `chunk_size` measurements, each ending at a standard (bar the last)"""
+    standard_indices = np.flatnonzero(is_standard)
+    bounds = []
+    start = 0
+    while start < len(is_standard):
+        later = standard_indices[standard_indices >= start + max(chunk_size, 1) - 1]
+        stop = int(later[0]) + 1 if len(later) > 0 else len(is_standard)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
@@ -0,0 +1,5 @@
+import sys
+
+from icpmsprocess.cli import main
+
+sys.exit(main())
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed data files, so re-running a notebook doesn't parse every text file again.
+
+    Each parsed file is stored as an uncompressed `.npz` file with one array per column, which is a
+    fast binary read and can't run code when loaded (unlike pickles), so the cache directory can be
+    shared between users of a lab workstation.
+
+    Entries are keyed by the data file's path, size and modification time (or, if `hash_content` is
+    set, a hash of its content) and the parameters it was parsed with. When the cache grows past
+    `max_bytes`, the least recently used entries are evicted.
+
+    Attributes:
+        cache_dir (str): The directory to store cache entries in. Created if it doesn't exist.
+        max_bytes (int): The size limit of the cache directory. Defaults to 1 GiB.
+        hash_content (bool): Key entries by a hash of the file content rather than its size and
+            modification time. Slower, but robust to copies which don't keep modification times.
+    """
+
+    def __init__(
+        self, cache_dir: str, max_bytes: int = 2**30, hash_content: bool = False
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = self.size()
+
+    def get(self, filepath: str, parse_params: Dict[str, Any]) -> pd.DataFrame | None:
+        """Get the cached parsed data for a file, or None if there is no valid entry"""
+        entry_path = self._entry_path(filepath, parse_params)
+        try:
+            with np.load(entry_path, allow_pickle=False) as entry:
+                columns = entry["columns"].tolist()
+                index_name = (
+                    entry["index_name"].item() if "index_name" in entry else None
+                )
+                data = pd.DataFrame(
+                    {col: entry[f"column_{i}"] for i, col in enumerate(columns)},
+                    index=pd.Index(entry["index"], name=index_name),
+                )
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            return None
+
+        try:
+            os.utime(entry_path)  # mark as recently used
+        except OSError:
+            pass
+        return data
+
+    def put(
+        self, filepath: str, parse_params: Dict[str, Any], data: pd.DataFrame
+    ) -> None:
+        """Store the parsed data for a file. Data with missing text values is not cached."""
+        arrays = {
+            "columns": np.array([str(col) for col in data.columns]),
+            "index": data.index.to_numpy(),
+        }
+        if data.index.name is not None:
+            arrays["index_name"] = np.array(str(data.index.name))
+        for i, col in enumerate(data.columns):
+            values = data[col].to_numpy()
+            if values.dtype == object:
+                if data[col].isna().any():
+                    return  # can't round-trip missing values through a text array
+                values = values.astype(str)
+            arrays[f"column_{i}"] = values
+
+        entry_path = self._entry_path(filepath, parse_params)
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            np.savez(f, **arrays)
+        os.replace(f.name, entry_path)  # atomic, so readers never see a partial entry
+
+        self._size += os.path.getsize(entry_path)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def invalidate(self, filepath: str) -> int:
+        """Remove all entries for a data file, whatever parameters it was parsed with. Returns the number removed."""
+        prefix = self._path_key(filepath) + "-"
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith(".npz"):
+                removed += self._remove(entry.path)
+        self._size = self.size()
+        return removed
+
+    def clear(self) -> int:
+        """Remove all entries. Returns the number removed."""
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                removed += self._remove(entry.path)
+        self._size = 0
+        return removed
+
+    def size(self) -> int:
+        """The total size of all entries, in bytes"""
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    pass  # removed by another process
+        return total
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is back under its size limit"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._size <= self.max_bytes:
+                break
+            if self._remove(path):
+                self._size -= size
+
+    def _remove(self, path: str) -> int:
+        """Remove an entry file, tolerating it having been removed already"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return 1
+
+    def _entry_path(self, filepath: str, parse_params: Dict[str, Any]) -> str:
+        """Get the path of the cache entry for a file parsed with the given parameters"""
+        if self.hash_content:
+            with open(filepath, "rb") as f:
+                version = hashlib.sha256(f.read()).hexdigest()
+        else:
+            stat = os.stat(filepath)
+            version = f"{stat.st_size}:{stat.st_mtime_ns}"
+
+        params = json.dumps(parse_params, sort_keys=True, default=str)
+        entry_key = hashlib.sha256(f"{version}|{params}".encode()).hexdigest()[:32]
+        return os.path.join(
+            self.cache_dir, f"{self._path_key(filepath)}-{entry_key}.npz"
+        )
+
+    def _path_key(self, filepath: str) -> str:
+        """Get the part of the entry file name identifying the data file"""
+        return hashlib.sha256(os.path.abspath(filepath).encode()).hexdigest()[:32]
@@ -0,0 +1,166 @@
+"""
+The `icpmsprocess` command line, run with `python -m icpmsprocess`:
+
+    python -m icpmsprocess process settings.json data/ data/sample_map.csv -o results.csv
+    python -m icpmsprocess validate settings.json data/ data/sample_map.csv
+    python -m icpmsprocess convert settings.json data/ data/sample_map.csv session.icpms
+
+The settings file is the JSON description of a session used by `icpmsprocess.jobs.load_jobs`, without
+the data paths: "isotope_system" and "reference_material" (names defined in `icpmsprocess.lib`),
+"settings" (the fields of ProcessingSettings), and optionally "load_options". The data is either a
+directory of data files, with its sample map, or a session file written by `convert`.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+from icpmsprocess import DataProcessor, RecordingSink
+from icpmsprocess.export import open_writer
+from icpmsprocess.jobs import parse_config
+from icpmsprocess.utils import load_run_store, load_samples
+from icpmsprocess.validate import SessionReport, check_bracketing, validate_session
+
+# the load options which say where to find the columns of the data files
+_HEADER_OPTIONS = ("file_ext", "header_row", "comment_char", "index_col")
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="icpmsprocess",
+        description="Process raw ICP-MS data into corrected isotope ratios.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process = commands.add_parser("process", help="process a session")
+    _add_session_arguments(process)
+    process.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="results file: .csv, or .parquet or .arrow (needs pyarrow)",
+    )
+    process.set_defaults(run=_process)
+
+    validate = commands.add_parser(
+        "validate", help="check a session can be processed, without processing it"
+    )
+    _add_session_arguments(validate)
+    validate.set_defaults(run=_validate)
+
+    convert = commands.add_parser(
+        "convert", help="pack a directory of data files into a session file"
+    )
+    _add_session_arguments(convert)
+    convert.add_argument("session", help="session file to write")
+    convert.set_defaults(run=_convert)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.run(args)
+    except (OSError, ImportError, ValueError, KeyError) as e:
+        print(f"icpmsprocess {args.command}: {e}", file=sys.stderr)
+        return 1
+
+
+def _add_session_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("settings", help="JSON settings file")
+    parser.add_argument("data", help="directory of data files, or a session file")
+    parser.add_argument(
+        "sample_map", nargs="?", help="sample map CSV (for a directory of data files)"
+    )
+
+
+def _process(args: argparse.Namespace) -> int:
+    start = time.perf_counter()
+    config = _read_config(args.settings)
+    samples = _load(args, config)
+    sink = RecordingSink()
+    processor = DataProcessor(
+        config["settings"], config["correction_reference_material"], sink
+    )
+    with open_writer(args.output) as writer:
+        if config["settings"].uncertainty == "sem":
+            n_results = processor.process_to(samples, writer)
+        else:
+            # Monte Carlo uncertainties need the whole run at once
+            results = processor.process_batch(samples)
+            writer.write(results)
+            n_results = len(results)
+
+    for event in sink.events:
+        print(f"warning: {event.message}", file=sys.stderr)
+    print(
+        f"{n_results} results in {time.perf_counter() - start:.1f} s -> {args.output}"
+    )
+    return 0
+
+
+def _validate(args: argparse.Namespace) -> int:
+    config = _read_config(args.settings)
+    # checks the settings
+    DataProcessor(config["settings"], config["correction_reference_material"])
+
+    if os.path.isfile(args.data):
+        from icpmsprocess.session import open_session
+
+        store = open_session(args.data)
+        report = SessionReport(
+            files=[args.data],
+            names=[info.name for info in store.info],
+            types=[info.type for info in store.info],
+        )
+        report.problems.extend(check_bracketing(report.names, report.types))
+    else:
+        if args.sample_map is None:
+            raise ValueError(
+                "a sample map is needed to validate a directory of data files"
+            )
+        load_options = config["load_options"]
+        report = validate_session(
+            args.data,
+            args.sample_map,
+            config["isotope_system"],
+            config["settings"].intensity_metric,
+            **{
+                key: load_options[key] for key in _HEADER_OPTIONS if key in load_options
+            },
+        )
+
+    counts = report.type_counts()
+    print(", ".join(f"{n} {sample_type}" for sample_type, n in counts.items()))
+    for problem in report.problems:
+        print(f"problem: {problem}", file=sys.stderr)
+    return 0 if report.ok else 1
+
+
+def _convert(args: argparse.Namespace) -> int:
+    from icpmsprocess.session import save_session
+
+    config = _read_config(args.settings)
+    store = _load(args, config, as_store=True)
+    save_session(store, args.session)
+    print(f"{len(store)} samples -> {args.session}")
+    return 0
+
+
+def _read_config(settings_path: str) -> dict:
+    with open(settings_path) as f:
+        return parse_config(json.load(f))
+
+
+def _load(args: argparse.Namespace, config: dict, as_store: bool = False):
+    """Load the samples of a session, from a directory of data files or a session file"""
+    if os.path.isfile(args.data):
+        from icpmsprocess.session import open_session
+
+        return open_session(args.data)
+    if args.sample_map is None:
+        raise ValueError("a sample map is needed to load a directory of data files")
+    load = load_run_store if as_store else load_samples
+    return load(
+        args.data, args.sample_map, config["isotope_system"], **config["load_options"]
+    )
@@ -0,0 +1,132 @@
+import os
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+
+class ResultWriter(ABC):
+    """
+    Streams results tables to a file, one chunk at a time, so large outputs never need to be held in
+    memory at once. Every chunk must have the same columns. Use as a context manager, or call `close`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_written = 0
+
+    def write(self, results: pd.DataFrame) -> None:
+        """Append a chunk of results"""
+        self._write(results)
+        self.rows_written += len(results)
+
+    def close(self) -> None:
+        """Finish the file"""
+
+    @abstractmethod
+    def _write(self, results: pd.DataFrame) -> None:
+        """Write a chunk of results to the file"""
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CSVWriter(ResultWriter):
+    """Writes results to a CSV file, with the header before the first chunk"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, "w", newline="")
+        self._header_written = False
+
+    def _write(self, results: pd.DataFrame) -> None:
+        results.to_csv(self._file, index=False, header=not self._header_written)
+        self._header_written = True
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter(ResultWriter):
+    """Writes results to a Parquet file, one row group per chunk. Needs pyarrow."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._pa = _import_pyarrow("Parquet")
+        import pyarrow.parquet
+
+        self._parquet = pyarrow.parquet
+        self._writer = None
+
+    def _write(self, results: pd.DataFrame) -> None:
+        table = self._pa.Table.from_pandas(results, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class ArrowWriter(ResultWriter):
+    """Writes results to an Arrow IPC (Feather v2) file, one record batch per chunk. Needs pyarrow."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._pa = _import_pyarrow("Arrow")
+        self._sink = None
+        self._writer = None
+
+    def _write(self, results: pd.DataFrame) -> None:
+        table = self._pa.Table.from_pandas(results, preserve_index=False)
+        if self._writer is None:
+            self._sink = self._pa.OSFile(self.path, "wb")
+            self._writer = self._pa.ipc.new_file(self._sink, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+
+
+WRITERS = {
+    ".csv": CSVWriter,
+    ".parquet": ParquetWriter,
+    ".pq": ParquetWriter,
+    ".arrow": ArrowWriter,
+    ".feather": ArrowWriter,
+    ".ipc": ArrowWriter,
+}
+
+
+def open_writer(path: str) -> ResultWriter:
+    """
+    Open a ResultWriter for a file, choosing the format from its extension.
+
+    Parameters:
+    - path (str): The file to write: ".csv", ".parquet" (or ".pq"), or ".arrow" (or ".feather", ".ipc").
+    Returns:
+    - ResultWriter: The writer.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(
+            f"Can't tell the format to write from '{path}', expected one of {sorted(WRITERS)}"
+        )
+    return WRITERS[extension](path)
+
+
+def _import_pyarrow(file_format: str):
+    """Import pyarrow, which is only needed for Parquet and Arrow output"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError as e:
+        raise ImportError(
+            f"Writing {file_format} files needs pyarrow: pip install pyarrow"
+        ) from e
+    return pyarrow
@@ -0,0 +1,178 @@
+import time
+import warnings
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+class EventKind(Enum):
+    """The kinds of problem reported while processing"""
+
+    ALL_ABOVE_THRESHOLD = "all cycles above threshold"
+    ALL_BELOW_THRESHOLD = "all cycles below threshold"
+    NO_CYCLES_LEFT = "no cycles left after outlier removal"
+    FEW_CYCLES_LEFT = "few cycles left after outlier removal"
+    AFTER_LAST_STANDARD = "sample after last standard"
+    NOT_IN_SAMPLE_MAP = "data file not in the sample map"
+    LOAD_FAILED = "data file could not be loaded"
+
+
+@dataclass
+class ProcessingEvent:
+    """
+    A problem found while processing.
+
+    Attributes:
+        kind (EventKind): What kind of problem it is.
+        sample (str | None): The name of the sample concerned, if known.
+        window (str): The part of the sample concerned ("blank" or "signal"), if any.
+        message (str): A human readable description.
+    """
+
+    kind: EventKind
+    sample: str | None
+    window: str
+    message: str
+
+
+@dataclass
+class CycleRetention:
+    """
+    How many cycles of a window of each sample were dropped and kept.
+
+    Attributes:
+        window (str): The window the counts are for ("blank" or "signal").
+        names (List[str]): The sample names.
+        threshold_dropped (np.ndarray): Cycles dropped by the intensity threshold.
+        outlier_dropped (np.ndarray): Cycles dropped as outliers.
+        kept (np.ndarray): Cycles kept.
+    """
+
+    window: str
+    names: List[str]
+    threshold_dropped: np.ndarray
+    outlier_dropped: np.ndarray
+    kept: np.ndarray
+
+
+class InstrumentationSink:
+    """
+    Receives stage timings, cycle retention counts and events from processing.
+
+    This base class ignores everything, so passing an instance of it silences processing. Subclass it
+    and override the methods you need; timings and retention counts are only collected if a subclass
+    overrides the method receiving them, so the default costs nothing.
+    """
+
+    def stage_timing(self, stage: str, seconds: float) -> None:
+        """Called with the total time spent in each processing stage"""
+
+    def cycle_retention(self, retention: CycleRetention) -> None:
+        """Called with the cycles dropped and kept from each window of each sample"""
+
+    def event(self, event: ProcessingEvent) -> None:
+        """Called for each problem found while processing"""
+
+    @property
+    def wants_timings(self) -> bool:
+        return type(self).stage_timing is not InstrumentationSink.stage_timing
+
+    @property
+    def wants_retention(self) -> bool:
+        return type(self).cycle_retention is not InstrumentationSink.cycle_retention
+
+
+class StageTimer:
+    """Adds up the time spent in each processing stage and reports the totals to a sink, if it wants them"""
+
+    def __init__(self, sink: InstrumentationSink):
+        self.sink = sink
+        self.enabled = sink.wants_timings
+        self.timings: Dict[str, float] = {}
+
+    def time(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """Call `func`, adding its run time to the stage's total"""
+        if not self.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.timings[stage] = self.timings.get(stage, 0.0) + (
+            time.perf_counter() - start
+        )
+        return result
+
+    def report(self) -> None:
+        """Send the stage totals to the sink"""
+        for stage, seconds in self.timings.items():
+            self.sink.stage_timing(stage, seconds)
+
+
+class WarningSink(InstrumentationSink):
+    """The default sink: turns events into warnings, and ignores timings and retention counts"""
+
+    def event(self, event: ProcessingEvent) -> None:
+        warnings.warn(event.message)
+
+
+class RecordingSink(InstrumentationSink):
+    """Records everything it receives, e.g. for profiling or QC dashboards"""
+
+    def __init__(self):
+        self.timings: List[tuple[str, float]] = []
+        self.retention: List[CycleRetention] = []
+        self.events: List[ProcessingEvent] = []
+
+    def stage_timing(self, stage: str, seconds: float) -> None:
+        self.timings.append((stage, seconds))
+
+    def cycle_retention(self, retention: CycleRetention) -> None:
+        self.retention.append(retention)
+
+    def event(self, event: ProcessingEvent) -> None:
+        self.events.append(event)
+
+    def timings_frame(self) -> pd.DataFrame:
+        """The stage timings, one row per stage per run"""
+        return pd.DataFrame(self.timings, columns=["stage", "seconds"])
+
+    def retention_frame(self) -> pd.DataFrame:
+        """The cycle retention counts, one row per sample per window"""
+        if len(self.retention) == 0:
+            return pd.DataFrame(
+                columns=[
+                    "name",
+                    "window",
+                    "threshold_dropped",
+                    "outlier_dropped",
+                    "kept",
+                ]
+            )
+        return pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "name": r.names,
+                        "window": r.window,
+                        "threshold_dropped": r.threshold_dropped,
+                        "outlier_dropped": r.outlier_dropped,
+                        "kept": r.kept,
+                    }
+                )
+                for r in self.retention
+            ],
+            ignore_index=True,
+        )
+
+    def events_frame(self) -> pd.DataFrame:
+        """The events, one row each"""
+        return pd.DataFrame(
+            {
+                "kind": [e.kind.value for e in self.events],
+                "sample": [e.sample for e in self.events],
+                "window": [e.window for e in self.events],
+                "message": [e.message for e in self.events],
+            }
+        )
@@ -0,0 +1,284 @@
+"""
+Process many archived sessions in parallel, e.g. for overnight reprocessing.
+
+Each session is loaded and processed in its own worker process, and its results are written out as
+soon as it finishes. A session that fails is reported, not raised, so one bad session doesn't abort
+the rest, even if it crashes its worker process. From the command line, with the sessions described in a JSON file:
+
+    python -m icpmsprocess.jobs sessions.json results/ --workers 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from icpmsprocess import DataProcessor, RecordingSink
+from icpmsprocess import lib
+from icpmsprocess.mstypes import IsotopeSystem, ProcessingSettings, ReferenceMaterial
+from icpmsprocess.utils import load_samples
+
+
+@dataclass
+class SessionJob:
+    """
+    A session to process.
+
+    Attributes:
+        data_dir (str): The directory containing the session's data files.
+        sample_map_path (str): The path to the session's sample map CSV.
+        isotope_system (IsotopeSystem): The isotope system to be used for the samples.
+        settings (ProcessingSettings): The processing settings.
+        correction_reference_material (ReferenceMaterial): The reference material used as the standard.
+        name (str, optional): Names the results file. Defaults to the name of `data_dir`.
+        load_options (dict, optional): Passed on to `load_samples`, e.g. `{"file_ext": ".csv"}`.
+    """
+
+    data_dir: str
+    sample_map_path: str
+    isotope_system: IsotopeSystem
+    settings: ProcessingSettings
+    correction_reference_material: ReferenceMaterial
+    name: str = ""
+    load_options: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.name:
+            self.name = os.path.basename(os.path.normpath(self.data_dir))
+
+
+@dataclass
+class SessionResult:
+    """
+    The outcome of processing a session.
+
+    Attributes:
+        name (str): The session name.
+        output_path (str | None): The results file, or None if the session failed.
+        n_results (int): The number of processed unknowns.
+        seconds (float): The time taken to load and process the session.
+        warnings (List[str]): The messages of events raised while processing.
+        error (str | None): The traceback if the session failed, otherwise None.
+    """
+
+    name: str
+    output_path: str | None
+    n_results: int = 0
+    seconds: float = 0.0
+    warnings: List[str] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def process_sessions(
+    jobs: List[SessionJob],
+    output_dir: str,
+    workers: int | None = None,
+    callback: Callable[[SessionResult], None] | None = None,
+) -> List[SessionResult]:
+    """
+    Process sessions in a pool of worker processes, writing each one's results to a CSV file.
+
+    Each session is processed with `DataProcessor.process_batch` in a process of its own, with up to
+    `workers` running at once, so the batch scales with the number of workers as long as there are
+    more sessions than workers. Results are written to `<output_dir>/<job name>.csv` as soon as each
+    session finishes. A failed session (a bad sample map, a corrupt file, or a worker process that
+    dies, e.g. out of memory) gives a result with `error` set, and the other sessions carry on.
+
+    Parameters:
+    - jobs (List[SessionJob]): The sessions to process.
+    - output_dir (str): The directory to write the results files to. Created if missing.
+    - workers (int, optional): The number of worker processes. Defaults to the number of CPUs; 1 processes the sessions in this process.
+    - callback (Callable[[SessionResult], None], optional): Called with each result as its session finishes.
+    Returns:
+    - List[SessionResult]: The result of each session, in the order of `jobs`.
+    """
+    names = [job.name for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Session names must be unique, got duplicates: {duplicates}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    results: List[SessionResult | None] = [None] * len(jobs)
+
+    def finish(i: int, result: SessionResult) -> None:
+        results[i] = result
+        if callback is not None:
+            callback(result)
+
+    if workers == 1:
+        for i, job in enumerate(jobs):
+            finish(i, _process_session(job, output_dir))
+        return results
+
+    # a process per session rather than a pool, where one worker dying breaks every pending session
+    context = multiprocessing.get_context()
+    waiting = list(enumerate(jobs))
+    # the connection each running session's result arrives on -> (job index, process)
+    running = {}
+    try:
+        while waiting or running:
+            while waiting and len(running) < workers:
+                i, job = waiting.pop(0)
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_session_worker, args=(job, output_dir, sender)
+                )
+                process.start()
+                sender.close()
+                running[receiver] = (i, process)
+
+            for receiver in multiprocessing.connection.wait(list(running)):
+                i, process = running.pop(receiver)
+                try:
+                    result = receiver.recv()
+                except EOFError:  # the worker died without sending a result
+                    process.join()
+                    result = SessionResult(
+                        jobs[i].name,
+                        None,
+                        error=f"The worker process died (exit code {process.exitcode})",
+                    )
+                receiver.close()
+                process.join()
+                finish(i, result)
+    finally:
+        for receiver, (_, process) in running.items():
+            process.terminate()
+            receiver.close()
+    return results
+
+
+def load_jobs(jobs_path: str) -> List[SessionJob]:
+    """
+    Read sessions to process from a JSON file.
+
+    The file holds a list of sessions, each with "data_dir", "sample_map", "isotope_system" and
+    "reference_material" (names defined in `icpmsprocess.lib`, e.g. "Pb_Pb" and "NIST610"), and
+    "settings" (the fields of ProcessingSettings). Each may also have "name" and "load_options". Paths
+    are relative to the JSON file.
+    """
+    base_dir = os.path.dirname(os.path.abspath(jobs_path))
+    with open(jobs_path) as f:
+        entries = json.load(f)
+
+    return [
+        SessionJob(
+            data_dir=os.path.join(base_dir, entry["data_dir"]),
+            sample_map_path=os.path.join(base_dir, entry["sample_map"]),
+            name=entry.get("name", ""),
+            **parse_config(entry),
+        )
+        for entry in entries
+    ]
+
+
+def parse_config(entry: dict) -> dict:
+    """
+    Read the processing configuration of a session from its JSON description (see `load_jobs`).
+
+    Returns the "isotope_system", "settings", "correction_reference_material" and "load_options"
+    arguments of a SessionJob.
+    """
+    settings = dict(entry["settings"])
+    settings["signal_cycles"] = tuple(settings["signal_cycles"])
+    return {
+        "isotope_system": _from_lib(entry["isotope_system"], IsotopeSystem),
+        "settings": ProcessingSettings(**settings),
+        "correction_reference_material": _from_lib(
+            entry["reference_material"], ReferenceMaterial
+        ),
+        "load_options": entry.get("load_options", {}),
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Process many sessions in parallel, writing a results CSV for each."
+    )
+    parser.add_argument("jobs", help="JSON file describing the sessions")
+    parser.add_argument("output_dir", help="directory to write results to")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPUs)")
+    args = parser.parse_args(argv)
+
+    def report(result: SessionResult) -> None:
+        if result.ok:
+            print(
+                f"{result.name}: {result.n_results} results in {result.seconds:.1f} s"
+                f" -> {result.output_path}"
+            )
+        else:
+            print(f"{result.name}: FAILED\n{result.error}", file=sys.stderr)
+
+    results = process_sessions(
+        load_jobs(args.jobs), args.output_dir, args.workers, callback=report
+    )
+    n_failed = sum(not result.ok for result in results)
+    print(f"{len(results) - n_failed} sessions processed, {n_failed} failed")
+    return 1 if n_failed else 0
+
+
+def _session_worker(
+    job: SessionJob, output_dir: str, connection: multiprocessing.connection.Connection
+) -> None:
+    """Process one session in a worker process, sending its result back to the parent"""
+    connection.send(_process_session(job, output_dir))
+    connection.close()
+
+
+def _process_session(job: SessionJob, output_dir: str) -> SessionResult:
+    """Load, process and write out one session, capturing any failure"""
+    start = time.perf_counter()
+    try:
+        samples = load_samples(
+            job.data_dir, job.sample_map_path, job.isotope_system, **job.load_options
+        )
+        sink = RecordingSink()
+        results = DataProcessor(
+            job.settings, job.correction_reference_material, sink
+        ).process_batch(samples)
+
+        output_path = os.path.join(output_dir, f"{job.name}.csv")
+        # write then rename, so a results file is never left half written
+        partial_path = output_path + ".partial"
+        results.to_csv(partial_path, index=False)
+        os.replace(partial_path, output_path)
+    except Exception:
+        return SessionResult(
+            job.name,
+            None,
+            seconds=time.perf_counter() - start,
+            error=traceback.format_exc(),
+        )
+
+    return SessionResult(
+        job.name,
+        output_path,
+        n_results=len(results),
+        seconds=time.perf_counter() - start,
+        warnings=[event.message for event in sink.events],
+    )
+
+
+def _from_lib(name: str, expected_type: type):
+    """Look up an isotope system or reference material defined in `icpmsprocess.lib` by name"""
+    value = getattr(lib, name, None)
+    if not isinstance(value, expected_type):
+        raise ValueError(
+            f"'{name}' is not a {expected_type.__name__} defined in icpmsprocess.lib"
+        )
+    return value
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+import glob
+import os
+import time
+from typing import Iterator, List
+
+import pandas as pd
+
+from icpmsprocess.instrumentation import (
+    EventKind,
+    InstrumentationSink,
+    ProcessingEvent,
+    WarningSink,
+)
+from icpmsprocess.mstypes import (
+    IsotopeSystem,
+    ProcessingSettings,
+    ReferenceMaterial,
+    Sample,
+)
+from icpmsprocess.plan import compile_plan
+from icpmsprocess.processors import (
+    InternalCorrector,
+    MassBiasCorrector,
+    RatioCalculator,
+)
+from icpmsprocess.utils import (
+    NS_PER_DAY,
+    get_sample_info,
+    load_data_file,
+    not_before,
+)
+
+
+class LiveProcessor:
+    """
+    Processes a run while it is being acquired.
+
+    Each data file is reduced as soon as it has been fully written, and each unknown is mass bias
+    corrected as soon as the standard following it has been reduced, so drift can be spotted
+    mid-session. Files are processed in order of their file names, as `load_samples` does, and the
+    corrected unknowns are the same as `DataProcessor.process` gives for the finished run.
+
+    A file is treated as fully written once it hasn't been modified for `settle_time` seconds. A file
+    with no row in the sample map yet is retried on each poll, and later files wait for it, so rows can
+    be added as the session runs. A file which can't be loaded is reported to the sink and skipped.
+
+    Attributes:
+        data_dir (str): The directory the instrument writes data files to.
+        sample_map_path (str): The path to the sample map CSV. It is re-read whenever it changes, so it
+            can be filled in during the session.
+        isotope_system (IsotopeSystem): The isotope system to be used for the samples.
+        settings (ProcessingSettings): The processing settings.
+        correction_reference_material (ReferenceMaterial): The reference material used as the standard.
+        file_ext, header_row, comment_char, index_col, time_col: As for `load_samples`.
+        settle_time (float): Seconds a file must be unmodified before it is processed. Defaults to 2.
+        sink (InstrumentationSink, optional): Receives events and cycle retention counts, as for `DataProcessor`.
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        sample_map_path: str,
+        isotope_system: IsotopeSystem,
+        settings: ProcessingSettings,
+        correction_reference_material: ReferenceMaterial,
+        file_ext: str = ".exp",
+        header_row: int = 22,
+        comment_char: str = "*",
+        index_col: str = "Cycle",
+        time_col: str | None = "Time",
+        settle_time: float = 2.0,
+        sink: InstrumentationSink | None = None,
+    ):
+        self.data_dir = data_dir
+        self.sample_map_path = sample_map_path
+        self.isotope_system = isotope_system
+        self.settings = settings
+        self.file_ext = file_ext
+        self.header_row = header_row
+        self.comment_char = comment_char
+        self.index_col = index_col
+        self.time_col = time_col
+        self.settle_time = settle_time
+
+        self.sink = sink if sink is not None else WarningSink()
+
+        self.internal_corrector = InternalCorrector(settings, self.sink)
+        self.ratio_calculator = RatioCalculator()
+        self.mass_bias_corrector = MassBiasCorrector(
+            correction_reference_material, settings.bracketing, self.sink
+        )
+        self.plan = compile_plan(
+            isotope_system, settings.intensity_metric, correction_reference_material
+        )
+
+        self._processed_files: set[str] = set()
+        self._sample_map: pd.DataFrame | None = None
+        self._sample_map_mtime: float | None = None
+        self._prev_std: Sample | None = None
+        self._pending: List[Sample] = []
+        self._last_time: int | None = None  # acquisition time of the last sample loaded
+        # files reported as not in the sample map
+        self._unmatched_files: set[str] = set()
+
+    def poll(self) -> List[Sample]:
+        """Reduce any new, fully written data files and return the unknowns which can now be corrected"""
+        now = time.time()
+        new_files = []
+        for fp in sorted(glob.glob(glob.escape(self.data_dir) + "/*" + self.file_ext)):
+            if fp in self._processed_files:
+                continue
+            try:
+                mtime = os.stat(fp).st_mtime
+            except FileNotFoundError:
+                continue
+            if now - mtime < self.settle_time:
+                break  # keep run order: later files wait until this one is complete
+            new_files.append(fp)
+
+        corrected = []
+        for fp in new_files:
+            sample_info = self._sample_info(fp)
+            if sample_info is None:
+                break  # retried on the next poll, once the sample map may have its row
+            try:
+                sample = self._load_sample(fp, sample_info)
+            except Exception as e:
+                self.sink.event(
+                    ProcessingEvent(
+                        EventKind.LOAD_FAILED,
+                        sample_info.sample_name,
+                        "",
+                        f"Skipping {fp}, which could not be loaded: {e}",
+                    )
+                )
+            else:
+                corrected.extend(self.add_sample(sample))
+            self._processed_files.add(fp)
+        return corrected
+
+    def add_sample(self, sample: Sample) -> List[Sample]:
+        """
+        Reduce the next sample of the run and return the unknowns which can now be corrected.
+
+        Unknowns are held back until the standard following them has been added.
+        """
+        sample = self.internal_corrector.correct(sample, self.plan)
+        if self.plan.strips_peaks:
+            sample = self.ratio_calculator.strip_peaks(sample, self.plan)
+        sample = self.ratio_calculator.reduce(sample, self.plan)
+
+        if sample.type != "standard":
+            self._pending.append(sample)
+            return []
+
+        # unknowns before the first standard are corrected with that standard alone
+        bracket = [self._prev_std] if self._prev_std is not None else []
+        corrected = self.mass_bias_corrector.correct(
+            bracket + self._pending + [sample], plan=self.plan
+        )
+        self._pending = []
+        self._prev_std = sample
+        return corrected
+
+    def finish(self) -> List[Sample]:
+        """Correct any unknowns after the last standard using only the preceding standard, and return them"""
+        if len(self._pending) == 0:
+            return []
+        if self._prev_std is None:
+            raise ValueError("No standards found in dataset")
+
+        corrected = self.mass_bias_corrector.correct(
+            [self._prev_std] + self._pending, plan=self.plan
+        )
+        self._pending = []
+        return corrected
+
+    def watch(
+        self, poll_interval: float = 5.0, idle_timeout: float | None = None
+    ) -> Iterator[Sample]:
+        """
+        Watch the data directory, yielding each corrected unknown as soon as it can be corrected.
+
+        Args:
+            poll_interval (float, optional): Seconds between checks for new files. Defaults to 5.
+            idle_timeout (float, optional): Stop once no new files have arrived for this many seconds,
+                and yield any unknowns after the last standard. Defaults to None (watch until closed).
+        """
+        last_activity = time.time()
+        while True:
+            n_files = len(self._processed_files)
+            yield from self.poll()
+            if len(self._processed_files) > n_files:
+                last_activity = time.time()
+            elif (
+                idle_timeout is not None and time.time() - last_activity > idle_timeout
+            ):
+                yield from self.finish()
+                return
+            time.sleep(poll_interval)
+
+    def _sample_info(self, filepath: str) -> pd.Series | None:
+        """The sample map row of a data file, re-reading the sample map if it has changed; None if it has no row yet"""
+        try:
+            sample_map_mtime = os.stat(self.sample_map_path).st_mtime
+            if self._sample_map is None or sample_map_mtime != self._sample_map_mtime:
+                self._sample_map = pd.read_csv(self.sample_map_path)
+                self._sample_map_mtime = sample_map_mtime
+            return get_sample_info(filepath, self._sample_map, self.file_ext)
+        except (OSError, ValueError, KeyError):
+            # not written yet, part written or without this file's row; ParserError is a ValueError
+            if filepath not in self._unmatched_files:
+                self._unmatched_files.add(filepath)
+                self.sink.event(
+                    ProcessingEvent(
+                        EventKind.NOT_IN_SAMPLE_MAP,
+                        None,
+                        "",
+                        f"Waiting for a sample map row for {filepath}",
+                    )
+                )
+            return None
+
+    def _load_sample(self, filepath: str, sample_info: pd.Series) -> Sample:
+        """Load a single data file, with its sample map row"""
+        data = load_data_file(
+            filepath,
+            self.header_row,
+            self.comment_char,
+            self.index_col,
+            time_col=self.time_col,
+        )
+
+        acquisition_time = None
+        if self.time_col in data.columns and len(data) > 0:
+            # as load_samples does, a sample acquired earlier in the day than the last is on the next day
+            acquisition_time = not_before(
+                int(data[self.time_col].iloc[0]) % NS_PER_DAY, self._last_time
+            )
+            self._last_time = acquisition_time
+
+        return Sample(
+            name=sample_info.sample_name,
+            type=sample_info.type,
+            isotope_system=self.isotope_system,
+            timeseries_data=data,
+            acquisition_time=acquisition_time,
+        )
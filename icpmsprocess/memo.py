@@ -0,0 +1,248 @@
+"""
+Process a run again and again with different settings, e.g. while tuning them in a notebook, redoing
+only the stages whose inputs changed.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Any, Callable, List
+
+import numpy as np
+import pandas as pd
+
+from icpmsprocess import DataProcessor
+from icpmsprocess.instrumentation import (
+    CycleRetention,
+    InstrumentationSink,
+    ProcessingEvent,
+    RecordingSink,
+    StageTimer,
+    WarningSink,
+)
+from icpmsprocess.mstypes import ProcessingSettings, ReferenceMaterial, RunStore, Sample
+from icpmsprocess.processors import InternalCorrector, MassBiasCorrector
+from icpmsprocess.uncertainty import monte_carlo_errors
+from icpmsprocess.utils import pack_samples
+
+# the settings each stage depends on, on top of those of the stages before it
+STAGE_SETTINGS = {
+    "pack": ("intensity_metric", "storage_dtype"),
+    "internal_correction": (
+        "min_signal_intensity",
+        "max_blank_intensity",
+        "low_cycles_warning_frac",
+        "blank_cycles",
+        "signal_cycles",
+        "outlier_method",
+        "outlier_threshold",
+        "outlier_max_iterations",
+    ),
+    "reduce": (),
+    "mass_bias": ("bracketing",),
+    "uncertainty": ("bracketing", "uncertainty_draws", "random_seed"),
+}
+
+
+@dataclass
+class _Entry:
+    """A cached stage output, with the events and retention counts sent while computing it"""
+
+    value: Any
+    events: List[ProcessingEvent]
+    retention: List[CycleRetention]
+    nbytes: int
+
+
+class MemoizedPipeline:
+    """
+    Processes a run with `DataProcessor.process_batch`, caching the output of each stage.
+
+    Each stage's output is cached under its inputs: the output of the stage before it, and the settings
+    it depends on (`STAGE_SETTINGS`). So processing the run again after changing the reference material
+    only redoes the mass bias correction, and changing `signal_cycles` redoes the internal correction
+    onwards, reusing the packed run. The samples are loaded once, by the caller, when the pipeline is
+    made. The events of a cached stage are sent to the sink again each time it is used, so every run
+    reports its warnings.
+
+    The cache is bounded by the size of the arrays it holds; when it grows past `max_bytes`, the least
+    recently used outputs are evicted.
+
+    Attributes:
+        samples (List[Sample] | RunStore): The run to process, in run order.
+        sink (InstrumentationSink, optional): Receives events, stage timings (of the stages that ran) and retention counts. Defaults to a WarningSink.
+        max_bytes (int, optional): The size limit of the cache. Defaults to 1 GiB.
+    """
+
+    def __init__(
+        self,
+        samples: List[Sample] | RunStore,
+        sink: InstrumentationSink | None = None,
+        max_bytes: int = 2**30,
+    ):
+        self.samples = samples
+        self.sink = sink if sink is not None else WarningSink()
+        self.max_bytes = max_bytes
+        self._cache: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._size = 0
+
+    def process(
+        self,
+        settings: ProcessingSettings,
+        correction_reference_material: ReferenceMaterial,
+    ) -> pd.DataFrame:
+        """Process the run with the given settings and reference material; the same results as `DataProcessor.process_batch` gives"""
+        processor = DataProcessor(settings, correction_reference_material, self.sink)
+        reference = repr(correction_reference_material)
+        timer = StageTimer(self.sink)
+
+        key = self._key((), "pack", settings)
+        batch = self._stage(
+            key,
+            timer,
+            lambda sink: pack_samples(
+                self.samples,
+                settings.intensity_metric,
+                storage_dtype=settings.storage_dtype,
+            ),
+        )
+        plan = processor.compile_plan(batch.isotope_system, batch.columns)
+
+        key = corrected_key = self._key(key, "internal_correction", settings)
+        batch = self._stage(
+            key,
+            timer,
+            lambda sink: InternalCorrector(settings, sink).correct_batch(batch, plan),
+        )
+
+        key = self._key(key, "reduce", settings)
+        means, errors = self._stage(
+            key, timer, lambda sink: self._reduce(processor, batch, plan)
+        )
+
+        is_standard = np.array(
+            [sample_type == "standard" for sample_type in batch.types]
+        )
+        corrected_values = self._stage(
+            self._key(key, "mass_bias", settings, reference),
+            timer,
+            lambda sink: MassBiasCorrector(
+                correction_reference_material, settings.bracketing, sink
+            ).correct_arrays(
+                means,
+                is_standard,
+                list(plan.ratio_names),
+                batch.acquisition_times,
+                names=batch.names,
+                reference_values=plan.reference_values,
+            ),
+        )
+
+        if settings.uncertainty == "monte_carlo":
+            errors = errors.copy()
+            errors[~is_standard] = self._stage(
+                self._key(corrected_key, "uncertainty", settings, reference),
+                timer,
+                lambda sink: self._monte_carlo_errors(
+                    processor, batch, plan, is_standard
+                ),
+                # unseeded draws should differ every time
+                cache=settings.random_seed is not None,
+            )
+
+        result = timer.time(
+            "assembly",
+            processor.assemble_results,
+            batch.names,
+            batch.types,
+            is_standard,
+            corrected_values,
+            errors,
+            plan.ratio_names,
+        )
+        timer.report()
+        return result
+
+    def clear(self) -> None:
+        """Empty the cache"""
+        self._cache.clear()
+        self._size = 0
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the arrays in the cache"""
+        return self._size
+
+    def _key(
+        self, previous: tuple, stage: str, settings: ProcessingSettings, *inputs
+    ) -> tuple:
+        """The cache key of a stage: the key of the stage before it, and the settings and inputs it depends on"""
+        values = tuple(getattr(settings, name) for name in STAGE_SETTINGS[stage])
+        return previous + ((stage, values, inputs),)
+
+    def _stage(
+        self,
+        key: tuple,
+        timer: StageTimer,
+        func: Callable[[InstrumentationSink], Any],
+        cache: bool = True,
+    ) -> Any:
+        """Get the output of a stage from the cache, or run it (passing it a sink to record its events)"""
+        entry = self._cache.get(key) if cache else None
+        if entry is None:
+            recording = RecordingSink()
+            value = timer.time(key[-1][0], func, recording)
+            entry = _Entry(value, recording.events, recording.retention, _nbytes(value))
+            if cache:
+                self._store(key, entry)
+        else:
+            self._cache.move_to_end(key)
+
+        if self.sink.wants_retention:
+            for retention in entry.retention:
+                self.sink.cycle_retention(retention)
+        for event in entry.events:
+            self.sink.event(event)
+        return entry.value
+
+    def _store(self, key: tuple, entry: _Entry) -> None:
+        """Add an entry to the cache, evicting the least recently used ones to make room"""
+        if entry.nbytes > self.max_bytes:
+            return
+        self._cache[key] = entry
+        self._size += entry.nbytes
+        while self._size > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._size -= evicted.nbytes
+
+    def _reduce(self, processor: DataProcessor, batch, plan):
+        """Peak strip (if needed) and reduce a blank-corrected batch"""
+        if plan.strips_peaks:
+            batch = processor.ratio_calculator.strip_peaks_batch(batch, plan)
+        return processor.ratio_calculator.reduce_batch_values(batch, plan)
+
+    def _monte_carlo_errors(self, processor: DataProcessor, batch, plan, is_standard):
+        """The Monte Carlo errors of the unknowns of a blank-corrected batch"""
+        if plan.strips_peaks:
+            batch = processor.ratio_calculator.strip_peaks_batch(batch, plan)
+        corrector = processor.mass_bias_corrector
+        return monte_carlo_errors(
+            processor.ratio_calculator.ratios_batch(batch, plan),
+            batch.cycle_mask,
+            corrector.bracket(is_standard, batch.acquisition_times),
+            corrector,
+            plan.reference_values,
+            plan.reference_uncertainties,
+            processor.settings.uncertainty_draws,
+            processor.settings.random_seed,
+        )
+
+
+def _nbytes(value: Any) -> int:
+    """The size of the arrays in a stage output"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    if is_dataclass(value):
+        return sum(_nbytes(getattr(value, field.name)) for field in fields(value))
+    return 0
@@ -1,5 +1,6 @@
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field, replace
+from typing import Iterator, List, Tuple
+import numpy as np
 import pandas as pd
 
 
@@ -13,6 +14,14 @@ class ProcessingSettings:
     low_cycles_warning_frac: float
     blank_cycles: int
     signal_cycles: Tuple[int, int]
+    bracketing: str = "mean"  # "mean", "run_order" or "time"; see MassBiasCorrector
+    outlier_method: str = "zscore"  # "zscore", "sigma_clip" or "mad"; see find_outliers
+    outlier_threshold: float = 3.0
+    outlier_max_iterations: int = 10  # passes of "sigma_clip"
+    uncertainty: str = "sem"  # "sem" or "monte_carlo"; see monte_carlo_errors
+    uncertainty_draws: int = 1000  # draws of "monte_carlo"
+    random_seed: int | None = None  # seeds "monte_carlo", for reproducible errors
+    storage_dtype: str = "float64"  # or "float32"; see pack_samples
 
 
 @dataclass
@@ -35,6 +44,19 @@ class IsotopeRatio:
         return f"{self.numerator}_{self.denominator}"
 
 
+@dataclass
+class SegmentationSettings:
+    """Settings for splitting a file holding many analyses in a row into samples; see `icpmsprocess.segment`"""
+
+    intensity_metric: str  # the column the blanks and signals are told apart by
+    blank_threshold: float  # cycles at or below this are blank
+    signal_threshold: float  # cycles at or above this are signal
+    min_blank_cycles: int = 5  # shorter runs of blank cycles are ignored
+    min_signal_cycles: int = 10  # shorter runs of signal cycles are ignored
+    # dropped from each end of a signal, e.g. as the signal rises and falls
+    trim_cycles: int = 0
+
+
 @dataclass
 class PeakStripSettings:
     """Settings to use for correction of isobaric interference"""
@@ -52,11 +74,15 @@ class IsotopeSystem:
     Attributes:
         name: The name of the isotope system (e.g., "Pb-Pb").
         ratios: A list of IsotopeRatio objects.
+        peak_strip: An isobaric interference to correct for.
+        interferences: More isobaric interferences to correct for. An interference may be calculated
+            from an isotope which is itself corrected, in which case that correction is applied first.
     """
 
     name: str
     ratios: List[IsotopeRatio]
     peak_strip: PeakStripSettings | None = None
+    interferences: List[PeakStripSettings] = field(default_factory=list)
 
     def get_ratio_columns(self) -> List[str]:
         """Get column names for all ratios"""
@@ -70,6 +96,36 @@ class IsotopeSystem:
             isotopes.add(ratio.denominator)
         return list(isotopes)
 
+    def get_interferences(self) -> List[PeakStripSettings]:
+        """Get all the isobaric interferences to correct for: `peak_strip`, if set, then `interferences`"""
+        return ([self.peak_strip] if self.peak_strip is not None else []) + list(
+            self.interferences
+        )
+
+    def get_processing_columns(self, intensity_metric: str | None = None) -> List[str]:
+        """Get the intensity columns needed to process the system: the ratio isotopes, any used for peak stripping, and the intensity metric if given; sorted"""
+        columns = set(self.get_intensity_columns())
+        for interference in self.get_interferences():
+            columns.add(interference.target_isotope)
+            columns.add(interference.known_isotope_ratio.denominator)
+        if intensity_metric is not None:
+            columns.add(intensity_metric)
+        return sorted(columns)
+
+
+@dataclass
+class SampleWindows:
+    """
+    The blank and signal cycles of a sample, for samples whose windows differ, e.g. ablations found by `icpmsprocess.segment`.
+
+    Attributes:
+        blank (Tuple[int, int]): The first and last cycle of the blank.
+        signal (Tuple[int, int]): The first and last cycle of the signal.
+    """
+
+    blank: Tuple[int, int]
+    signal: Tuple[int, int]
+
 
 @dataclass
 class Sample:
@@ -82,6 +138,8 @@ class Sample:
         isotope_system (IsotopeSystem): The intended isotope system associated with the measurements of this sample.
         timeseries_data (pd.DataFrame): The full data of the sample. Rows are cycles, columns are measured mass intensities.
         reduced_data (pd.Series | None): The reduced data of the sample; None until calculated. Content is determined by the isotope_system.
+        acquisition_time (int | None): When the sample's first cycle was measured, in nanoseconds since midnight of the session's first day; None if not known.
+        windows (SampleWindows | None): The sample's own blank and signal cycles; None to use those of the processing settings.
     """
 
     name: str
@@ -89,6 +147,237 @@ class Sample:
     isotope_system: IsotopeSystem
     timeseries_data: pd.DataFrame
     reduced_data: pd.Series | None = None
+    acquisition_time: int | None = None
+    windows: SampleWindows | None = None
+
+
+@dataclass
+class SampleBatch:
+    """
+    The timeseries data of a whole run, packed into dense arrays for whole-run processing.
+
+    Samples with fewer cycles than the longest one are padded with NaN, and `cycle_mask` marks which
+    cells hold retained cycles.
+
+    Attributes:
+        names (List[str]): The sample names, in run order.
+        types (List[str]): The sample types, in run order.
+        isotope_system (IsotopeSystem): The isotope system shared by all samples in the batch.
+        columns (List[str]): The intensity columns held in `data`, in the order of its last axis.
+        cycles (np.ndarray): The cycle number of each cell, shape (samples, cycles).
+        data (np.ndarray): The intensities, shape (samples, cycles, columns).
+        cycle_mask (np.ndarray): True where a cell holds a retained cycle, shape (samples, cycles).
+        acquisition_times (np.ndarray | None): The acquisition time of each sample (see `Sample`), or None if not known for all of them.
+        windows (np.ndarray | None): The first and last blank and signal cycles of samples with their own windows, shape (samples, 4); -1 for the others. None if no sample has its own.
+    """
+
+    names: List[str]
+    types: List[str]
+    isotope_system: IsotopeSystem
+    columns: List[str]
+    cycles: np.ndarray
+    data: np.ndarray
+    cycle_mask: np.ndarray
+    acquisition_times: np.ndarray | None = None
+    windows: np.ndarray | None = None
+
+    def column_index(self, column: str) -> int:
+        """Get the position of an intensity column along the last axis of `data`."""
+        if column not in self.columns:
+            raise KeyError(f"Column '{column}' not found in the sample batch.")
+        return self.columns.index(column)
+
+    def select(
+        self, columns: List[str], isotope_system: IsotopeSystem | None = None
+    ) -> "SampleBatch":
+        """Get a new batch holding only the given columns, optionally for another isotope system"""
+        indices = [self.column_index(col) for col in columns]
+        return SampleBatch(
+            names=self.names,
+            types=self.types,
+            isotope_system=isotope_system or self.isotope_system,
+            columns=list(columns),
+            cycles=self.cycles,
+            data=self.data[:, :, indices],
+            cycle_mask=self.cycle_mask,
+            acquisition_times=self.acquisition_times,
+            windows=self.windows,
+        )
+
+
+@dataclass(slots=True)
+class SampleInfo:
+    """The metadata of a sample held in a RunStore"""
+
+    name: str
+    type: str
+    acquisition_time: int | None = None
+    windows: SampleWindows | None = None
+
+
+@dataclass
+class RunStore:
+    """
+    The cycles of all samples in a run, held in one contiguous block.
+
+    A compact alternative to a list of Samples for long runs: instead of a DataFrame per sample, every
+    cycle of every sample is a row of one array, sharing a single column index. Sample `i` is rows
+    `offsets[i]` to `offsets[i] + lengths[i]` of `data`.
+
+    A RunStore can be used wherever a list of samples is expected: indexing or iterating over it gives
+    `Sample` objects, created on demand with their timeseries data as a view of the block.
+
+    Attributes:
+        isotope_system (IsotopeSystem): The isotope system shared by all samples.
+        info (List[SampleInfo]): The name and type of each sample, in run order.
+        columns (List[str]): The intensity columns, in the order of the columns of `data`.
+        data (np.ndarray): The intensities, shape (total cycles, columns).
+        cycles (np.ndarray): The cycle number of each row of `data`.
+        offsets (np.ndarray): The first row of each sample in `data`.
+        lengths (np.ndarray): The number of cycles of each sample.
+        index_name (str): The name of the cycle index of each sample's timeseries data. Defaults to "Cycle".
+    """
+
+    isotope_system: IsotopeSystem
+    info: List[SampleInfo]
+    columns: List[str]
+    data: np.ndarray
+    cycles: np.ndarray
+    offsets: np.ndarray
+    lengths: np.ndarray
+    index_name: str = "Cycle"
+
+    def __len__(self) -> int:
+        return len(self.info)
+
+    def __getitem__(self, i: int | slice) -> "Sample | RunStore":
+        """Get a sample, with its timeseries data as a view of the block, or a slice of the run as a RunStore sharing the block"""
+        if isinstance(i, slice):
+            return replace(
+                self,
+                info=self.info[i],
+                offsets=self.offsets[i],
+                lengths=self.lengths[i],
+            )
+        start, stop = self.offsets[i], self.offsets[i] + self.lengths[i]
+        return Sample(
+            name=self.info[i].name,
+            type=self.info[i].type,
+            acquisition_time=self.info[i].acquisition_time,
+            windows=self.info[i].windows,
+            isotope_system=self.isotope_system,
+            timeseries_data=pd.DataFrame(
+                self.data[start:stop],
+                index=pd.Index(self.cycles[start:stop], name=self.index_name),
+                columns=self.columns,
+                copy=False,
+            ),
+        )
+
+    def __iter__(self) -> Iterator[Sample]:
+        return (self[i] for i in range(len(self)))
+
+    @classmethod
+    def from_samples(
+        cls,
+        samples: List[Sample],
+        columns: List[str] | None = None,
+        dtype: str = "float64",
+    ) -> "RunStore":
+        """
+        Pack a list of samples into a RunStore.
+
+        Args:
+            samples (List[Sample]): The samples, in run order. All must share an isotope system.
+            columns (List[str], optional): The columns to keep. Defaults to the intensity (float) columns of the first sample, so not the parsed cycle times.
+            dtype (str, optional): The dtype to store the data in, "float64" or "float32". Defaults to "float64".
+        """
+        if len(samples) == 0:
+            raise ValueError("No samples to pack")
+
+        isotope_system = samples[0].isotope_system
+        if any(sample.isotope_system != isotope_system for sample in samples):
+            raise ValueError(
+                "All samples in a run store must share the same isotope system"
+            )
+
+        if columns is None:
+            columns = list(samples[0].timeseries_data.select_dtypes("floating").columns)
+
+        lengths = np.array([len(s.timeseries_data) for s in samples], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        data = np.empty((lengths.sum(), len(columns)), dtype=dtype)
+        cycles = np.empty(lengths.sum(), dtype=np.int64)
+        for sample, start, n in zip(samples, offsets, lengths):
+            data[start : start + n] = sample.timeseries_data[columns].to_numpy(dtype)
+            cycles[start : start + n] = sample.timeseries_data.index.to_numpy()
+
+        return cls(
+            isotope_system=isotope_system,
+            info=[
+                SampleInfo(s.name, s.type, s.acquisition_time, s.windows)
+                for s in samples
+            ],
+            columns=list(columns),
+            data=data,
+            cycles=cycles,
+            offsets=offsets,
+            lengths=lengths,
+            index_name=samples[0].timeseries_data.index.name or "Cycle",
+        )
+
+    def to_batch(self, columns: List[str] | None = None) -> SampleBatch:
+        """
+        Gather the store into a SampleBatch, padding samples to the same number of cycles.
+
+        Args:
+            columns (List[str], optional): The columns to include. Defaults to all columns.
+        """
+        if columns is None:
+            columns = self.columns
+        missing = [col for col in columns if col not in self.columns]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in the run store.")
+        column_indices = [self.columns.index(col) for col in columns]
+
+        n_cycles = int(self.lengths.max()) if len(self) > 0 else 0
+        position = np.arange(n_cycles)
+        cycle_mask = position[np.newaxis, :] < self.lengths[:, np.newaxis]
+        rows = np.where(cycle_mask, self.offsets[:, np.newaxis] + position, 0)
+
+        # rows and columns gathered together, so only the cycles needed are read from the block
+        data = self.data[rows[:, :, np.newaxis], column_indices]
+        data[~cycle_mask] = np.nan
+
+        acquisition_times = None
+        if len(self) > 0 and all(
+            info.acquisition_time is not None for info in self.info
+        ):
+            acquisition_times = np.array(
+                [info.acquisition_time for info in self.info], dtype=np.int64
+            )
+
+        return SampleBatch(
+            names=[info.name for info in self.info],
+            types=[info.type for info in self.info],
+            isotope_system=self.isotope_system,
+            columns=list(columns),
+            cycles=np.where(cycle_mask, self.cycles[rows], 0),
+            data=data,
+            cycle_mask=cycle_mask,
+            acquisition_times=acquisition_times,
+            windows=pack_windows([info.windows for info in self.info]),
+        )
+
+
+def pack_windows(windows: List[SampleWindows | None]) -> np.ndarray | None:
+    """Pack the windows of the samples of a run into the (samples, 4) array of a SampleBatch, or None if no sample has its own"""
+    if all(w is None for w in windows):
+        return None
+    return np.array(
+        [[-1] * 4 if w is None else [*w.blank, *w.signal] for w in windows],
+        dtype=np.int64,
+    )
 
 
 @dataclass
@@ -0,0 +1,284 @@
+"""
+Reduce a sample a cycle or chunk at a time while it is being acquired, so a running ratio and error can
+be shown before the analysis ends, and the final values are ready as soon as it does.
+"""
+
+from dataclasses import dataclass, replace
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from icpmsprocess.instrumentation import InstrumentationSink
+from icpmsprocess.mstypes import (
+    IsotopeSystem,
+    ProcessingSettings,
+    Sample,
+    SampleWindows,
+)
+from icpmsprocess.plan import compile_plan
+from icpmsprocess.processors import InternalCorrector, interleave_statistics
+
+
+@dataclass
+class RunningStats:
+    """
+    The running mean and spread of some columns, updated a cycle or chunk at a time (Welford's method,
+    with Chan's formula for chunks). NaN values are skipped, column by column, as pandas does.
+
+    Attributes:
+        count (np.ndarray): The number of values of each column.
+        mean (np.ndarray): The mean of each column.
+        m2 (np.ndarray): The sum of squared deviations from the mean of each column.
+    """
+
+    count: np.ndarray
+    mean: np.ndarray
+    m2: np.ndarray
+
+    @classmethod
+    def empty(cls, n_columns: int) -> "RunningStats":
+        return cls(
+            count=np.zeros(n_columns, dtype=np.int64),
+            mean=np.zeros(n_columns, dtype=np.float64),
+            m2=np.zeros(n_columns, dtype=np.float64),
+        )
+
+    @classmethod
+    def of(cls, values: np.ndarray) -> "RunningStats":
+        """The statistics of a (cycles, columns) array, or of a single cycle"""
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        present = ~np.isnan(values)
+        count = present.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(present, values, 0.0).sum(axis=0) / count
+            deviation = np.where(present, values - mean, 0.0)
+        return cls(
+            count=count,
+            mean=np.where(count > 0, mean, 0.0),
+            m2=(deviation**2).sum(axis=0),
+        )
+
+    def update(self, values: np.ndarray) -> None:
+        """Add a cycle, or a (cycles, columns) chunk of them"""
+        self.merge(RunningStats.of(values))
+
+    def merge(self, other: "RunningStats") -> None:
+        """Add the values another accumulator of the same columns has seen, e.g. those of a chunk reduced in parallel"""
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(count > 0, other.count / count, 0.0)
+        delta = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * weight
+        self.mean = self.mean + delta * weight
+        self.count = count
+
+    @property
+    def variance(self) -> np.ndarray:
+        """The population variance (ddof=0) of each column; NaN for columns with no values"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.m2 / self.count, np.nan)
+
+    @property
+    def sem(self) -> np.ndarray:
+        """The standard error of the mean of each column, as `RatioCalculator` gives it"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.variance) / np.sqrt(self.count)
+
+    def values(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The mean and standard error of each column; NaN for columns with no values"""
+        return np.where(self.count > 0, self.mean, np.nan), self.sem
+
+
+class OnlineReducer:
+    """
+    Blank-corrects and reduces one sample as its cycles arrive, keeping only running statistics.
+
+    Cycles can be added one at a time or in chunks, in acquisition order, and are told apart by their
+    cycle numbers (the index), using the sample's windows. The blank cycles are held until the blank
+    window is complete, since their outliers are judged against the whole window, and then averaged as
+    `InternalCorrector` does. Each signal cycle within the intensity limits is then blank-corrected,
+    corrected for interferences and its ratios added to running means and variances, so `values()` gives
+    the ratios and errors so far at any point.
+
+    Outliers in the signal can only be judged once the whole window is in, so until then the values are
+    provisional: they include any outliers. The signal cycles are kept, in the plan's columns only, and
+    `finish()` removes their outliers as `InternalCorrector` does and reduces what is left, giving the
+    values `DataProcessor.process` gives.
+
+    Attributes:
+        sample (Sample): The sample being acquired; its `timeseries_data` is not used.
+        settings (ProcessingSettings): The processing settings.
+        plan (ProcessingPlan): The compiled plan for the sample's isotope system.
+        windows (SampleWindows): The blank and signal cycles used.
+        blank_mean (np.ndarray | None): The mean blank of each of the plan's columns; None until the blank window is complete.
+        ratio_stats (RunningStats): The running statistics of the ratios, in the order of the plan's ratio names.
+        finished (bool): Whether `finish()` has been called, so the values are final.
+    """
+
+    def __init__(
+        self,
+        sample: Sample,
+        settings: ProcessingSettings,
+        sink: InstrumentationSink | None = None,
+    ):
+        self.sample = sample
+        self.settings = settings
+        self.plan = compile_plan(sample.isotope_system, settings.intensity_metric)
+        self.windows = sample.windows or SampleWindows(
+            (1, settings.blank_cycles), settings.signal_cycles
+        )
+        self.internal_corrector = InternalCorrector(settings, sink)
+        self.blank_mean: np.ndarray | None = None
+        self.ratio_stats = RunningStats.empty(len(self.plan.ratio_names))
+        self.finished = False
+
+        self._blank: List[pd.DataFrame] = []
+        # signal cycles that came before the blank was complete
+        self._waiting: List[pd.DataFrame] = []
+        # signal cycles already in the running statistics, for removing outliers when finishing
+        self._signal: List[pd.DataFrame] = []
+
+    @classmethod
+    def for_system(
+        cls,
+        name: str,
+        isotope_system: IsotopeSystem,
+        settings: ProcessingSettings,
+        sample_type: str = "sample",
+        sink: InstrumentationSink | None = None,
+    ) -> "OnlineReducer":
+        """A reducer for a sample which hasn't been loaded, e.g. the one being acquired"""
+        sample = Sample(
+            name=name,
+            type=sample_type,
+            isotope_system=isotope_system,
+            timeseries_data=pd.DataFrame(),
+        )
+        return cls(sample, settings, sink)
+
+    def update(self, cycles: pd.DataFrame) -> None:
+        """
+        Add newly acquired cycles.
+
+        Args:
+            cycles (pd.DataFrame): Rows are cycles, indexed by cycle number; columns are as for `Sample.timeseries_data`.
+        """
+        if self.finished:
+            raise ValueError(f"The reduction of {self.sample.name} is finished")
+        cycle = cycles.index.to_numpy()
+        blank_start, blank_end = self.windows.blank
+        signal_start, signal_end = self.windows.signal
+
+        if self.blank_mean is None:
+            in_blank = (cycle >= blank_start) & (cycle <= blank_end)
+            if in_blank.any():
+                self._blank.append(cycles[in_blank])
+            if len(cycle) > 0 and cycle.max() >= blank_end:
+                self.finish_blank()
+
+        signal = cycles[(cycle >= signal_start) & (cycle <= signal_end)]
+        if len(signal) == 0:
+            return
+        if self.blank_mean is None:
+            self._waiting.append(signal)
+        else:
+            self._add_signal(signal)
+
+    def finish_blank(self) -> None:
+        """Average the blank, e.g. if its last cycles were never recorded; done by `update` once the blank window is complete"""
+        if self.blank_mean is not None:
+            return
+        if self._blank:
+            blank = self.internal_corrector.remove_outliers(
+                replace(self.sample, timeseries_data=pd.concat(self._blank)),
+                limit_hi=True,
+                window="blank",
+                plan=self.plan,
+            ).timeseries_data[list(self.plan.columns)]
+            self.blank_mean = blank.astype(np.float64).mean().to_numpy()
+        else:
+            self.blank_mean = np.full(len(self.plan.columns), np.nan)
+        self._blank = []
+        for signal in self._waiting:
+            self._add_signal(signal)
+        self._waiting = []
+
+    def finish(self) -> None:
+        """
+        Remove the outliers of the signal, once all of its cycles are in, and reduce the cycles left.
+
+        The values are then final, and the same as `DataProcessor.process` gives; no more cycles can be
+        added. Outliers and windows left with few cycles are reported to the sink as `InternalCorrector`
+        reports them.
+        """
+        if self.finished:
+            return
+        self.finish_blank()
+        if self._signal:
+            signal = pd.concat(self._signal).sort_index()
+        else:
+            signal = pd.DataFrame(columns=list(self.plan.columns), dtype=np.float64)
+        signal = self.internal_corrector.remove_outliers(
+            replace(self.sample, timeseries_data=signal),
+            limit_low=True,
+            window="signal",
+            plan=self.plan,
+        ).timeseries_data
+        self.ratio_stats = RunningStats.of(self._ratios(signal))
+        self._signal = []
+        self.finished = True
+
+    def merge(self, other: "OnlineReducer") -> None:
+        """
+        Add the signal cycles another reducer of the same sample has seen, e.g. one given the blank and
+        another part of the signal in parallel. The blanks of both must be complete and the same.
+        """
+        if (
+            self.finished
+            or other.finished
+            or self.blank_mean is None
+            or other.blank_mean is None
+            or not np.array_equal(self.blank_mean, other.blank_mean, equal_nan=True)
+        ):
+            raise ValueError(
+                "Only unfinished reducers with the same complete blank can be merged"
+            )
+        self.ratio_stats.merge(other.ratio_stats)
+        self._signal.extend(other._signal)
+
+    def values(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The mean and standard error of each ratio so far, in the order of the plan's ratio names; provisional until `finish()`"""
+        return self.ratio_stats.values()
+
+    def reduced_data(self) -> pd.Series:
+        """The ratios and errors so far, as `RatioCalculator.reduce` sets `Sample.reduced_data`; provisional until `finish()`"""
+        mean, sem = self.values()
+        return pd.Series(interleave_statistics(self.plan.ratio_names, mean, sem))
+
+    def _add_signal(self, signal: pd.DataFrame) -> None:
+        """Add the ratios of signal cycles within the intensity limits to the running statistics, keeping the cycles"""
+        signal = signal[list(self.plan.columns)]
+        self._signal.append(signal)
+        metric = signal[self.settings.intensity_metric].to_numpy()
+        self.ratio_stats.update(
+            self._ratios(signal[~(metric < self.settings.min_signal_intensity)])
+        )
+
+    def _ratios(self, signal: pd.DataFrame) -> np.ndarray:
+        """Blank-correct signal cycles, correct them for interferences and calculate their ratios"""
+        data = signal[list(self.plan.columns)].to_numpy()
+        # kept in the dtype the intensities are stored in, e.g. float32, as `InternalCorrector` does
+        corrected = (data - self.blank_mean).astype(data.dtype)
+        if self.plan.strips_peaks:
+            corrected[:, self.plan.interference_target_indices] = (
+                corrected[:, self.plan.interference_source_indices].astype(np.float64)
+                @ self.plan.interference_matrix.T
+            )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratios = np.divide(
+                corrected[:, self.plan.numerator_indices],
+                corrected[:, self.plan.denominator_indices],
+                dtype=np.float64,
+            )
+        return ratios
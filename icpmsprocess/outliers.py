@@ -0,0 +1,87 @@
+import warnings
+
+import numpy as np
+
+OUTLIER_METHODS = ("zscore", "sigma_clip", "mad")
+
+# scales the median absolute deviation to the standard deviation of a normal distribution
+MAD_TO_STD = 1.482602218505602
+
+
+def find_outliers(
+    values: np.ndarray,
+    cycle_mask: np.ndarray,
+    method: str = "zscore",
+    threshold: float = 3.0,
+    max_iterations: int = 10,
+) -> np.ndarray:
+    """
+    Find outlying cycles of many samples at once.
+
+    A cycle is an outlier if any of its columns is. Only the cycles in `cycle_mask` are used, or can be
+    outliers. The methods are:
+    - "zscore": further than `threshold` standard deviations from the mean, in a single pass. A NaN in
+      a column means none of that column's cycles are outliers, as for `scipy.stats.zscore`.
+    - "sigma_clip": the z-score test, repeated on the remaining cycles until no more outliers are
+      found (or for `max_iterations` passes).
+    - "mad": further than `threshold` scaled median absolute deviations from the median, ignoring NaN.
+      Robust to the outliers themselves, so one pass is enough.
+
+    Args:
+        values (np.ndarray): The intensities, shape (samples, cycles, columns).
+        cycle_mask (np.ndarray): The cycles to consider, shape (samples, cycles).
+        method (str, optional): One of OUTLIER_METHODS. Defaults to "zscore".
+        threshold (float, optional): The outlier threshold, in standard deviations. Defaults to 3.
+        max_iterations (int, optional): The most passes for "sigma_clip". Defaults to 10.
+    Returns:
+        np.ndarray: True for outlying cycles, shape (samples, cycles).
+    """
+    if method == "zscore":
+        return _zscore_outliers(values, cycle_mask, threshold)
+    if method == "sigma_clip":
+        kept = cycle_mask.copy()
+        for _ in range(max_iterations):
+            outliers = _zscore_outliers(values, kept, threshold)
+            if not outliers.any():
+                break
+            kept &= ~outliers
+        return cycle_mask & ~kept
+    if method == "mad":
+        return _mad_outliers(values, cycle_mask, threshold)
+    raise ValueError(
+        f"Unknown outlier method '{method}', expected one of {OUTLIER_METHODS}"
+    )
+
+
+def _zscore_outliers(
+    values: np.ndarray, cycle_mask: np.ndarray, threshold: float
+) -> np.ndarray:
+    """Cycles with any column more than `threshold` (population) standard deviations from the mean"""
+    selected = cycle_mask[:, :, np.newaxis]
+    count = cycle_mask.sum(axis=1)[:, np.newaxis]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # NaN in any selected cycle propagates to the whole column
+        mean = np.where(selected, values, 0.0).sum(axis=1, dtype=np.float64) / count
+        deviation = np.where(selected, values - mean[:, np.newaxis, :], 0.0)
+        std = np.sqrt((deviation**2).sum(axis=1) / count)
+        is_outlier = np.abs(deviation / std[:, np.newaxis, :]) > threshold
+    return (is_outlier & selected).any(axis=2)
+
+
+def _mad_outliers(
+    values: np.ndarray, cycle_mask: np.ndarray, threshold: float
+) -> np.ndarray:
+    """Cycles with any column more than `threshold` scaled median absolute deviations from the median"""
+    selected = cycle_mask[:, :, np.newaxis]
+    masked = np.where(selected, values, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # medians of padding or empty windows are all NaN
+        warnings.filterwarnings("ignore", "All-NaN slice", RuntimeWarning)
+        median = np.nanmedian(masked, axis=1)
+        deviation = np.abs(masked - median[:, np.newaxis, :])
+        mad = np.nanmedian(deviation, axis=1) * MAD_TO_STD
+        # a zero MAD (e.g. a constant column) can't identify outliers
+        is_outlier = (deviation / mad[:, np.newaxis, :] > threshold) & (
+            mad[:, np.newaxis, :] > 0
+        )
+    return (is_outlier & selected).any(axis=2)
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from icpmsprocess.mstypes import IsotopeSystem, PeakStripSettings, ReferenceMaterial
+
+PLAN_CACHE_SIZE = 64
+
+
+@dataclass(frozen=True)
+class ProcessingPlan:
+    """
+    The column lookups of a processing configuration, resolved once.
+
+    Positions are along the last axis of a SampleBatch holding `columns`; the per-sample stages use
+    the matching column names. Arrays are read-only. Build plans with `compile_plan`.
+
+    Attributes:
+        isotope_system (IsotopeSystem): The isotope system the plan is for.
+        intensity_metric (str | None): The column used for intensity thresholds.
+        reference_material (ReferenceMaterial | None): The reference material used as the standard.
+        columns (Tuple[str, ...]): The column layout the positions refer to.
+        metric_index (int | None): The position of the intensity metric.
+        outlier_columns (Tuple[str, ...]): The isotopes tested for outliers: those in the ratios.
+        outlier_indices (np.ndarray): Their positions.
+        ratio_names (Tuple[str, ...]): The ratio names, in the order of the isotope system.
+        numerator_columns, denominator_columns (Tuple[str, ...]): The isotopes of each ratio.
+        numerator_indices, denominator_indices (np.ndarray): Their positions.
+        interference_targets (Tuple[str, ...]): The isotopes corrected for isobaric interferences, if any.
+        interference_sources (Tuple[str, ...]): The isotopes their corrections are calculated from, including themselves.
+        interference_target_indices, interference_source_indices (np.ndarray): Their positions.
+        interference_matrix (np.ndarray): The corrections compiled into one matrix, shape (targets,
+            sources): the corrected targets are `sources @ interference_matrix.T`.
+        reference_values (np.ndarray | None): The reference value of each ratio.
+        reference_uncertainties (np.ndarray | None): The (1 sigma) uncertainty of each reference value, zero where not given.
+    """
+
+    isotope_system: IsotopeSystem
+    intensity_metric: str | None
+    reference_material: ReferenceMaterial | None
+    columns: Tuple[str, ...]
+    metric_index: int | None
+    outlier_columns: Tuple[str, ...]
+    outlier_indices: np.ndarray
+    ratio_names: Tuple[str, ...]
+    numerator_columns: Tuple[str, ...]
+    denominator_columns: Tuple[str, ...]
+    numerator_indices: np.ndarray
+    denominator_indices: np.ndarray
+    interference_targets: Tuple[str, ...]
+    interference_sources: Tuple[str, ...]
+    interference_target_indices: np.ndarray
+    interference_source_indices: np.ndarray
+    interference_matrix: np.ndarray
+    reference_values: np.ndarray | None
+    reference_uncertainties: np.ndarray | None
+
+    @property
+    def strips_peaks(self) -> bool:
+        """Whether there are isobaric interferences to correct for"""
+        return len(self.interference_targets) > 0
+
+
+_plan_cache: "OrderedDict[tuple, ProcessingPlan]" = OrderedDict()
+
+
+def compile_plan(
+    isotope_system: IsotopeSystem,
+    intensity_metric: str | None = None,
+    reference_material: ReferenceMaterial | None = None,
+    columns: Sequence[str] | None = None,
+) -> ProcessingPlan:
+    """
+    Compile a processing configuration into a ProcessingPlan.
+
+    Plans are cached (the most recent PLAN_CACHE_SIZE), so compiling the same configuration again,
+    e.g. for every run of a session, returns the same plan. The cache is keyed on the values of the
+    arguments, so modifying an isotope system or reference material gives a new plan.
+
+    Args:
+        isotope_system (IsotopeSystem): The isotope system to process.
+        intensity_metric (str, optional): The column used for intensity thresholds. Defaults to None.
+        reference_material (ReferenceMaterial, optional): The reference material used as the standard. Defaults to None.
+        columns (Sequence[str], optional): The column layout to resolve positions in. Defaults to the columns needed to process the isotope system.
+    Returns:
+        ProcessingPlan: The compiled plan.
+    """
+    if columns is None:
+        columns = isotope_system.get_processing_columns(intensity_metric)
+    key = (
+        repr(isotope_system),
+        intensity_metric,
+        repr(reference_material),
+        tuple(columns),
+    )
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        _plan_cache.move_to_end(key)
+        return plan
+
+    plan = _compile(isotope_system, intensity_metric, reference_material, columns)
+    _plan_cache[key] = plan
+    if len(_plan_cache) > PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last=False)
+    return plan
+
+
+def _compile(
+    isotope_system: IsotopeSystem,
+    intensity_metric: str | None,
+    reference_material: ReferenceMaterial | None,
+    columns: Sequence[str],
+) -> ProcessingPlan:
+    """Resolve the column positions and reference values of a configuration"""
+    columns = tuple(columns)
+
+    def position(column: str) -> int:
+        if column not in columns:
+            raise KeyError(f"Column '{column}' not found in the column layout.")
+        return columns.index(column)
+
+    def positions(names: Sequence[str]) -> np.ndarray:
+        indices = np.array([position(name) for name in names], dtype=np.intp)
+        indices.setflags(write=False)
+        return indices
+
+    ratios = isotope_system.ratios
+    outlier_columns = tuple(sorted(isotope_system.get_intensity_columns()))
+    numerator_columns = tuple(r.numerator for r in ratios)
+    denominator_columns = tuple(r.denominator for r in ratios)
+    ratio_names = tuple(r.name for r in ratios)
+
+    interference_targets, interference_sources, interference_matrix = (
+        _interference_matrix(isotope_system.get_interferences())
+    )
+    reference_values = reference_uncertainties = None
+    if reference_material is not None:
+        references = [reference_material.get_value(name) for name in ratio_names]
+        reference_values = np.array([r.value for r in references], dtype=np.float64)
+        reference_uncertainties = np.array(
+            [r.uncertainty or 0.0 for r in references], dtype=np.float64
+        )
+        reference_values.setflags(write=False)
+        reference_uncertainties.setflags(write=False)
+
+    return ProcessingPlan(
+        isotope_system=isotope_system,
+        intensity_metric=intensity_metric,
+        reference_material=reference_material,
+        columns=columns,
+        metric_index=None if intensity_metric is None else position(intensity_metric),
+        outlier_columns=outlier_columns,
+        outlier_indices=positions(outlier_columns),
+        ratio_names=ratio_names,
+        numerator_columns=numerator_columns,
+        denominator_columns=denominator_columns,
+        numerator_indices=positions(numerator_columns),
+        denominator_indices=positions(denominator_columns),
+        interference_targets=interference_targets,
+        interference_sources=interference_sources,
+        interference_target_indices=positions(interference_targets),
+        interference_source_indices=positions(interference_sources),
+        interference_matrix=interference_matrix,
+        reference_values=reference_values,
+        reference_uncertainties=reference_uncertainties,
+    )
+
+
+def _interference_matrix(
+    interferences: List[PeakStripSettings],
+) -> Tuple[Tuple[str, ...], Tuple[str, ...], np.ndarray]:
+    """
+    Compile isobaric interference corrections into one matrix.
+
+    Each correction subtracts the known ratio times the (corrected) intensity of the isotope it is
+    calculated from; corrections of that isotope are applied first, so chained interferences compose.
+    Returns the corrected isotopes, the isotopes they are calculated from, and the matrix mapping one
+    to the other.
+    """
+    remaining = list(interferences)
+    ordered = []
+    while remaining:
+        targets = {i.target_isotope for i in remaining}
+        ready = [
+            i for i in remaining if i.known_isotope_ratio.denominator not in targets
+        ]
+        if not ready:
+            raise ValueError(
+                f"Interference corrections of {sorted(targets)} depend on each other in a loop"
+            )
+        ordered.extend(ready)
+        remaining = [i for i in remaining if i not in ready]
+
+    isotopes = sorted(
+        {i.target_isotope for i in ordered}
+        | {i.known_isotope_ratio.denominator for i in ordered}
+    )
+    # each row gives an isotope's corrected intensity in terms of the measured ones
+    matrix = np.eye(len(isotopes))
+    for interference in ordered:
+        target = isotopes.index(interference.target_isotope)
+        known = isotopes.index(interference.known_isotope_ratio.denominator)
+        matrix[target] -= interference.known_isotope_ratio_value * matrix[known]
+
+    targets = sorted({i.target_isotope for i in ordered})
+    rows = matrix[[isotopes.index(t) for t in targets]]
+    sources = [isotope for j, isotope in enumerate(isotopes) if rows[:, j].any()]
+    matrix = np.ascontiguousarray(rows[:, [isotopes.index(s) for s in sources]])
+    matrix.setflags(write=False)
+    return tuple(targets), tuple(sources), matrix
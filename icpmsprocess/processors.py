@@ -1,254 +1,773 @@
+from icpmsprocess.instrumentation import (
+    CycleRetention,
+    EventKind,
+    InstrumentationSink,
+    ProcessingEvent,
+    WarningSink,
+)
 from icpmsprocess.mstypes import (
-    IsotopeSystem,
     ProcessingSettings,
     ReferenceMaterial,
     Sample,
+    SampleBatch,
+    SampleWindows,
 )
+from icpmsprocess.outliers import OUTLIER_METHODS, find_outliers
+from icpmsprocess.plan import ProcessingPlan, compile_plan
 
 
+import numpy as np
 import pandas as pd
-from scipy.stats import zscore
 
-import warnings
-from typing import List
+from dataclasses import dataclass, replace
+from typing import List, Sequence, Tuple
 
 
 class InternalCorrector:
     """Handles internal corrections for a sample"""
 
-    def __init__(self, settings: ProcessingSettings):
+    def __init__(
+        self,
+        settings: ProcessingSettings,
+        sink: InstrumentationSink | None = None,
+    ):
+        if settings.outlier_method not in OUTLIER_METHODS:
+            raise ValueError(
+                f"Unknown outlier method '{settings.outlier_method}', expected one of {OUTLIER_METHODS}"
+            )
         self.settings = settings
+        self.sink = sink if sink is not None else WarningSink()
 
-    def correct(self, sample: Sample) -> Sample:
-        blank_raw = sample.timeseries_data.loc[1 : self.settings.blank_cycles]
-        signal_raw = sample.timeseries_data.loc[
-            self.settings.signal_cycles[0] : self.settings.signal_cycles[1]
-        ]
-
-        blank_sample = Sample(
-            timeseries_data=blank_raw,
-            name=f"{sample.name} (blank)",
-            type=sample.type,
-            isotope_system=sample.isotope_system,
+    def correct(self, sample: Sample, plan: ProcessingPlan | None = None) -> Sample:
+        """Blank-correct a sample, using a compiled plan for its isotope system if given"""
+        plan = plan or compile_plan(
+            sample.isotope_system, self.settings.intensity_metric
         )
-        signal_sample = Sample(
-            timeseries_data=signal_raw,
-            name=f"{sample.name} (signal)",
-            type=sample.type,
-            isotope_system=sample.isotope_system,
+        windows = sample.windows or SampleWindows(
+            (1, self.settings.blank_cycles), self.settings.signal_cycles
         )
-
-        blank = self.remove_outliers(blank_sample, limit_hi=True)
-        signal = self.remove_outliers(signal_sample, limit_low=True)
-
-        sample.timeseries_data = (
-            signal.timeseries_data.select_dtypes("number")
-            - blank.timeseries_data.select_dtypes("number").mean()
+        blank_raw = sample.timeseries_data.loc[windows.blank[0] : windows.blank[1]]
+        signal_raw = sample.timeseries_data.loc[windows.signal[0] : windows.signal[1]]
+
+        blank = self.remove_outliers(
+            replace(sample, timeseries_data=blank_raw),
+            limit_hi=True,
+            window="blank",
+            plan=plan,
+        )
+        signal = self.remove_outliers(
+            replace(sample, timeseries_data=signal_raw),
+            limit_low=True,
+            window="signal",
+            plan=plan,
         )
 
-        return sample
+        # only the intensities; not e.g. the cycle times, parsed into integer nanoseconds
+        signal_data = signal.timeseries_data.select_dtypes("floating")
+        blank_data = blank.timeseries_data.select_dtypes("floating").astype(np.float64)
+        corrected = signal_data - blank_data.mean()
+        # kept in the dtype the intensities are stored in, e.g. float32
+        float32_columns = signal_data.select_dtypes(np.float32).columns
+        return replace(
+            sample,
+            timeseries_data=corrected.astype(
+                dict.fromkeys(float32_columns, np.float32)
+            ),
+        )
 
     def remove_outliers(
         self,
         sample: Sample,
         limit_hi: bool = False,
         limit_low: bool = False,
+        window: str = "",
+        plan: ProcessingPlan | None = None,
     ) -> Sample:
         """
-        Removes outliers from the sample data based on z-score and specified limits.
+        Removes outliers from the sample data based on the intensity limits and the outlier method.
         Args:
             sample (Sample): The sample data to process.
             limit_hi (bool, optional): Whether to apply the upper limit for outlier detection. Defaults to False.
             limit_low (bool, optional): Whether to apply the lower limit for outlier detection. Defaults to False.
+            window (str, optional): Which part of the sample the data is, e.g. "blank", for reporting. Defaults to "".
+            plan (ProcessingPlan, optional): The compiled plan for the sample's isotope system. Compiled if not given.
         Returns:
-            pd.DataFrame: A tuple containing a pandas Series with comments and a DataFrame with the cleaned data.
+            Sample: A new sample holding the retained cycles; the given sample is not modified.
         """
-        is_over_hi_limit = pd.Series([False] * len(sample.timeseries_data))
-        is_under_low_limit = pd.Series([False] * len(sample.timeseries_data))
+        plan = plan or compile_plan(
+            sample.isotope_system, self.settings.intensity_metric
+        )
+        n_cycles = len(sample.timeseries_data)
+        is_over_hi_limit = pd.Series(False, index=sample.timeseries_data.index)
+        is_under_low_limit = pd.Series(False, index=sample.timeseries_data.index)
 
         if limit_hi:
             metric = sample.timeseries_data[self.settings.intensity_metric]
             is_over_hi_limit = metric > self.settings.max_blank_intensity
             if is_over_hi_limit.all():
-                warnings.warn(
-                    f"All cycles in {sample.name} are above the given intensity threshold"
-                )
-                sample.timeseries_data.iloc[0:0]  # drop all rows
-                return sample
+                self._report(EventKind.ALL_ABOVE_THRESHOLD, sample.name, window)
+                self._record_retention([sample.name], window, [n_cycles], [0], [0])
+                return replace(sample, timeseries_data=sample.timeseries_data.iloc[0:0])
         if limit_low:
             metric = sample.timeseries_data[self.settings.intensity_metric]
             is_under_low_limit = metric < self.settings.min_signal_intensity
             if is_under_low_limit.all():
-                warnings.warn(
-                    f"All cycles in {sample.name} are below the given intensity threshold"
-                )
-                sample.timeseries_data.iloc[0:0]  # drop all rows
-                return sample
+                self._report(EventKind.ALL_BELOW_THRESHOLD, sample.name, window)
+                self._record_retention([sample.name], window, [n_cycles], [0], [0])
+                return replace(sample, timeseries_data=sample.timeseries_data.iloc[0:0])
 
         limited_data = sample.timeseries_data.loc[
             ~(is_over_hi_limit | is_under_low_limit), :
         ]
 
-        is_outlier = (
-            limited_data.loc[:, sample.isotope_system.get_intensity_columns()]
-            .apply(zscore, axis="index")
-            .apply(lambda x: x.abs(), axis="index")
-            > 3
-        )
-        has_outliers = is_outlier.any(axis="columns")
+        values = limited_data[list(plan.outlier_columns)]
+        has_outliers = self._find_outliers(
+            values.to_numpy(dtype=np.float64)[np.newaxis],
+            np.ones((1, len(values)), dtype=bool),
+        )[0]
 
         if has_outliers.sum() == len(limited_data):
-            warnings.warn(f"Removing outliers left zero cycles in {sample.name}")
-            sample.timeseries_data.iloc[0:0]  # drop all rows
-            return sample
+            self._report(EventKind.NO_CYCLES_LEFT, sample.name, window)
+            self._record_retention(
+                [sample.name],
+                window,
+                [n_cycles - len(limited_data)],
+                [len(limited_data)],
+                [0],
+            )
+            return replace(sample, timeseries_data=sample.timeseries_data.iloc[0:0])
 
-        sample.timeseries_data = limited_data.copy().loc[
-            ~has_outliers, :
-        ]  # .loc[[], :] to ensure df
+        cleaned_data = limited_data.loc[~has_outliers, :]  # .loc[[], :] to ensure df
 
-        if (
-            len(sample.timeseries_data)
-            < len(sample.timeseries_data) * self.settings.low_cycles_warning_frac
-        ):
-            warnings.warn(
-                f"Removing outliers left only {len(sample.timeseries_data)} cycles in {sample.name}"
+        if len(cleaned_data) < n_cycles * self.settings.low_cycles_warning_frac:
+            self._report(
+                EventKind.FEW_CYCLES_LEFT, sample.name, window, len(cleaned_data)
+            )
+        self._record_retention(
+            [sample.name],
+            window,
+            [n_cycles - len(limited_data)],
+            [len(limited_data) - len(cleaned_data)],
+            [len(cleaned_data)],
+        )
+
+        return replace(sample, timeseries_data=cleaned_data)
+
+    def correct_batch(
+        self, batch: SampleBatch, plan: ProcessingPlan | None = None
+    ) -> SampleBatch:
+        """Blank-correct every sample in a batch at once; the whole-run equivalent of `correct`. The plan must match the batch's columns."""
+        plan = plan or compile_plan(
+            batch.isotope_system, self.settings.intensity_metric, columns=batch.columns
+        )
+        return self.correct_batch_systems(batch, [plan])[0]
+
+    def correct_batch_systems(
+        self, batch: SampleBatch, plans: List[ProcessingPlan]
+    ) -> List[SampleBatch]:
+        """
+        Blank-correct every sample in a batch for several isotope systems at once.
+
+        The blank and signal windows and the intensity limits are applied once. Outliers are removed,
+        and the blank subtracted, for each system on its own columns, so each result is the same as
+        correcting that system alone. With more than one system, retention counts and outlier events
+        are labelled with the system name, e.g. "blank, Pb-Pb".
+        Args:
+            batch (SampleBatch): The samples to process, holding the columns of all the systems.
+            plans (List[ProcessingPlan]): The compiled plan of each system to correct for.
+        Returns:
+            List[SampleBatch]: A corrected batch for each system, holding the columns of its plan.
+        """
+        blank_window, signal_window = self.window_masks(batch)
+        blank_limited, blank_all_limited = self._limit_batch(
+            batch, blank_window, limit_hi=True, window="blank"
+        )
+        signal_limited, signal_all_limited = self._limit_batch(
+            batch, signal_window, limit_low=True, window="signal"
+        )
+
+        corrected = []
+        for plan in plans:
+            system_batch = batch
+            if list(plan.columns) != batch.columns:
+                system_batch = batch.select(list(plan.columns), plan.isotope_system)
+            elif plan.isotope_system is not batch.isotope_system:
+                system_batch = replace(batch, isotope_system=plan.isotope_system)
+            label = "" if len(plans) == 1 else f", {plan.isotope_system.name}"
+            blank_mask = self._reject_outliers_batch(
+                system_batch,
+                plan,
+                blank_window,
+                blank_limited,
+                blank_all_limited,
+                window="blank" + label,
+            )
+            signal_mask = self._reject_outliers_batch(
+                system_batch,
+                plan,
+                signal_window,
+                signal_limited,
+                signal_all_limited,
+                window="signal" + label,
             )
+            blank_mean = masked_mean(system_batch.data, blank_mask)
+            # subtracted in float64, a buffer at a time, into the dtype the intensities are stored in
+            data = np.empty_like(system_batch.data)
+            np.subtract(
+                system_batch.data,
+                blank_mean[:, np.newaxis, :],
+                out=data,
+                casting="same_kind",
+            )
+            corrected.append(replace(system_batch, data=data, cycle_mask=signal_mask))
+        return corrected
+
+    def window_masks(self, batch: SampleBatch) -> Tuple[np.ndarray, np.ndarray]:
+        """The blank and signal cycles of every sample in a batch, shape (samples, cycles): the sample's own windows if it has them, otherwise the settings'"""
+        bounds = np.array([1, self.settings.blank_cycles, *self.settings.signal_cycles])
+        if batch.windows is not None:
+            bounds = np.where(batch.windows >= 0, batch.windows, bounds)
+        bounds = np.broadcast_to(bounds, (len(batch.names), 4))
+
+        cycles = batch.cycles
+        blank_window = (
+            batch.cycle_mask & (cycles >= bounds[:, [0]]) & (cycles <= bounds[:, [1]])
+        )
+        signal_window = (
+            batch.cycle_mask & (cycles >= bounds[:, [2]]) & (cycles <= bounds[:, [3]])
+        )
+        return blank_window, signal_window
+
+    def remove_outliers_batch(
+        self,
+        batch: SampleBatch,
+        cycle_mask: np.ndarray,
+        limit_hi: bool = False,
+        limit_low: bool = False,
+        window: str = "",
+        plan: ProcessingPlan | None = None,
+    ) -> np.ndarray:
+        """
+        Removes outliers from every sample in a batch; the whole-run equivalent of `remove_outliers`.
+        Args:
+            batch (SampleBatch): The samples to process.
+            cycle_mask (np.ndarray): The cycles to consider, shape (samples, cycles).
+            limit_hi (bool, optional): Whether to apply the upper limit for outlier detection. Defaults to False.
+            limit_low (bool, optional): Whether to apply the lower limit for outlier detection. Defaults to False.
+            window (str, optional): Which part of the samples the cycles are, e.g. "blank", for reporting. Defaults to "".
+            plan (ProcessingPlan, optional): The compiled plan matching the batch's columns. Compiled if not given.
+        Returns:
+            np.ndarray: The retained cycles, shape (samples, cycles).
+        """
+        plan = plan or compile_plan(
+            batch.isotope_system, self.settings.intensity_metric, columns=batch.columns
+        )
+        limited, all_limited = self._limit_batch(
+            batch, cycle_mask, limit_hi, limit_low, window
+        )
+        return self._reject_outliers_batch(
+            batch, plan, cycle_mask, limited, all_limited, window
+        )
+
+    def _limit_batch(
+        self,
+        batch: SampleBatch,
+        cycle_mask: np.ndarray,
+        limit_hi: bool = False,
+        limit_low: bool = False,
+        window: str = "",
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Apply the intensity limits to a batch, returning the cycles within them and which samples have none"""
+        metric = batch.data[:, :, batch.column_index(self.settings.intensity_metric)]
+        limited = cycle_mask.copy()
+        all_limited = np.zeros(len(batch.names), dtype=bool)
+
+        if limit_hi:
+            is_over_hi_limit = metric > self.settings.max_blank_intensity
+            is_all_over = ~(cycle_mask & ~is_over_hi_limit).any(axis=1)
+            for i in np.flatnonzero(is_all_over):
+                self._report(EventKind.ALL_ABOVE_THRESHOLD, batch.names[i], window)
+            limited &= ~is_over_hi_limit
+            all_limited |= is_all_over
+        if limit_low:
+            is_under_low_limit = metric < self.settings.min_signal_intensity
+            is_all_under = ~(cycle_mask & ~is_under_low_limit).any(axis=1)
+            for i in np.flatnonzero(is_all_under):
+                self._report(EventKind.ALL_BELOW_THRESHOLD, batch.names[i], window)
+            limited &= ~is_under_low_limit
+            all_limited |= is_all_under
+
+        return limited, all_limited
+
+    def _reject_outliers_batch(
+        self,
+        batch: SampleBatch,
+        plan: ProcessingPlan,
+        cycle_mask: np.ndarray,
+        limited: np.ndarray,
+        all_limited: np.ndarray,
+        window: str,
+    ) -> np.ndarray:
+        """Drop the outliers from the cycles within the intensity limits, reporting what is left"""
+        kept = limited & ~self._find_outliers(
+            batch.data[:, :, plan.outlier_indices], limited
+        )
+
+        n_window = cycle_mask.sum(axis=1)
+        n_limited = limited.sum(axis=1)
+        n_kept = kept.sum(axis=1)
+        for i in np.flatnonzero((n_kept == 0) & ~all_limited):
+            self._report(EventKind.NO_CYCLES_LEFT, batch.names[i], window)
+        is_few = (n_kept > 0) & (
+            n_kept < n_window * self.settings.low_cycles_warning_frac
+        )
+        for i in np.flatnonzero(is_few):
+            self._report(EventKind.FEW_CYCLES_LEFT, batch.names[i], window, n_kept[i])
+        self._record_retention(
+            batch.names, window, n_window - n_limited, n_limited - n_kept, n_kept
+        )
+
+        return kept
 
-        return sample
+    def _find_outliers(self, values: np.ndarray, cycle_mask: np.ndarray) -> np.ndarray:
+        """Find outlying cycles with the configured method; see `find_outliers`"""
+        return find_outliers(
+            values,
+            cycle_mask,
+            self.settings.outlier_method,
+            self.settings.outlier_threshold,
+            self.settings.outlier_max_iterations,
+        )
+
+    def _report(
+        self, kind: EventKind, name: str, window: str, n_cycles: int = 0
+    ) -> None:
+        """Send an event about a sample to the sink"""
+        label = f"{name} ({window})" if window else name
+        messages = {
+            EventKind.ALL_ABOVE_THRESHOLD: f"All cycles in {label} are above the given intensity threshold",
+            EventKind.ALL_BELOW_THRESHOLD: f"All cycles in {label} are below the given intensity threshold",
+            EventKind.NO_CYCLES_LEFT: f"Removing outliers left zero cycles in {label}",
+            EventKind.FEW_CYCLES_LEFT: f"Removing outliers left only {n_cycles} cycles in {label}",
+        }
+        self.sink.event(ProcessingEvent(kind, name, window, messages[kind]))
+
+    def _record_retention(
+        self,
+        names: List[str],
+        window: str,
+        threshold_dropped: Sequence[int],
+        outlier_dropped: Sequence[int],
+        kept: Sequence[int],
+    ) -> None:
+        """Send cycle retention counts to the sink, if it wants them"""
+        if self.sink.wants_retention:
+            self.sink.cycle_retention(
+                CycleRetention(
+                    window=window,
+                    names=list(names),
+                    threshold_dropped=np.asarray(threshold_dropped),
+                    outlier_dropped=np.asarray(outlier_dropped),
+                    kept=np.asarray(kept),
+                )
+            )
 
 
 class RatioCalculator:
     """Calculates isotope ratios for any isotope system"""
 
-    def reduce(self, sample: Sample) -> Sample:
-        """Calculate all ratios and statistics for a sample"""
+    def reduce(self, sample: Sample, plan: ProcessingPlan | None = None) -> Sample:
+        """Calculate all ratios and statistics for a sample, using a compiled plan for its isotope system if given"""
+        plan = plan or compile_plan(sample.isotope_system)
+        mean, sem = self.reduce_values(sample, plan)
+        return replace(
+            sample,
+            reduced_data=pd.Series(interleave_statistics(plan.ratio_names, mean, sem)),
+        )
+
+    def reduce_values(
+        self, sample: Sample, plan: ProcessingPlan | None = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate the mean and standard error of each ratio of a sample, as arrays in the order of the isotope system's ratios"""
         timeseries_ratios = self._calculate_ratios(
-            sample.timeseries_data, sample.isotope_system
+            sample.timeseries_data, plan or compile_plan(sample.isotope_system)
         )
-        sample.reduced_data = self._calculate_statistics(timeseries_ratios)
-        return sample
+        return self._calculate_statistics(timeseries_ratios)
 
-    def strip_peaks(self, sample: Sample) -> Sample:
+    def strip_peaks(self, sample: Sample, plan: ProcessingPlan | None = None) -> Sample:
         """Account for isobaric interferences by peak-stripping, as defined in sample.isotope_system"""
-        if sample.isotope_system.peak_strip is None:
+        plan = plan or compile_plan(sample.isotope_system)
+        if not plan.strips_peaks:
             raise ValueError("No peak strip settings defined for isotope system")
 
-        peak_strip = sample.isotope_system.peak_strip
-
-        known_denominator_values = sample.timeseries_data[
-            peak_strip.known_isotope_ratio.denominator
-        ]
-        known_numerator_values = (
-            known_denominator_values * peak_strip.known_isotope_ratio_value
+        sources = sample.timeseries_data[list(plan.interference_sources)].to_numpy(
+            dtype=np.float64
+        )
+        corrected = sources @ plan.interference_matrix.T
+        data = sample.timeseries_data
+        return replace(
+            sample,
+            # kept in the dtype the intensities are stored in, e.g. float32
+            timeseries_data=data.assign(
+                **{
+                    target: values.astype(data[target].dtype)
+                    for target, values in zip(plan.interference_targets, corrected.T)
+                }
+            ),
         )
 
-        target_values = (
-            sample.timeseries_data[peak_strip.target_isotope] - known_numerator_values
+    def reduce_batch(
+        self, batch: SampleBatch, plan: ProcessingPlan | None = None
+    ) -> pd.DataFrame:
+        """Calculate all ratios and statistics for every sample in a batch; rows follow the batch order. The plan must match the batch's columns."""
+        plan = plan or compile_plan(batch.isotope_system, columns=batch.columns)
+        mean, sem = self.reduce_batch_values(batch, plan)
+        return pd.DataFrame(interleave_statistics(plan.ratio_names, mean, sem))
+
+    def reduce_batch_values(
+        self, batch: SampleBatch, plan: ProcessingPlan | None = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate the mean and standard error of each ratio of every sample in a batch, as (samples, ratios) arrays"""
+        timeseries_ratios = self.ratios_batch(batch, plan)
+        return self._calculate_statistics_batch(timeseries_ratios, batch.cycle_mask)
+
+    def ratios_batch(
+        self, batch: SampleBatch, plan: ProcessingPlan | None = None
+    ) -> np.ndarray:
+        """Calculate every ratio of every cycle in a batch, as a (samples, cycles, ratios) array"""
+        plan = plan or compile_plan(batch.isotope_system, columns=batch.columns)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.divide(
+                batch.data[:, :, plan.numerator_indices],
+                batch.data[:, :, plan.denominator_indices],
+                dtype=np.float64,
+            )
+
+    def strip_peaks_batch(
+        self, batch: SampleBatch, plan: ProcessingPlan | None = None
+    ) -> SampleBatch:
+        """Account for isobaric interferences in every sample in a batch; the whole-run equivalent of `strip_peaks`. The plan must match the batch's columns."""
+        plan = plan or compile_plan(batch.isotope_system, columns=batch.columns)
+        if not plan.strips_peaks:
+            raise ValueError("No peak strip settings defined for isotope system")
+
+        # all the corrections of every cycle of the run in one matrix multiply
+        data = batch.data.copy()
+        data[:, :, plan.interference_target_indices] = (
+            batch.data[:, :, plan.interference_source_indices]
+            @ plan.interference_matrix.T
         )
-        sample.timeseries_data[peak_strip.target_isotope] = target_values
-        return sample
+        return replace(batch, data=data)
 
     def _calculate_ratios(
-        self, ts_data: pd.DataFrame, isotope_system: IsotopeSystem
+        self, ts_data: pd.DataFrame, plan: ProcessingPlan
     ) -> pd.DataFrame:
         """Calculate all defined ratios for the isotope system"""
-        ratios = {}
-        for ratio in isotope_system.ratios:
-            ratios[ratio.name] = ts_data[ratio.numerator] / ts_data[ratio.denominator]
-
-        return pd.DataFrame(ratios)
-
-    def _calculate_statistics(self, ratios: pd.DataFrame) -> pd.Series:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratios = ts_data[list(plan.numerator_columns)].to_numpy(
+                dtype=np.float64
+            ) / ts_data[list(plan.denominator_columns)].to_numpy(dtype=np.float64)
+        return pd.DataFrame(ratios, index=ts_data.index, columns=list(plan.ratio_names))
+
+    def _calculate_statistics(
+        self, ratios: pd.DataFrame
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """Calculate mean and standard error for all ratios"""
-        stats = {}
-        for col in ratios.columns:
-            stats[col] = ratios[col].mean()
-            stats[f"{col}_err"] = ratios[col].sem(ddof=0)
-        return pd.Series(stats)
+        return (
+            ratios.mean().to_numpy(dtype=np.float64),
+            ratios.sem(ddof=0).to_numpy(dtype=np.float64),
+        )
+
+    def _calculate_statistics_batch(
+        self, ratios: np.ndarray, cycle_mask: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate mean and standard error for all ratios of all samples, skipping NaN like pandas"""
+        selected = cycle_mask[:, :, np.newaxis] & ~np.isnan(ratios)
+        count = selected.sum(axis=1)
+        mean = masked_mean(ratios, cycle_mask)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            deviation = np.where(selected, ratios - mean[:, np.newaxis, :], 0.0)
+            sem = np.sqrt((deviation**2).sum(axis=1) / count) / np.sqrt(count)
+        return mean, sem
+
+
+@dataclass
+class Bracketing:
+    """
+    The standards either side of each unknown in a run, as found by `MassBiasCorrector.bracket`.
+
+    Attributes:
+        unknown_indices (np.ndarray): The position of each unknown in the run.
+        prev_indices (np.ndarray): The position of the standard before each unknown.
+        next_indices (np.ndarray): The position of the standard after each unknown.
+        weight_next (np.ndarray): The weight given to the standard after each unknown; the one before gets the rest.
+        is_after_last (np.ndarray): Whether each unknown is after the last standard.
+    """
+
+    unknown_indices: np.ndarray
+    prev_indices: np.ndarray
+    next_indices: np.ndarray
+    weight_next: np.ndarray
+    is_after_last: np.ndarray
 
 
 class MassBiasCorrector:
-    """Handles mass bias corrections using sample-standard bracketing"""
+    """
+    Handles mass bias corrections using sample-standard bracketing
+
+    Attributes:
+        ref_mat (ReferenceMaterial): The reference material used as the bracketing standard.
+        weighting (str): How to combine the standards either side of an unknown: "mean" (their plain
+            mean), "run_order" (interpolate linearly by position in the run) or "time" (interpolate
+            linearly by acquisition time). Defaults to "mean".
+        sink (InstrumentationSink): Receives events. Defaults to a WarningSink.
+    """
 
-    def __init__(self, ref_mat: ReferenceMaterial):
+    WEIGHTINGS = ("mean", "run_order", "time")
+
+    def __init__(
+        self,
+        ref_mat: ReferenceMaterial,
+        weighting: str = "mean",
+        sink: InstrumentationSink | None = None,
+    ):
+        if weighting not in self.WEIGHTINGS:
+            raise ValueError(
+                f"Unknown bracketing weighting '{weighting}', expected one of {self.WEIGHTINGS}"
+            )
         self.ref_mat = ref_mat
+        self.weighting = weighting
+        self.sink = sink if sink is not None else WarningSink()
 
-    def correct(self, measurements: List[Sample]) -> List[Sample]:
-        standard_row_indexes = [
-            i for i, sample in enumerate(measurements) if sample.type == "standard"
-        ]
+    def correct(
+        self,
+        measurements: List[Sample],
+        acquisition_times: Sequence[float] | None = None,
+        plan: ProcessingPlan | None = None,
+    ) -> List[Sample]:
+        """Correct the unknowns in a run, given in run order, and return them as new samples. Time weighting uses the samples' own acquisition times unless others are given."""
+        if any(measurement.reduced_data is None for measurement in measurements):
+            raise ValueError("Measurement data is missing")
 
-        if len(standard_row_indexes) == 0:
-            raise ValueError("No standards found in dataset")
+        plan = plan or compile_plan(
+            measurements[0].isotope_system, reference_material=self.ref_mat
+        )
+        ratio_names = list(plan.ratio_names)
+        reduced = pd.DataFrame(
+            [measurement.reduced_data for measurement in measurements]
+        )
+        is_standard = np.array([m.type == "standard" for m in measurements])
+        if acquisition_times is None and all(
+            m.acquisition_time is not None for m in measurements
+        ):
+            acquisition_times = [m.acquisition_time for m in measurements]
+
+        corrected_values = self.correct_arrays(
+            reduced[ratio_names].to_numpy(dtype=np.float64),
+            is_standard,
+            ratio_names,
+            acquisition_times,
+            names=[m.name for m in measurements],
+            reference_values=plan.reference_values,
+        )
+        errors = reduced.loc[~is_standard, [f"{name}_err" for name in ratio_names]]
 
-        prev_std = measurements[standard_row_indexes[0]]
         results: List[Sample] = []
+        unknowns = [m for m in measurements if m.type != "standard"]
+        for measurement, values, errs in zip(
+            unknowns, corrected_values, errors.to_numpy(dtype=np.float64)
+        ):
+            corrected_data: dict[str, float] = {}
+            for name, value, err in zip(ratio_names, values, errs):
+                corrected_data[name] = value
+                corrected_data[f"{name}_err"] = err
+            results.append(replace(measurement, reduced_data=pd.Series(corrected_data)))
 
-        for run_order_number, measurement in enumerate(measurements):
+        return results
 
-            if measurement.type == "standard":
-                prev_std = measurement
-                continue
+    def correct_arrays(
+        self,
+        values: np.ndarray,
+        is_standard: np.ndarray,
+        ratio_names: List[str],
+        acquisition_times: Sequence[float] | None = None,
+        names: Sequence[str] | None = None,
+        reference_values: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Mass bias correct the mean ratios of a whole run at once.
 
-            # Get interpolated standard values
-            standard_values = self._get_standard_values(
-                run_order_number, measurements, standard_row_indexes, prev_std
+        Unknowns before the first standard, or after the last one, are corrected using only that standard.
+        Args:
+            values (np.ndarray): The mean ratios of every measurement, shape (measurements, ratios), in run order.
+            is_standard (np.ndarray): Whether each measurement is a standard, shape (measurements,).
+            ratio_names (List[str]): The names of the ratios, in the order of the columns of `values`.
+            acquisition_times (Sequence[float], optional): The acquisition time of each measurement, needed for time weighting.
+            names (Sequence[str], optional): The name of each measurement, for reporting.
+            reference_values (np.ndarray, optional): The reference value of each ratio, e.g. from a compiled plan. Looked up in the reference material if not given.
+        Returns:
+            np.ndarray: The corrected ratios of the unknowns, shape (unknowns, ratios), in run order.
+        """
+        bracketing = self.bracket(is_standard, acquisition_times)
+        for i in bracketing.unknown_indices[bracketing.is_after_last]:
+            self.sink.event(
+                ProcessingEvent(
+                    EventKind.AFTER_LAST_STANDARD,
+                    names[i] if names is not None else None,
+                    "",
+                    "Samples or controls present after the last standard: using only the preceeding standard",
+                )
             )
 
-            # Apply corrections
-            results.append(self._apply_correction(measurement, standard_values))
-
-        return results
+        if reference_values is None:
+            reference_values = self._reference_values(ratio_names)
+        return self.correct_draws(values, bracketing, reference_values)
 
-    def _get_standard_values(
+    def bracket(
         self,
-        run_order_index: int,
-        run_data: List[Sample],
-        standard_indices: List[int],
-        prev_std: Sample,
-    ) -> pd.Series:
-        """For an analysis in the run, get the next standard, and return the mean of that and the previous standard."""
-
-        if run_order_index >= standard_indices[-1]:
-            warnings.warn(
-                "Samples or controls present after the last standard: using only the preceeding standard"
-            )
-            if prev_std.reduced_data is None:
-                raise ValueError(
-                    "Previous standard reduced data is missing"
-                    + f"(measurement '{run_order_index}' in the run)"
-                )
-            return prev_std.reduced_data
-
-        next_std_idx = min(idx for idx in standard_indices if idx > run_order_index)
-        next_std = run_data[next_std_idx]
+        is_standard: np.ndarray,
+        acquisition_times: Sequence[float] | None = None,
+    ) -> Bracketing:
+        """
+        Find the standards either side of each unknown in a run, and the weight given to each.
 
-        stds = pd.concat(
-            [prev_std.reduced_data, next_std.reduced_data], axis="columns"
-        ).T
-        return stds.mean()
+        Unknowns before the first standard, or after the last one, get only that standard.
+        Args:
+            is_standard (np.ndarray): Whether each measurement is a standard, shape (measurements,), in run order.
+            acquisition_times (Sequence[float], optional): The acquisition time of each measurement, needed for time weighting.
+        Returns:
+            Bracketing: The bracketing standards of each unknown.
+        """
+        standard_indices = np.flatnonzero(is_standard)
+        unknown_indices = np.flatnonzero(~is_standard)
+        if len(standard_indices) == 0:
+            raise ValueError("No standards found in dataset")
 
-    def _apply_correction(
-        self, measurement: Sample, standard_data: pd.Series
-    ) -> Sample:
-        """Apply mass bias correction to sample using standard values"""
-        if measurement.reduced_data is None:
-            raise ValueError("Measurement data is missing")
+        # position of the next standard in standard_indices for each unknown
+        next_std = np.searchsorted(standard_indices, unknown_indices)
+        prev_std = next_std - 1
+        is_after_last = next_std == len(standard_indices)
+        is_before_first = prev_std < 0
+        next_std = np.minimum(next_std, len(standard_indices) - 1)
+        prev_std = np.maximum(prev_std, 0)
+
+        weight_next = self._next_standard_weights(
+            len(is_standard),
+            standard_indices[prev_std],
+            standard_indices[next_std],
+            unknown_indices,
+            acquisition_times,
+        )
+        weight_next[is_before_first] = 1.0
+        weight_next[is_after_last] = 0.0
+
+        return Bracketing(
+            unknown_indices=unknown_indices,
+            prev_indices=standard_indices[prev_std],
+            next_indices=standard_indices[next_std],
+            weight_next=weight_next,
+            is_after_last=is_after_last,
+        )
 
-        if standard_data is None:
-            raise ValueError("Standard data is missing")
+    def correct_draws(
+        self,
+        values: np.ndarray,
+        bracketing: Bracketing,
+        reference_values: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Apply the mass bias correction to the mean ratios of a run, or to many draws of them at once.
+        Args:
+            values (np.ndarray): The mean ratios, shape (..., measurements, ratios).
+            bracketing (Bracketing): The bracketing standards of each unknown, from `bracket`.
+            reference_values (np.ndarray): The reference value of each ratio, shape (..., ratios).
+        Returns:
+            np.ndarray: The corrected ratios of the unknowns, shape (..., unknowns, ratios).
+        """
+        standard_values = self._interpolate(
+            values[..., bracketing.prev_indices, :],
+            values[..., bracketing.next_indices, :],
+            bracketing.weight_next,
+        )
+        return (
+            values[..., bracketing.unknown_indices, :]
+            / standard_values
+            * reference_values[..., np.newaxis, :]
+        )
 
-        corrected_data: dict[str, float] = {}
+    def _next_standard_weights(
+        self,
+        n_measurements: int,
+        prev_indices: np.ndarray,
+        next_indices: np.ndarray,
+        unknown_indices: np.ndarray,
+        acquisition_times: Sequence[float] | None,
+    ) -> np.ndarray:
+        """The weight given to the next standard (the previous one gets the rest) for each unknown"""
+        if self.weighting == "mean":
+            return np.full(len(unknown_indices), 0.5)
+
+        if self.weighting == "time":
+            if acquisition_times is None:
+                raise ValueError("Time weighted bracketing needs acquisition times")
+            positions = np.asarray(acquisition_times, dtype=np.float64)
+        else:
+            positions = np.arange(n_measurements, dtype=np.float64)
+
+        prev_positions = positions[prev_indices]
+        span = positions[next_indices] - prev_positions
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weights = (positions[unknown_indices] - prev_positions) / span
+        # both the same standard at the run ends
+        return np.where(span > 0, weights, 0.5)
+
+    def _interpolate(
+        self, prev_values: np.ndarray, next_values: np.ndarray, weight_next: np.ndarray
+    ) -> np.ndarray:
+        """Weighted mean of the bracketing standards, using only one if the other is missing (NaN)"""
+        weight_next = weight_next[:, np.newaxis]
+        prev_weights = np.where(np.isnan(prev_values), 0.0, 1.0 - weight_next)
+        next_weights = np.where(np.isnan(next_values), 0.0, weight_next)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (
+                prev_weights * np.where(np.isnan(prev_values), 0.0, prev_values)
+                + next_weights * np.where(np.isnan(next_values), 0.0, next_values)
+            ) / (prev_weights + next_weights)
+
+    def _reference_values(self, ratio_names: List[str]) -> np.ndarray:
+        """The reference material's value for each ratio, as a vector"""
+        return np.array(
+            [self.ref_mat.get_value(name).value for name in ratio_names],
+            dtype=np.float64,
+        )
 
-        for ratio in measurement.isotope_system.ratios:
-            corrected_data[ratio.name] = (
-                measurement.reduced_data[ratio.name]
-                / standard_data[ratio.name]
-                * self.ref_mat.get_value(ratio.name).value
-            )
-            corrected_data[f"{ratio.name}_err"] = measurement.reduced_data[
-                f"{ratio.name}_err"
-            ].item()
 
-        measurement.reduced_data = pd.Series(corrected_data)
-        return measurement
+def interleave_statistics(
+    ratio_names: Sequence[str], mean: np.ndarray, sem: np.ndarray
+) -> dict:
+    """Pair up the means and standard errors of ratios (the last axis) as {ratio: mean, ratio_err: sem, ...}"""
+    stats = {}
+    for i, name in enumerate(ratio_names):
+        # a float, not a 0-d array, for the ratios of a single sample
+        stats[name] = np.take(mean, i, axis=-1)
+        stats[f"{name}_err"] = np.take(sem, i, axis=-1)
+    return stats
+
+
+def masked_mean(values: np.ndarray, cycle_mask: np.ndarray) -> np.ndarray:
+    """
+    Mean over the cycle axis of (samples, cycles, columns) values, using only masked cycles and skipping NaN.
+
+    The masking rule of every stage that averages cycles, e.g. blanks and ratios, so they all agree.
+
+    Args:
+        values (np.ndarray): The values, shape (samples, cycles, columns).
+        cycle_mask (np.ndarray): The cycles to use, shape (samples, cycles).
+    Returns:
+        np.ndarray: The means, shape (samples, columns), in float64; NaN where no cycle is used.
+    """
+    selected = cycle_mask[:, :, np.newaxis] & ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(selected, values, 0.0).sum(
+            axis=1, dtype=np.float64
+        ) / selected.sum(axis=1)
@@ -0,0 +1,255 @@
+"""
+Split long time-resolved files holding many analyses in a row, such as a laser ablation session, into
+samples, reading them a chunk at a time so even very large files are never loaded whole.
+"""
+
+import itertools
+import os
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from icpmsprocess.mstypes import (
+    IsotopeSystem,
+    Sample,
+    SampleWindows,
+    SegmentationSettings,
+)
+from icpmsprocess.utils import (
+    check_storage_dtype,
+    match_sample_map,
+    not_before,
+    processing_columns,
+    to_storage_dtype,
+    parse_cycle_times,
+)
+
+_OTHER, _BLANK, _SIGNAL = 0, 1, 2
+
+
+def segment_samples(
+    filepath: str,
+    sample_map_path: str,
+    isotope_system: IsotopeSystem,
+    settings: SegmentationSettings,
+    header_row: int = 22,
+    comment_char: str = "*",
+    index_col: str = "Cycle",
+    time_col: str | None = "Time",
+    separator: str = "\t",
+    chunk_cycles: int = 10_000,
+    storage_dtype: str = "float64",
+) -> Iterator[Sample]:
+    """
+    Read the analyses in a long data file as samples, each with its own blank and signal windows.
+
+    The file is read `chunk_cycles` at a time, keeping only the columns needed for processing, and
+    each analysis is yielded as soon as the blank after it starts, so memory use depends on the length
+    of an analysis, not of the file. Before any analysis is yielded, the intensity metric alone is read
+    through once to check the sample map lists as many analyses as the file holds.
+
+    The cycles are told apart by `settings.intensity_metric`: those at or below `blank_threshold` are
+    blank and those at or above `signal_threshold` are signal. An analysis is a run of at least
+    `min_blank_cycles` blank cycles, then everything up to the next such run, as long as it holds a run
+    of at least `min_signal_cycles` signal cycles. Its signal window spans its signal runs, less
+    `trim_cycles` at each end; shorter dips and spikes inside it are left to the intensity limits and
+    outlier removal when processing. A signal with no blank before it, at the start of the file, is
+    skipped.
+
+    The samples keep the file's cycle numbers, and their windows (`Sample.windows`) are used instead
+    of the blank and signal cycles of the processing settings, so they can be processed as they are,
+    e.g. `DataProcessor(...).process_batch(list(segment_samples(...)))`.
+
+    Parameters:
+    - filepath (str): The data file.
+    - sample_map_path (str): The path to a CSV file with a "sample_name" and "type" for each analysis, in the order they were acquired. If it has a "file_name" column, only the rows naming this file (with or without its extension) are used.
+    - isotope_system (IsotopeSystem): The isotope system to be used for the samples.
+    - settings (SegmentationSettings): How to tell the blanks and signals apart.
+    - header_row, comment_char, index_col, time_col: As for `load_samples`.
+    - separator (str, optional): The column separator. Defaults to a tab.
+    - chunk_cycles (int, optional): The number of cycles to read at a time. Defaults to 10,000.
+    - storage_dtype (str, optional): As for `load_samples`. Defaults to "float64".
+    Yields:
+    - Sample: The analyses, in the order they were acquired.
+    """
+    check_storage_dtype(storage_dtype)
+    if settings.min_signal_cycles <= 2 * settings.trim_cycles:
+        raise ValueError("min_signal_cycles must be more than twice trim_cycles")
+
+    sample_map = _sample_map_rows(pd.read_csv(sample_map_path), filepath)
+    names, types = list(sample_map.sample_name), list(sample_map.type)
+    wanted = {index_col, time_col} | set(
+        processing_columns([isotope_system], settings.intensity_metric)
+    )
+
+    n_analyses = _count_analyses(
+        filepath, settings, header_row, comment_char, index_col, separator, chunk_cycles
+    )
+    if n_analyses != len(names):
+        raise ValueError(
+            f"Found {n_analyses} analyses in {filepath}, but the sample map lists {len(names)}"
+        )
+
+    n_samples = 0
+    pending = None  # the cycles read but not yet yielded as part of a sample
+    last_time = None
+    reader = pd.read_table(
+        filepath,
+        header=header_row,
+        comment=comment_char,
+        index_col=index_col,
+        usecols=lambda column: column in wanted,
+        sep=separator,
+        chunksize=chunk_cycles,
+    )
+    with reader:
+        # a last pass with no new cycles completes the final analysis
+        for chunk in itertools.chain(reader, [None]):
+            final = chunk is None
+            if final:
+                if pending is None:
+                    break
+            else:
+                if time_col in chunk.columns and not pd.api.types.is_numeric_dtype(
+                    chunk[time_col]
+                ):
+                    times = parse_cycle_times(chunk[time_col].to_numpy())
+                    times += not_before(int(times[0]), last_time) - times[0]
+                    chunk[time_col] = times
+                    last_time = int(times[-1])
+                chunk = to_storage_dtype(chunk, storage_dtype, time_col)
+                pending = chunk if pending is None else pd.concat([pending, chunk])
+
+            segments, consumed = _find_segments(
+                pending[settings.intensity_metric].to_numpy(), settings, final
+            )
+            for segment in segments:
+                yield _to_sample(
+                    pending,
+                    segment,
+                    names,
+                    types,
+                    n_samples,
+                    isotope_system,
+                    time_col,
+                )
+                n_samples += 1
+            pending = pending.iloc[consumed:]
+
+
+def _count_analyses(
+    filepath: str,
+    settings: SegmentationSettings,
+    header_row: int,
+    comment_char: str,
+    index_col: str,
+    separator: str,
+    chunk_cycles: int,
+) -> int:
+    """Count the analyses in a file as `segment_samples` finds them, reading only the intensity metric"""
+    n_analyses = 0
+    pending = np.empty(0)
+    reader = pd.read_table(
+        filepath,
+        header=header_row,
+        comment=comment_char,
+        index_col=index_col,
+        usecols=[index_col, settings.intensity_metric],
+        sep=separator,
+        chunksize=chunk_cycles,
+    )
+    with reader:
+        for chunk in itertools.chain(reader, [None]):
+            final = chunk is None
+            if not final:
+                metric = chunk[settings.intensity_metric].to_numpy()
+                pending = np.concatenate([pending, metric])
+            if len(pending) == 0:
+                continue
+            segments, consumed = _find_segments(pending, settings, final)
+            n_analyses += len(segments)
+            pending = pending[consumed:]
+    return n_analyses
+
+
+def _find_segments(
+    metric: np.ndarray, settings: SegmentationSettings, final: bool
+) -> Tuple[List[Tuple[int, int, int, int]], int]:
+    """
+    Find the complete analyses in a stretch of cycles.
+
+    Returns the first and last blank and signal cycle of each (as positions), and how many cycles
+    from the start are no longer needed. Unless `final`, the last run of cycles may carry on in the
+    next chunk, so an analysis is only complete once the blank after it is long enough to count.
+    """
+    kind = np.where(
+        metric >= settings.signal_threshold,
+        _SIGNAL,
+        np.where(metric <= settings.blank_threshold, _BLANK, _OTHER),
+    )
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(kind)) + 1])
+    lengths = np.diff(np.append(starts, len(kind)))
+    kinds = kind[starts]
+    is_blank = (kinds == _BLANK) & (lengths >= settings.min_blank_cycles)
+    is_signal = (kinds == _SIGNAL) & (lengths >= settings.min_signal_cycles)
+
+    segments = []
+    blank = signal = None
+    # before a blank is found, only the last run (which could still grow into one) is needed
+    consumed = starts[-1] if len(kind) > 0 else 0
+    for i in np.flatnonzero(is_blank | is_signal):
+        start, end = starts[i], starts[i] + lengths[i] - 1
+        if is_blank[i]:
+            if signal is not None:
+                segments.append((*blank, *signal))
+                signal = None
+            blank = (start, end)
+            consumed = start
+        elif blank is not None:
+            signal = (start if signal is None else signal[0], end)
+
+    if final and blank is not None and signal is not None:
+        segments.append((*blank, *signal))
+        consumed = len(kind)
+    trim = settings.trim_cycles
+    return [(b0, b1, s0 + trim, s1 - trim) for b0, b1, s0, s1 in segments], consumed
+
+
+def _to_sample(
+    data: pd.DataFrame,
+    segment: Tuple[int, int, int, int],
+    names: List[str],
+    types: List[str],
+    i: int,
+    isotope_system: IsotopeSystem,
+    time_col: str | None,
+) -> Sample:
+    """Make the i-th analysis of a file into a sample"""
+    blank_start, blank_end, signal_start, signal_end = segment
+    timeseries_data = data.iloc[blank_start : signal_end + 1].copy()
+    cycles = data.index
+    acquisition_time = None
+    if time_col in timeseries_data.columns:
+        acquisition_time = int(timeseries_data[time_col].iloc[0])
+
+    return Sample(
+        name=names[i],
+        type=types[i],
+        isotope_system=isotope_system,
+        timeseries_data=timeseries_data,
+        acquisition_time=acquisition_time,
+        windows=SampleWindows(
+            blank=(int(cycles[blank_start]), int(cycles[blank_end])),
+            signal=(int(cycles[signal_start]), int(cycles[signal_end])),
+        ),
+    )
+
+
+def _sample_map_rows(sample_map: pd.DataFrame, filepath: str) -> pd.DataFrame:
+    """The sample map rows of the analyses in a file"""
+    if "file_name" not in sample_map.columns:
+        return sample_map
+    file_ext = os.path.splitext(filepath)[1]
+    rows = match_sample_map([filepath], sample_map, file_ext, fallback=False)[0]
+    return sample_map.iloc[rows]
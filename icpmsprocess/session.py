@@ -0,0 +1,172 @@
+import json
+import struct
+from dataclasses import asdict
+
+import numpy as np
+
+from icpmsprocess.mstypes import (
+    IsotopeRatio,
+    IsotopeSystem,
+    PeakStripSettings,
+    RunStore,
+    SampleInfo,
+    SampleWindows,
+)
+from icpmsprocess.utils import load_run_store
+
+MAGIC = b"ICPMSRUN"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sIQ")  # magic, version, header length
+_ALIGNMENT = 64
+
+
+def convert_session(
+    data_dir: str, sample_map_path: str, session_path: str, **kwargs
+) -> RunStore:
+    """
+    Pack a session of data files into a single session file, which can be reopened with `open_session`.
+
+    Parameters:
+    - data_dir (str): The directory containing the sample data files.
+    - sample_map_path (str): The path to the CSV file containing the sample map.
+    - session_path (str): The path of the session file to write.
+    - **kwargs: Passed on to `load_samples`; `isotope_system` is required.
+    Returns:
+    - RunStore: The loaded session.
+    """
+    store = load_run_store(data_dir, sample_map_path, **kwargs)
+    save_session(store, session_path)
+    return store
+
+
+def save_session(store: RunStore, session_path: str) -> None:
+    """
+    Write a RunStore to a single session file.
+
+    The file starts with a JSON header describing the samples (names, types, acquisition times, windows), columns and isotope
+    system, and where each array is in the file. The arrays follow, little-endian and aligned, so the
+    file can be memory-mapped.
+    """
+    arrays = {
+        # float64 or float32, as stored
+        "data": np.ascontiguousarray(
+            store.data, dtype=store.data.dtype.newbyteorder("<")
+        ),
+        "cycles": np.ascontiguousarray(store.cycles, dtype="<i8"),
+        "offsets": np.ascontiguousarray(store.offsets, dtype="<i8"),
+        "lengths": np.ascontiguousarray(store.lengths, dtype="<i8"),
+    }
+    header = {
+        "isotope_system": asdict(store.isotope_system),
+        "columns": store.columns,
+        "index_name": store.index_name,
+        "samples": [
+            [
+                info.name,
+                info.type,
+                info.acquisition_time,
+                None if info.windows is None else asdict(info.windows),
+            ]
+            for info in store.info
+        ],
+        "arrays": {},
+    }
+
+    # array positions depend on the header length, which depends on the positions, so lay out the
+    # arrays after a header with placeholder positions longer than any real one
+    header["arrays"] = {
+        name: {"dtype": arr.dtype.str, "shape": arr.shape, "offset": 10**20}
+        for name, arr in arrays.items()
+    }
+    position = _align(_PREAMBLE.size + len(json.dumps(header).encode()))
+    for name, arr in arrays.items():
+        header["arrays"][name]["offset"] = position
+        position = _align(position + arr.nbytes)
+
+    header_bytes = json.dumps(header).encode()
+    with open(session_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            arr.tofile(f)
+
+
+def open_session(session_path: str) -> RunStore:
+    """
+    Open a session file as a RunStore, without reading its data.
+
+    The arrays are memory-mapped read-only, so samples and batches are views of the file and only the
+    parts that are used are read from disk.
+    """
+    with open(session_path, "rb") as f:
+        magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"'{session_path}' is not an icpmsprocess session file")
+        if version != VERSION:
+            raise ValueError(
+                f"Unsupported session file version {version} in '{session_path}'"
+            )
+        header = json.loads(f.read(header_length))
+
+    arrays = {
+        name: np.memmap(
+            session_path,
+            dtype=np.dtype(spec["dtype"]),
+            mode="r",
+            offset=spec["offset"],
+            shape=tuple(spec["shape"]),
+        )
+        for name, spec in header["arrays"].items()
+    }
+
+    return RunStore(
+        isotope_system=_isotope_system_from_dict(header["isotope_system"]),
+        info=[_sample_info(*sample) for sample in header["samples"]],
+        columns=header["columns"],
+        data=arrays["data"],
+        cycles=arrays["cycles"],
+        offsets=arrays["offsets"],
+        lengths=arrays["lengths"],
+        index_name=header["index_name"],
+    )
+
+
+def _sample_info(
+    name: str,
+    type_: str,
+    acquisition_time: int | None = None,
+    windows: dict | None = None,
+) -> SampleInfo:
+    """Rebuild a sample's metadata from the header; files written by earlier versions have just the name and type"""
+    if windows is not None:
+        windows = SampleWindows(tuple(windows["blank"]), tuple(windows["signal"]))
+    return SampleInfo(name, type_, acquisition_time, windows)
+
+
+def _align(position: int) -> int:
+    """Round a file position up to the array alignment"""
+    return -(-position // _ALIGNMENT) * _ALIGNMENT
+
+
+def _isotope_system_from_dict(system: dict) -> IsotopeSystem:
+    """Rebuild an IsotopeSystem from its `asdict` form"""
+    peak_strip = system.get("peak_strip")
+    return IsotopeSystem(
+        name=system["name"],
+        ratios=[IsotopeRatio(**ratio) for ratio in system["ratios"]],
+        peak_strip=None if peak_strip is None else _peak_strip_from_dict(peak_strip),
+        interferences=[
+            _peak_strip_from_dict(interference)
+            for interference in system.get("interferences", [])
+        ],
+    )
+
+
+def _peak_strip_from_dict(peak_strip: dict) -> PeakStripSettings:
+    """Rebuild PeakStripSettings from their `asdict` form"""
+    return PeakStripSettings(
+        target_isotope=peak_strip["target_isotope"],
+        known_isotope_ratio=IsotopeRatio(**peak_strip["known_isotope_ratio"]),
+        known_isotope_ratio_value=peak_strip["known_isotope_ratio_value"],
+    )
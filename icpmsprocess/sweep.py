@@ -0,0 +1,229 @@
+"""
+Evaluate many choices of blank and signal windows and intensity thresholds over one loaded run.
+"""
+
+import itertools
+from dataclasses import replace
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from icpmsprocess.instrumentation import InstrumentationSink
+from icpmsprocess.mstypes import (
+    ProcessingSettings,
+    ReferenceMaterial,
+    RunStore,
+    Sample,
+    SampleBatch,
+)
+from icpmsprocess.plan import compile_plan
+from icpmsprocess.processors import (
+    InternalCorrector,
+    MassBiasCorrector,
+    RatioCalculator,
+    masked_mean,
+)
+from icpmsprocess.utils import pack_samples
+
+# the settings a sweep can vary
+SWEEP_FIELDS = (
+    "blank_cycles",
+    "max_blank_intensity",
+    "signal_cycles",
+    "min_signal_intensity",
+)
+
+# the most (settings x samples x cycles x columns) elements reduced at once, bounding the memory used
+_MAX_CHUNK_ELEMENTS = 20_000_000
+
+
+def sweep(
+    samples: List[Sample] | RunStore,
+    settings: ProcessingSettings,
+    correction_reference_material: ReferenceMaterial,
+    grid: Dict[str, Sequence],
+    control_reference_material: ReferenceMaterial | None = None,
+    sink: InstrumentationSink | None = None,
+) -> pd.DataFrame:
+    """
+    Process a run with every combination of the given settings values, e.g. to choose the blank and signal windows.
+
+    Each combination gives the same results as `DataProcessor.process_batch` with those settings, but
+    the run is packed once, the blank of each distinct blank window and threshold is found once, as are
+    the retained cycles of each distinct signal window and threshold, and the combinations are reduced
+    and mass bias corrected together, so hundreds of combinations take about as long as a few runs.
+
+    For example, to compare signal windows and thresholds by the accuracy of the controls:
+
+        results = sweep(samples, settings, NIST610, {"signal_cycles": [(31, 58), (35, 58)],
+                        "min_signal_intensity": [0.5, 1, 2]}, control_reference_material=NIST612)
+        results.groupby(["signal_cycles", "min_signal_intensity", "ratio"])["accuracy"].mean()
+
+    Args:
+        samples (List[Sample] | RunStore): The samples of the run, in run order.
+        settings (ProcessingSettings): The settings not being swept.
+        correction_reference_material (ReferenceMaterial): The reference material used as the standard.
+        grid (Dict[str, Sequence]): The values to try of each swept setting, any of `SWEEP_FIELDS`.
+        control_reference_material (ReferenceMaterial, optional): The known values of the controls, to give their accuracy. Defaults to None.
+        sink (InstrumentationSink, optional): Receives the events of the internal corrections. Defaults to ignoring them.
+    Returns:
+        pd.DataFrame: A row for each combination, unknown and ratio: the swept settings, "name", "type",
+        "ratio", the corrected "value" and its "error", and for controls, "accuracy", the relative
+        deviation of the value from the control reference material's.
+    """
+    unknown_fields = sorted(set(grid) - set(SWEEP_FIELDS))
+    if unknown_fields:
+        raise ValueError(
+            f"Can't sweep {unknown_fields}, expected any of {list(SWEEP_FIELDS)}"
+        )
+    if settings.uncertainty != "sem":
+        raise ValueError("Sweeps only give 'sem' uncertainties")
+    sink = sink if sink is not None else InstrumentationSink()
+
+    fields = list(grid)
+    combinations = [
+        replace(settings, **dict(zip(fields, values)))
+        for values in itertools.product(*(grid[field] for field in fields))
+    ]
+
+    batch = pack_samples(
+        samples, settings.intensity_metric, storage_dtype=settings.storage_dtype
+    )
+    plan = compile_plan(
+        batch.isotope_system,
+        settings.intensity_metric,
+        correction_reference_material,
+        batch.columns,
+    )
+    blank_keys = [(s.blank_cycles, s.max_blank_intensity) for s in combinations]
+    signal_keys = [(s.signal_cycles, s.min_signal_intensity) for s in combinations]
+
+    # each distinct blank and signal choice is applied once
+    blank_means = {}
+    for key, s in _first_of_each(combinations, blank_keys).items():
+        corrector = InternalCorrector(s, sink)
+        window = corrector.window_masks(batch)[0]
+        kept = corrector.remove_outliers_batch(
+            batch, window, limit_hi=True, window="blank", plan=plan
+        )
+        blank_means[key] = masked_mean(batch.data, kept)
+    signal_masks = {}
+    for key, s in _first_of_each(combinations, signal_keys).items():
+        corrector = InternalCorrector(s, sink)
+        window = corrector.window_masks(batch)[1]
+        signal_masks[key] = corrector.remove_outliers_batch(
+            batch, window, limit_low=True, window="signal", plan=plan
+        )
+
+    # reduce the combinations sharing a signal choice together, a chunk at a time
+    means = np.full(
+        (len(combinations), len(batch.names), len(plan.ratio_names)), np.nan
+    )
+    errors = np.full_like(means, np.nan)
+    chunk = max(1, _MAX_CHUNK_ELEMENTS // max(batch.data.size, 1))
+    ratio_calculator = RatioCalculator()
+    for signal_key, signal_mask in signal_masks.items():
+        indices = [i for i, key in enumerate(signal_keys) if key == signal_key]
+        for start in range(0, len(indices), chunk):
+            group = indices[start : start + chunk]
+            blanks = np.stack([blank_means[blank_keys[i]] for i in group])
+            stacked = _stack(batch, blanks, signal_mask)
+            if plan.strips_peaks:
+                stacked = ratio_calculator.strip_peaks_batch(stacked, plan)
+            group_means, group_errors = ratio_calculator.reduce_batch_values(
+                stacked, plan
+            )
+            means[group] = group_means.reshape(len(group), *means.shape[1:])
+            errors[group] = group_errors.reshape(len(group), *means.shape[1:])
+
+    is_standard = np.array([sample_type == "standard" for sample_type in batch.types])
+    mass_bias_corrector = MassBiasCorrector(
+        correction_reference_material, settings.bracketing, sink
+    )
+    corrected = mass_bias_corrector.correct_draws(
+        means,
+        mass_bias_corrector.bracket(is_standard, batch.acquisition_times),
+        plan.reference_values,
+    )
+
+    return _tidy(
+        combinations,
+        fields,
+        batch,
+        is_standard,
+        corrected,
+        errors[:, ~is_standard],
+        plan.ratio_names,
+        control_reference_material,
+    )
+
+
+def _first_of_each(
+    combinations: List[ProcessingSettings], keys: List[tuple]
+) -> Dict[tuple, ProcessingSettings]:
+    """The first combination with each distinct key"""
+    first = {}
+    for settings, key in zip(combinations, keys):
+        first.setdefault(key, settings)
+    return first
+
+
+def _stack(
+    batch: SampleBatch, blank_means: np.ndarray, signal_mask: np.ndarray
+) -> SampleBatch:
+    """A batch of the run blank-corrected with each of several blanks, one after another along the sample axis"""
+    n_blanks = len(blank_means)
+    data = batch.data[np.newaxis] - blank_means[:, :, np.newaxis, :]
+    return replace(
+        batch,
+        names=batch.names * n_blanks,
+        types=batch.types * n_blanks,
+        cycles=np.tile(batch.cycles, (n_blanks, 1)),
+        data=data.reshape(-1, *batch.data.shape[1:]).astype(
+            batch.data.dtype, copy=False
+        ),
+        cycle_mask=np.tile(signal_mask, (n_blanks, 1)),
+        # only needed before the signal is reduced
+        acquisition_times=None,
+        windows=None,
+    )
+
+
+def _tidy(
+    combinations: List[ProcessingSettings],
+    fields: List[str],
+    batch: SampleBatch,
+    is_standard: np.ndarray,
+    corrected: np.ndarray,
+    errors: np.ndarray,
+    ratio_names: Sequence[str],
+    control_reference_material: ReferenceMaterial | None,
+) -> pd.DataFrame:
+    """Build the long results table of a sweep, one row per combination, unknown and ratio"""
+    n_combinations, n_unknowns, n_ratios = corrected.shape
+    names = np.array(batch.names, dtype=object)[~is_standard]
+    types = np.array(batch.types, dtype=object)[~is_standard]
+
+    columns = {}
+    for field in fields:
+        values = np.empty(n_combinations, dtype=object)
+        values[:] = [getattr(s, field) for s in combinations]
+        columns[field] = np.repeat(values, n_unknowns * n_ratios)
+    columns["name"] = np.tile(np.repeat(names, n_ratios), n_combinations)
+    columns["type"] = np.tile(np.repeat(types, n_ratios), n_combinations)
+    columns["ratio"] = np.tile(
+        np.array(ratio_names, dtype=object), n_combinations * n_unknowns
+    )
+    columns["value"] = corrected.ravel()
+    columns["error"] = errors.ravel()
+
+    accuracy = np.full(corrected.shape, np.nan)
+    if control_reference_material is not None:
+        known = np.array(
+            [control_reference_material.get_value(name).value for name in ratio_names]
+        )
+        is_control = types == "control"
+        accuracy[:, is_control] = corrected[:, is_control] / known - 1
+    columns["accuracy"] = accuracy.ravel()
+    return pd.DataFrame(columns)
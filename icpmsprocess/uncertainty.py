@@ -0,0 +1,130 @@
+from typing import Iterator
+
+import numpy as np
+
+from icpmsprocess.processors import Bracketing, MassBiasCorrector, masked_mean
+
+UNCERTAINTY_METHODS = ("sem", "monte_carlo")
+
+# the most (samples x draws x cycles) elements generated at once, bounding the memory used
+_MAX_CHUNK_ELEMENTS = 4_000_000
+
+
+def monte_carlo_errors(
+    ratios: np.ndarray,
+    cycle_mask: np.ndarray,
+    bracketing: Bracketing,
+    mass_bias_corrector: MassBiasCorrector,
+    reference_values: np.ndarray,
+    reference_uncertainties: np.ndarray | None,
+    n_draws: int = 1000,
+    seed: int | None = None,
+) -> np.ndarray:
+    """
+    Estimate the uncertainty of the mass bias corrected ratios of a run by Monte Carlo simulation.
+
+    Each draw bootstraps the signal cycles of every measurement (resampling them with replacement, all
+    ratios of a cycle together, so their correlation is kept), which gives new mean ratios for the
+    unknowns and the standards alike; draws reference values from their uncertainties; and applies
+    the mass bias correction. So the result covers the scatter of each unknown's cycles, that of its
+    bracketing standards, and the uncertainty of the reference material. All samples and ratios are
+    drawn at once, a chunk of draws at a time.
+
+    Args:
+        ratios (np.ndarray): The ratios of every cycle, shape (measurements, cycles, ratios), in run order.
+        cycle_mask (np.ndarray): The retained signal cycles, shape (measurements, cycles).
+        bracketing (Bracketing): The bracketing standards of each unknown, from `MassBiasCorrector.bracket`.
+        mass_bias_corrector (MassBiasCorrector): Applies the correction to each draw.
+        reference_values (np.ndarray): The reference value of each ratio.
+        reference_uncertainties (np.ndarray | None): The (1 sigma) uncertainty of each reference value, or None to treat them as exact.
+        n_draws (int, optional): The number of draws. Defaults to 1000.
+        seed (int | None, optional): Seeds the random number generator, for reproducible results. Defaults to None.
+    Returns:
+        np.ndarray: The standard deviation of the corrected ratios over the draws, shape (unknowns, ratios).
+    """
+    rng = np.random.default_rng(seed)
+    point = mass_bias_corrector.correct_draws(
+        masked_mean(ratios, cycle_mask), bracketing, reference_values
+    )
+
+    # accumulate deviations from the point estimate, which is close to the mean of the draws, so the
+    # sum of squares doesn't lose precision
+    n = np.zeros(point.shape)
+    total = np.zeros(point.shape)
+    total_sq = np.zeros(point.shape)
+    for means in bootstrap_means(ratios, cycle_mask, n_draws, rng):
+        references = reference_values
+        if reference_uncertainties is not None:
+            references = (
+                reference_values
+                + reference_uncertainties
+                * rng.standard_normal((len(means), len(reference_values)))
+            )
+        deviation = (
+            mass_bias_corrector.correct_draws(means, bracketing, references) - point
+        )
+        is_valid = ~np.isnan(deviation)
+        deviation = np.where(is_valid, deviation, 0.0)
+        n += is_valid.sum(axis=0)
+        total += deviation.sum(axis=0)
+        total_sq += (deviation**2).sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = (total_sq - total**2 / n) / (n - 1)
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def bootstrap_means(
+    ratios: np.ndarray,
+    cycle_mask: np.ndarray,
+    n_draws: int,
+    rng: np.random.Generator,
+) -> Iterator[np.ndarray]:
+    """
+    Bootstrap the mean ratios of every measurement in a run.
+
+    Each draw resamples the retained cycles of each measurement with replacement, and takes the mean
+    of each ratio over them, skipping NaN as the reduction does. The draws are generated in chunks.
+
+    Args:
+        ratios (np.ndarray): The ratios of every cycle, shape (measurements, cycles, ratios).
+        cycle_mask (np.ndarray): The retained cycles, shape (measurements, cycles).
+        n_draws (int): The number of draws.
+        rng (np.random.Generator): The random number generator.
+    Yields:
+        np.ndarray: The mean ratios of a chunk of draws, shape (draws, measurements, ratios).
+    """
+    # move each measurement's retained cycles to the front, so cycle j is retained if j < n_cycles
+    order = np.argsort(~cycle_mask, axis=1, kind="stable")
+    n_cycles = cycle_mask.sum(axis=1)
+    max_cycles = max(int(n_cycles.max(initial=0)), 1)
+    compact = np.take_along_axis(ratios, order[:, :, np.newaxis], axis=1)[
+        :, :max_cycles
+    ]
+    is_number = (~np.isnan(compact)).astype(np.float64)
+    compact = np.where(np.isnan(compact), 0.0, compact)
+
+    n_measurements = len(ratios)
+    is_drawn = (np.arange(max_cycles) < n_cycles[:, np.newaxis])[:, np.newaxis, :]
+    chunk = max(1, _MAX_CHUNK_ELEMENTS // max(n_measurements * max_cycles, 1))
+    for start in range(0, n_draws, chunk):
+        n_chunk = min(chunk, n_draws - start)
+        # which cycle each of the n_cycles picks of each draw is, as counts per cycle
+        picks = (
+            rng.random((n_measurements, n_chunk, max_cycles))
+            * n_cycles[:, np.newaxis, np.newaxis]
+        ).astype(np.intp)
+        bins = (
+            np.arange(n_measurements * n_chunk).reshape(n_measurements, n_chunk, 1)
+            * max_cycles
+            + picks
+        )
+        counts = np.bincount(
+            bins[np.broadcast_to(is_drawn, bins.shape)],
+            minlength=n_measurements * n_chunk * max_cycles,
+        ).reshape(n_measurements, n_chunk, max_cycles)
+        counts = counts.astype(np.float64)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (counts @ compact) / (counts @ is_number)
+        yield means.transpose(1, 0, 2)
@@ -1,9 +1,26 @@
+import numpy as np
 import pandas as pd
 import glob
+import io
 import os
-from typing import List
+import concurrent.futures
+from dataclasses import replace
+from functools import partial
+from typing import Dict, List
 
-from icpmsprocess.mstypes import IsotopeSystem, Sample
+from icpmsprocess.cache import ParseCache
+from icpmsprocess.mstypes import (
+    IsotopeSystem,
+    RunStore,
+    Sample,
+    SampleBatch,
+    pack_windows,
+)
+
+NS_PER_DAY = 86_400 * 10**9
+
+# the dtypes intensities can be stored in; sums and means are always taken in float64
+STORAGE_DTYPES = ("float64", "float32")
 
 
 def load_samples(
@@ -14,11 +31,32 @@ def load_samples(
     header_row: int = 22,
     comment_char: str = "*",
     index_col: str = "Cycle",
+    time_col: str | None = "Time",
+    intensity_metric: str | None = None,
+    workers: int = 1,
+    use_processes: bool = False,
+    cache: ParseCache | None = None,
+    extra_isotope_systems: List[IsotopeSystem] | None = None,
+    storage_dtype: str = "float64",
 ) -> List[Sample]:
     """
     Load all samples from a directory matching them to sample map entries.
 
-    Deafult values are for Neptune `.exp` files.
+    Deafult values are for Neptune `.exp` files. Files are loaded in order of their file names.
+
+    If `intensity_metric` is given, only the columns needed for processing are read (the index column,
+    the isotopes of the isotope system, including any used for peak stripping, and the intensity metric),
+    and parsing stops at the first comment line after the header (the `***` footer of Neptune files)
+    instead of scanning every line for comments. This is much faster for large runs.
+
+    The cycle timestamps in `time_col`, if the files have it, are parsed into nanoseconds since
+    midnight (see `parse_cycle_times`), and the time of each sample's first cycle is its
+    `acquisition_time`. Samples are in acquisition order, so one acquired earlier in the day than the
+    sample before it is taken to be on the next day.
+
+    With `storage_dtype="float32"`, the intensities are stored in half the memory. They keep about 7
+    significant figures, far more than the scatter between cycles, and processing still takes sums and
+    means in float64; see `ProcessingSettings.storage_dtype`.
 
     Parameters:
     - data_dir (str): The directory containing the sample data files.
@@ -28,31 +66,234 @@ def load_samples(
     - header_row (int, optional): The row number to use as the header. Defaults to 22.
     - comment_char (str, optional): The character used to denote comments in the data files. Defaults to "*".
     - index_col (str, optional): The column to use as the index. Defaults to "Cycle".
+    - time_col (str, optional): The column of cycle timestamps, formatted "HH:MM:SS:fff". Ignored if the files don't have it; None to leave it unparsed. Defaults to "Time".
+    - intensity_metric (str, optional): The column used for intensity thresholds. If given, only the columns needed for processing are read. Defaults to None (read all columns).
+    - workers (int, optional): The number of files to parse in parallel. Defaults to 1.
+    - use_processes (bool, optional): Parse files in a process pool rather than a thread pool. Defaults to False.
+    - cache (ParseCache, optional): A cache of parsed files, used to skip parsing files which haven't changed. Defaults to None.
+    - extra_isotope_systems (List[IsotopeSystem], optional): Other isotope systems whose columns are also read when only the columns needed for processing are, e.g. for `DataProcessor.process_systems`. Defaults to None.
+    - storage_dtype (str, optional): The dtype to store the intensities in, one of STORAGE_DTYPES. Defaults to "float64".
     Returns:
     - List[Sample]: A list of Sample objects loaded from the data files.
     """
-    data_files = _find_data_files(data_dir, file_ext)
+    check_storage_dtype(storage_dtype)
+    data_files = find_data_files(data_dir, file_ext)
     sample_map = pd.read_csv(sample_map_path)
 
-    samples = []
-    for fp in data_files:
-        sample_info = _get_sample_info(fp, sample_map, file_ext)
-        raw_data = _load_data_file(fp, header_row, comment_char, index_col)
-        samples.append(
-            Sample(
-                name=sample_info.sample_name,
-                type=sample_info.type,
-                isotope_system=isotope_system,
-                timeseries_data=raw_data,
+    # match all files first, so a bad sample map fails before any parsing
+    matches = match_sample_map(data_files, sample_map, file_ext)
+    unmatched = [fp for fp, rows in zip(data_files, matches) if not rows]
+    if unmatched:
+        raise ValueError(f"No matching sample info found for file: {unmatched[0]}")
+    sample_infos = [sample_map.iloc[rows[0]] for rows in matches]
+
+    usecols = None
+    if intensity_metric is not None:
+        usecols = [index_col] + processing_columns(
+            [isotope_system] + (extra_isotope_systems or []), intensity_metric
+        )
+
+    load = partial(
+        load_data_file,
+        header_row=header_row,
+        comment_char=comment_char,
+        index_col=index_col,
+        usecols=usecols,
+        time_col=time_col,
+        storage_dtype=storage_dtype,
+    )
+    if cache is not None:
+        load = partial(_load_data_file_cached, load=load, cache=cache)
+    if workers > 1:
+        # looked up here, as concurrent.futures only imports multiprocessing when a process pool is used
+        pool = (
+            concurrent.futures.ProcessPoolExecutor
+            if use_processes
+            else concurrent.futures.ThreadPoolExecutor
+        )
+        with pool(max_workers=workers) as executor:
+            raw_data = list(executor.map(load, data_files))  # map keeps file order
+    else:
+        raw_data = [load(fp) for fp in data_files]
+
+    start_times = [None] * len(raw_data)
+    if time_col is not None and all(
+        time_col in data.columns and len(data) > 0 for data in raw_data
+    ):
+        first_times = np.array([data[time_col].iloc[0] for data in raw_data])
+        start_times = _unroll_midnights(first_times % NS_PER_DAY).tolist()
+
+    return [
+        Sample(
+            name=sample_info.sample_name,
+            type=sample_info.type,
+            isotope_system=isotope_system,
+            timeseries_data=data,
+            acquisition_time=acquisition_time,
+        )
+        for sample_info, data, acquisition_time in zip(
+            sample_infos, raw_data, start_times
+        )
+    ]
+
+
+def load_run_store(*args, **kwargs) -> RunStore:
+    """
+    Load all samples from a directory into a RunStore, a compact alternative to a list of samples.
+
+    Takes the same parameters as `load_samples`. Only the intensity (float) columns are kept, in `storage_dtype`; the acquisition times are kept with each sample.
+    """
+    return RunStore.from_samples(
+        load_samples(*args, **kwargs), dtype=kwargs.get("storage_dtype", "float64")
+    )
+
+
+def pack_samples(
+    samples: List[Sample] | RunStore,
+    intensity_metric: str,
+    isotope_systems: List[IsotopeSystem] | None = None,
+    storage_dtype: str = "float64",
+) -> SampleBatch:
+    """
+    Pack the timeseries data of a run into a single SampleBatch.
+
+    Only the columns needed for processing are packed: the isotopes in the isotope system's ratios,
+    those used for peak stripping, and the intensity metric.
+
+    Parameters:
+    - samples (List[Sample] | RunStore): The samples of the run, in run order. All must share an isotope system.
+    - intensity_metric (str): The column used for intensity thresholds.
+    - isotope_systems (List[IsotopeSystem], optional): Pack the columns needed for all of these isotope systems instead of the samples' own. Defaults to None.
+    - storage_dtype (str, optional): The dtype of the packed intensities, one of STORAGE_DTYPES. Defaults to "float64".
+    Returns:
+    - SampleBatch: The packed samples.
+    """
+    if len(samples) == 0:
+        raise ValueError("No samples to pack")
+
+    check_storage_dtype(storage_dtype)
+    if isinstance(samples, RunStore):
+        batch = samples.to_batch(
+            processing_columns(
+                isotope_systems or [samples.isotope_system], intensity_metric
             )
         )
+        return replace(batch, data=batch.data.astype(storage_dtype, copy=False))
+
+    isotope_system = samples[0].isotope_system
+    if any(sample.isotope_system != isotope_system for sample in samples):
+        raise ValueError("All samples in a batch must share the same isotope system")
+
+    columns = processing_columns(isotope_systems or [isotope_system], intensity_metric)
+
+    n_cycles = max(len(sample.timeseries_data) for sample in samples)
+    data = np.full((len(samples), n_cycles, len(columns)), np.nan, dtype=storage_dtype)
+    cycles = np.zeros((len(samples), n_cycles), dtype=np.int64)
+    cycle_mask = np.zeros((len(samples), n_cycles), dtype=bool)
+
+    for i, sample in enumerate(samples):
+        n = len(sample.timeseries_data)
+        data[i, :n] = sample.timeseries_data[columns].to_numpy(dtype=storage_dtype)
+        cycles[i, :n] = sample.timeseries_data.index.to_numpy()
+        cycle_mask[i, :n] = True
+
+    return SampleBatch(
+        names=[sample.name for sample in samples],
+        types=[sample.type for sample in samples],
+        isotope_system=isotope_system,
+        columns=columns,
+        cycles=cycles,
+        data=data,
+        cycle_mask=cycle_mask,
+        acquisition_times=acquisition_times(samples),
+        windows=pack_windows([sample.windows for sample in samples]),
+    )
+
+
+def parse_cycle_times(times: np.ndarray) -> np.ndarray:
+    """
+    Parse cycle timestamps formatted "HH:MM:SS:fff" (as Neptune files have) into nanoseconds since midnight.
+
+    The timestamps are parsed all at once, as fixed-width bytes. They must be in acquisition order, as
+    a time earlier than the one before it is taken to be on the next day, so times after midnight are
+    counted on from the first day's midnight rather than wrapping around.
+
+    Parameters:
+    - times (np.ndarray): The timestamps, as strings.
+    Returns:
+    - np.ndarray: The times in nanoseconds (int64).
+    """
+    try:
+        text = np.asarray(times).astype("S")
+    except UnicodeEncodeError as e:
+        raise ValueError("Cycle timestamps must be formatted HH:MM:SS:fff") from e
+    if len(text) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    chars = text.view(np.uint8).reshape(len(text), -1)
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    if (
+        chars.shape[1] != 12
+        or not (chars[:, [2, 5, 8]] == ord(":")).all()
+        or not is_digit[:, [0, 1, 3, 4, 6, 7, 9, 10, 11]].all()
+    ):
+        raise ValueError("Cycle timestamps must be formatted HH:MM:SS:fff")
+
+    digits = (chars - ord("0")).astype(np.int64)
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 3] * 10 + digits[:, 4]
+    seconds = digits[:, 6] * 10 + digits[:, 7]
+    milliseconds = digits[:, 9] * 100 + digits[:, 10] * 10 + digits[:, 11]
+    nanoseconds = ((hours * 60 + minutes) * 60 + seconds) * 10**9 + milliseconds * 10**6
+    return _unroll_midnights(nanoseconds)
+
+
+def _unroll_midnights(times: np.ndarray) -> np.ndarray:
+    """Add a day to times of day (in ns) from each point one is earlier than the one before it"""
+    days = np.cumsum(np.diff(times, prepend=times[:1]) < 0)
+    return times + days * NS_PER_DAY
+
+
+def not_before(time_of_day: int, previous: int | None) -> int:
+    """Move a time of day (in ns) on by whole days until it isn't earlier than `previous`, for times read one at a time"""
+    if previous is None:
+        return time_of_day
+    days_ahead = -(-(previous - time_of_day) // NS_PER_DAY)
+    return time_of_day + max(days_ahead, 0) * NS_PER_DAY
+
+
+def check_storage_dtype(storage_dtype: str) -> None:
+    """Raise a ValueError unless `storage_dtype` is one of STORAGE_DTYPES"""
+    if storage_dtype not in STORAGE_DTYPES:
+        raise ValueError(
+            f"Unknown storage dtype '{storage_dtype}', expected one of {STORAGE_DTYPES}"
+        )
+
+
+def acquisition_times(samples: List[Sample] | RunStore) -> np.ndarray | None:
+    """The acquisition time of each sample in a run, or None unless all of them have one"""
+    if isinstance(samples, RunStore):
+        times = [info.acquisition_time for info in samples.info]
+    else:
+        times = [sample.acquisition_time for sample in samples]
+    if len(times) == 0 or any(t is None for t in times):
+        return None
+    return np.array(times, dtype=np.int64)
+
 
-    return samples
+def processing_columns(
+    isotope_systems: List[IsotopeSystem], intensity_metric: str
+) -> List[str]:
+    """Get the intensity columns needed to process any of the isotope systems, in a stable order"""
+    columns = set()
+    for isotope_system in isotope_systems:
+        columns.update(isotope_system.get_processing_columns(intensity_metric))
+    return sorted(columns)
 
 
-def _find_data_files(data_dir: str, file_ext: str) -> List[str]:
-    """Find all data files with given extension in directory"""
-    data_files = glob.glob(glob.escape(data_dir) + "/*" + file_ext)
+def find_data_files(data_dir: str, file_ext: str) -> List[str]:
+    """Find all data files with given extension in directory, sorted by file name"""
+    data_files = sorted(glob.glob(glob.escape(data_dir) + "/*" + file_ext))
     if len(data_files) == 0:
         raise RuntimeError(
             "No data files found. Are the directory and file extension settings correct?"
@@ -60,35 +301,134 @@ def _find_data_files(data_dir: str, file_ext: str) -> List[str]:
     return data_files
 
 
-def _get_sample_info(
+def get_sample_info(
     filepath: str, sample_map: pd.DataFrame, file_ext: str
 ) -> pd.Series:
     """Get sample metadata from sample map"""
-    sample_info = sample_map[
-        sample_map.file_name.str.contains(
-            os.path.basename(filepath).replace(file_ext, "")
-        )
-    ]
-    if sample_info.empty:
+    rows = match_sample_map([filepath], sample_map, file_ext)[0]
+    if not rows:
         raise ValueError(f"No matching sample info found for file: {filepath}")
-    return sample_info.iloc[0]
+    return sample_map.iloc[rows[0]]
 
 
-def _load_data_file(
+def match_sample_map(
+    data_files: List[str],
+    sample_map: pd.DataFrame,
+    file_ext: str,
+    fallback: bool = True,
+) -> List[List[int]]:
+    """
+    Find the sample map rows matching each data file, as positions.
+
+    A row matches a file if its file name, without directory or extension, is the file's; rows are
+    looked up by name, so matching doesn't scan the sample map for every file. Unless `fallback` is
+    False, files with no such row fall back to any rows whose file name contains the file's name.
+    """
+    file_names = sample_map.file_name.astype(str).tolist()
+    index: Dict[str, List[int]] = {}
+    for i, file_name in enumerate(file_names):
+        index.setdefault(_file_stem(file_name, file_ext), []).append(i)
+
+    # to rule out a file quickly when no file name contains its name
+    all_names = "\n".join(file_names)
+    matches = []
+    for filepath in data_files:
+        stem = _file_stem(filepath, file_ext)
+        rows = index.get(stem)
+        if rows is None:
+            rows = []
+            if fallback and stem in all_names:
+                rows = [i for i, name in enumerate(file_names) if stem in name]
+        matches.append(rows)
+    return matches
+
+
+def _file_stem(path: str, file_ext: str) -> str:
+    """The name of a file without its directory or extension"""
+    name = os.path.basename(path)
+    return name[: -len(file_ext)] if file_ext and name.endswith(file_ext) else name
+
+
+def load_data_file(
     filepath: str,
     header_row: int,
     comment_char: str,
     index_col: str,
     separator: str = "\t",
+    usecols: List[str] | None = None,
+    time_col: str | None = None,
+    storage_dtype: str = "float64",
 ) -> pd.DataFrame:
-    """Load and preprocess a single data file"""
+    """Load and preprocess a single data file; if `usecols` is given, read only those columns (and `time_col`, if there is one) and stop at the footer"""
 
-    # Read raw data
-    data = pd.read_table(
-        filepath,
-        header=header_row,
-        comment=comment_char,
-        index_col=index_col,
-        sep=separator,
-    )
+    if usecols is not None:
+        with open(filepath, "rb") as f:
+            content = f.read()
+        wanted = set(usecols) | {time_col}
+        data = pd.read_table(
+            io.BytesIO(_strip_footer(content, header_row, comment_char)),
+            header=header_row,
+            index_col=index_col,
+            usecols=lambda column: column in wanted,
+            sep=separator,
+        )
+        missing = [col for col in usecols if col != index_col and col not in data]
+        if missing:
+            raise ValueError(f"Columns {missing} not found in {filepath}")
+    else:
+        # Read raw data
+        data = pd.read_table(
+            filepath,
+            header=header_row,
+            comment=comment_char,
+            index_col=index_col,
+            sep=separator,
+        )
+
+    if time_col in data.columns and not pd.api.types.is_numeric_dtype(data[time_col]):
+        try:
+            data[time_col] = parse_cycle_times(data[time_col].to_numpy())
+        except ValueError as e:
+            raise ValueError(f"{e}, in column '{time_col}' of {filepath}") from e
+    return to_storage_dtype(data, storage_dtype, time_col)
+
+
+def to_storage_dtype(
+    data: pd.DataFrame, storage_dtype: str, time_col: str | None = None
+) -> pd.DataFrame:
+    """Store the intensity columns of a data file, i.e. the numeric columns other than `time_col`, as floats of the given dtype, e.g. a column read as integers as it is all zero"""
+    intensities = [
+        column
+        for column, dtype in data.dtypes.items()
+        if column != time_col
+        and pd.api.types.is_numeric_dtype(dtype)
+        and dtype != storage_dtype
+    ]
+    if not intensities:
+        return data
+    return data.astype(dict.fromkeys(intensities, storage_dtype))
+
+
+def _load_data_file_cached(
+    filepath: str, load: partial, cache: ParseCache
+) -> pd.DataFrame:
+    """Load a single data file from the cache, parsing and caching it if there's no valid entry"""
+    data = cache.get(filepath, load.keywords)
+    if data is None:
+        data = load(filepath)
+        cache.put(filepath, load.keywords, data)
     return data
+
+
+def _strip_footer(content: bytes, header_row: int, comment_char: str) -> bytes:
+    """Cut file content at the first line after the header row which starts with the comment character"""
+    header_end = 0
+    for _ in range(header_row + 1):
+        header_end = content.find(b"\n", header_end) + 1
+        if header_end == 0:
+            return content
+
+    footer_start = content.find(b"\n" + comment_char.encode(), header_end - 1)
+    if footer_start == -1:
+        return content
+    return content[: footer_start + 1]
@@ -0,0 +1,201 @@
+"""
+Check a session before loading it, reading only the header of each data file, so a wrong sample map,
+missing column or wrong `header_row` is found in well under a second rather than after parsing the run.
+"""
+
+import concurrent.futures
+import os
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List
+
+import pandas as pd
+
+from icpmsprocess.mstypes import IsotopeSystem
+from icpmsprocess.utils import find_data_files, match_sample_map, processing_columns
+
+# the files named in a problem's description, before the rest are counted
+_MAX_LISTED = 3
+
+
+@dataclass
+class SessionReport:
+    """
+    The outcome of validating a session.
+
+    Attributes:
+        files (List[str]): The data files, in run order.
+        names (List[str | None]): The sample name of each file, None if it has no match in the sample map.
+        types (List[str | None]): The sample type of each file, None if it has no match in the sample map.
+        problems (List[str]): What would stop the session loading, or make its results wrong.
+    """
+
+    files: List[str]
+    names: List[str | None] = field(default_factory=list)
+    types: List[str | None] = field(default_factory=list)
+    problems: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def type_counts(self) -> Dict[str, int]:
+        """The number of samples of each type"""
+        types = [t for t in self.types if t is not None]
+        return {t: types.count(t) for t in sorted(set(types))}
+
+
+def validate_session(
+    data_dir: str,
+    sample_map_path: str,
+    isotope_system: IsotopeSystem,
+    intensity_metric: str | None = None,
+    file_ext: str = ".exp",
+    header_row: int = 22,
+    comment_char: str = "*",
+    index_col: str = "Cycle",
+    separator: str = "\t",
+    workers: int = 8,
+) -> SessionReport:
+    """
+    Check a session can be loaded with `load_samples` and processed, without parsing its data.
+
+    Reads the header row and first cycle of every data file (in parallel) to check it has the index
+    column, the columns the isotope system needs and the intensity metric, and matches every file to
+    the sample map, reporting files with no match or several, and sample map rows matched by several
+    files. Finally checks that every unknown has a standard before and after it in the run.
+
+    Parameters:
+    - data_dir, sample_map_path, isotope_system, file_ext, header_row, comment_char, index_col: As for `load_samples`.
+    - intensity_metric (str, optional): The column used for intensity thresholds, also required if given. Defaults to None.
+    - separator (str, optional): The column separator. Defaults to a tab.
+    - workers (int, optional): The number of files to read in parallel. Defaults to 8.
+    Returns:
+    - SessionReport: The samples found and the problems with the session, if any.
+    """
+    report = SessionReport(files=find_data_files(data_dir, file_ext))
+
+    required = [index_col] + processing_columns([isotope_system], intensity_metric)
+    read = partial(
+        _check_header,
+        required=required,
+        header_row=header_row,
+        comment_char=comment_char,
+        separator=separator,
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        file_problems = list(executor.map(read, report.files))
+    by_problem: Dict[str, List[str]] = {}
+    for filepath, problem in zip(report.files, file_problems):
+        if problem is not None:
+            by_problem.setdefault(problem, []).append(filepath)
+    for problem, files in by_problem.items():
+        report.problems.append(f"{problem} in {_list_names(files)}")
+
+    sample_map = pd.read_csv(sample_map_path)
+    missing = [
+        c for c in ("file_name", "sample_name", "type") if c not in sample_map.columns
+    ]
+    if missing:
+        report.problems.append(f"the sample map has no {missing} columns")
+        return report
+    matches = match_sample_map(report.files, sample_map, file_ext)
+    report.problems.extend(_sample_map_problems(report.files, matches))
+
+    names, types = sample_map.sample_name.tolist(), sample_map.type.tolist()
+    report.names = [names[rows[0]] if rows else None for rows in matches]
+    report.types = [types[rows[0]] if rows else None for rows in matches]
+    report.problems.extend(check_bracketing(report.names, report.types))
+    return report
+
+
+def check_bracketing(names: List[str | None], types: List[str | None]) -> List[str]:
+    """
+    Check every unknown of a run is bracketed by standards.
+
+    Args:
+        names (List[str | None]): The sample names, in run order.
+        types (List[str | None]): The sample types, in run order; None for samples of unknown type, which are skipped.
+    Returns:
+        List[str]: The problems found, if any.
+    """
+    is_standard = [t == "standard" for t in types]
+    if not any(is_standard):
+        return ["no standards to correct mass bias with"]
+    first = is_standard.index(True)
+    last = len(is_standard) - 1 - is_standard[::-1].index(True)
+    unbracketed = [
+        name
+        for i, (name, t) in enumerate(zip(names, types))
+        if t is not None and t != "standard" and not first < i < last
+    ]
+    if not unbracketed:
+        return []
+    return [
+        f"{len(unbracketed)} unknowns aren't between two standards, so are corrected with only one:"
+        f" {_list_names(unbracketed)}"
+    ]
+
+
+def _check_header(
+    filepath: str,
+    required: List[str],
+    header_row: int,
+    comment_char: str,
+    separator: str,
+) -> str | None:
+    """Read the header row and first cycle of a data file, and describe what's wrong with them, if anything"""
+    try:
+        with open(filepath, "rb") as f:
+            lines = [f.readline() for _ in range(header_row + 2)]
+    except OSError as e:
+        return f"can't read the file ({e.strerror})"
+
+    header, first_cycle = lines[header_row], lines[header_row + 1]
+    if not header:
+        return f"no header row (line {header_row + 1})"
+    columns = header.decode(errors="replace").rstrip("\r\n").split(separator)
+    missing = [column for column in required if column not in columns]
+    if missing:
+        return f"no {missing} columns in the header row (line {header_row + 1})"
+    if not first_cycle.strip() or first_cycle.startswith(comment_char.encode()):
+        return "no cycles"
+    return None
+
+
+def _sample_map_problems(files: List[str], matches: List[List[int]]) -> List[str]:
+    """Describe the data files matching no or several sample map rows, and the rows matched by several files"""
+    problems = []
+    unmatched = [fp for fp, rows in zip(files, matches) if not rows]
+    if unmatched:
+        problems.append(f"no sample map row matches {_list_names(unmatched)}")
+    ambiguous = [fp for fp, rows in zip(files, matches) if len(rows) > 1]
+    if ambiguous:
+        problems.append(
+            f"several sample map rows match {_list_names(ambiguous)}; the first is used"
+        )
+
+    files_of_row: Dict[int, List[str]] = {}
+    for filepath, rows in zip(files, matches):
+        for row in rows:
+            files_of_row.setdefault(row, []).append(filepath)
+    duplicates = [
+        (row, files) for row, files in sorted(files_of_row.items()) if len(files) > 1
+    ]
+    for row, files in duplicates[:_MAX_LISTED]:
+        problems.append(
+            f"sample map row {row + 1} matches several files: {_list_names(files)}"
+        )
+    if len(duplicates) > _MAX_LISTED:
+        problems.append(
+            f"{len(duplicates) - _MAX_LISTED} more sample map rows match several files"
+        )
+    return problems
+
+
+def _list_names(names: List[str]) -> str:
+    """A short list of file or sample names, e.g. "a, b, c and 5 more\" """
+    shown = ", ".join(os.path.basename(name) for name in names[:_MAX_LISTED])
+    if len(names) > _MAX_LISTED:
+        shown += f" and {len(names) - _MAX_LISTED} more"
+    return shown
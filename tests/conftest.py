@@ -0,0 +1,34 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "docs"))
+
+from docs_helpers import generate_run_data  # noqa: E402
+from icpmsprocess.mstypes import ProcessingSettings  # noqa: E402
+
+N_CYCLES = 60
+
+
+@pytest.fixture
+def settings() -> ProcessingSettings:
+    """Processing settings matching the blank and signal windows of the generated runs"""
+    return ProcessingSettings(
+        intensity_metric="208Pb",
+        min_signal_intensity=1,
+        low_cycles_warning_frac=0.1,
+        max_blank_intensity=5e-4,
+        blank_cycles=N_CYCLES // 2 - 2,
+        signal_cycles=(N_CYCLES // 2 + 1, N_CYCLES - 2),
+    )
+
+
+@pytest.fixture
+def run_dir(tmp_path) -> str:
+    """A directory holding a generated run of 12 analyses and its sample map"""
+    np.random.seed(42)
+    data_dir = str(tmp_path / "run")
+    generate_run_data(12, data_dir, N_CYCLES)
+    return data_dir
@@ -0,0 +1,101 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess.cache import ParseCache
+
+PARAMS = {"header_row": 22, "index_col": "Cycle"}
+
+
+@pytest.fixture
+def data_files(tmp_path):
+    """Three small data files, and the data parsed from each"""
+    files = {}
+    for name in ("a", "b", "c"):
+        path = str(tmp_path / f"{name}.exp")
+        with open(path, "w") as f:
+            f.write(f"data file {name}\n")
+        files[path] = pd.DataFrame(
+            {"204Pb": np.arange(100.0), "Time": np.arange(100, dtype=np.int64)},
+            index=pd.RangeIndex(1, 101, name="Cycle"),
+        )
+    return files
+
+
+def touch_later(path: str) -> None:
+    """Move a file's modification time on, as re-saving it would"""
+    mtime = os.stat(path).st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_a_stored_file_is_a_hit(tmp_path, data_files):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path, data = next(iter(data_files.items()))
+    assert cache.get(path, PARAMS) is None
+
+    cache.put(path, PARAMS, data)
+
+    pd.testing.assert_frame_equal(cache.get(path, PARAMS), data, check_index_type=False)
+    assert cache.get(path, {**PARAMS, "header_row": 0}) is None
+
+
+def test_a_modified_file_is_a_miss(tmp_path, data_files):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path, data = next(iter(data_files.items()))
+    cache.put(path, PARAMS, data)
+
+    touch_later(path)
+
+    assert cache.get(path, PARAMS) is None
+
+
+def test_content_hashes_ignore_modification_times(tmp_path, data_files):
+    cache = ParseCache(str(tmp_path / "cache"), hash_content=True)
+    path, data = next(iter(data_files.items()))
+    cache.put(path, PARAMS, data)
+
+    touch_later(path)
+    assert cache.get(path, PARAMS) is not None
+
+    stat = os.stat(path)
+    with open(path, "w") as f:
+        f.write("data file z\n")  # same size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.get(path, PARAMS) is None
+
+
+def test_invalidate_removes_every_entry_of_a_file(tmp_path, data_files):
+    cache = ParseCache(str(tmp_path / "cache"))
+    (path, data), (other, other_data) = list(data_files.items())[:2]
+    cache.put(path, PARAMS, data)
+    cache.put(path, {**PARAMS, "header_row": 0}, data)
+    cache.put(other, PARAMS, other_data)
+
+    assert cache.invalidate(path) == 2
+
+    assert cache.get(path, PARAMS) is None
+    assert cache.get(other, PARAMS) is not None
+    assert len(os.listdir(cache.cache_dir)) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, data_files):
+    (a, data_a), (b, data_b), (c, data_c) = data_files.items()
+    cache = ParseCache(str(tmp_path / "cache"))
+    cache.put(a, PARAMS, data_a)
+    entry_size = cache.size()
+    cache.max_bytes = int(2.5 * entry_size)  # room for two entries
+
+    time.sleep(0.05)
+    cache.put(b, PARAMS, data_b)
+    time.sleep(0.05)
+    assert cache.get(a, PARAMS) is not None  # now more recently used than b
+    time.sleep(0.05)
+    cache.put(c, PARAMS, data_c)
+
+    assert cache.get(b, PARAMS) is None
+    assert cache.get(a, PARAMS) is not None
+    assert cache.get(c, PARAMS) is not None
+    assert cache.size() <= cache.max_bytes
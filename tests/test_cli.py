@@ -0,0 +1,41 @@
+import json
+import os
+
+import pandas as pd
+
+from icpmsprocess import DataProcessor
+from icpmsprocess.cli import main
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.utils import load_samples
+
+
+def test_process_writes_the_batch_results(run_dir, settings, tmp_path):
+    settings_path = str(tmp_path / "settings.json")
+    with open(settings_path, "w") as f:
+        json.dump(
+            {
+                "isotope_system": "Pb_Pb",
+                "reference_material": "NIST610",
+                "settings": {
+                    "intensity_metric": settings.intensity_metric,
+                    "min_signal_intensity": settings.min_signal_intensity,
+                    "low_cycles_warning_frac": settings.low_cycles_warning_frac,
+                    "max_blank_intensity": settings.max_blank_intensity,
+                    "blank_cycles": settings.blank_cycles,
+                    "signal_cycles": list(settings.signal_cycles),
+                },
+            },
+            f,
+        )
+    sample_map_path = os.path.join(run_dir, "sample_map.csv")
+    output = str(tmp_path / "results.csv")
+
+    assert main(["process", settings_path, run_dir, sample_map_path, "-o", output]) == 0
+
+    expected = DataProcessor(settings, NIST610).process_batch(
+        load_samples(run_dir, sample_map_path, Pb_Pb)
+    )
+    results = pd.read_csv(output)
+    pd.testing.assert_frame_equal(
+        results.drop(columns="cycles_used"), expected, rtol=1e-12
+    )
@@ -0,0 +1,84 @@
+import os
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor, RecordingSink
+from icpmsprocess.export import ResultWriter, open_writer
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.utils import load_samples
+
+
+class FrameWriter(ResultWriter):
+    """Keeps the chunks written to it"""
+
+    def __init__(self):
+        super().__init__(path=None)
+        self.chunks = []
+
+    def _write(self, results: pd.DataFrame) -> None:
+        self.chunks.append(results)
+
+
+@pytest.fixture
+def results() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "name": [f"my_smpl_00{i}" for i in range(1, 6)],
+            "type": ["sample", "control", "sample", "sample", "control"],
+            "206Pb_204Pb": [17.1, 17.0, np.nan, 16.9, 17.05],
+            "206Pb_204Pb_err": [0.01, 0.02, np.nan, 0.015, 0.012],
+            "cycles_used": np.array([28, 27, 0, 28, 26], dtype=np.int64),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "extension, read",
+    [
+        (".csv", pd.read_csv),
+        (".parquet", pd.read_parquet),
+        (".arrow", pd.read_feather),
+    ],
+)
+def test_chunks_round_trip(tmp_path, results, extension, read):
+    if extension != ".csv":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"results{extension}")
+
+    with open_writer(path) as writer:
+        writer.write(results[:2])
+        writer.write(results[2:])
+
+    assert writer.rows_written == len(results)
+    pd.testing.assert_frame_equal(
+        read(path), results, check_dtype=False, check_exact=True
+    )
+
+
+def test_unknown_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Can't tell the format"):
+        open_writer(str(tmp_path / "results.xlsx"))
+
+
+@pytest.mark.parametrize("bracketing", ["mean", "run_order", "time"])
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_process_to_matches_process_batch(run_dir, settings, bracketing, chunk_size):
+    samples = load_samples(run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+    processor = DataProcessor(
+        replace(settings, bracketing=bracketing), NIST610, RecordingSink()
+    )
+    writer = FrameWriter()
+
+    n_written = processor.process_to(samples, writer, chunk_size=chunk_size)
+
+    expected = processor.process_batch(samples)
+    results = pd.concat(writer.chunks, ignore_index=True)
+    assert n_written == writer.rows_written == len(expected)
+    pd.testing.assert_frame_equal(
+        results.drop(columns="cycles_used"), expected, check_exact=True
+    )
+    # the signal cycles of the generated runs, none of which are dropped
+    assert results.cycles_used.tolist() == [28] * len(expected)
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+
+import pandas as pd
+import pytest
+
+from icpmsprocess import jobs
+from icpmsprocess.jobs import SessionJob, process_sessions
+from icpmsprocess.lib import NIST610, Pb_Pb
+
+_process_session = jobs._process_session
+
+
+def crash_or_process(job: SessionJob, output_dir: str):
+    """Kill the worker process for the "crash" session, as running out of memory would"""
+    if job.name == "crash":
+        os._exit(1)
+    return _process_session(job, output_dir)
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the crash is patched in, so needs forked workers",
+)
+def test_a_crashed_worker_fails_only_its_session(
+    run_dir, settings, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(jobs, "_process_session", crash_or_process)
+    sample_map_path = os.path.join(run_dir, "sample_map.csv")
+    names = ["a", "b", "crash", "c", "d", "e"]
+    session_jobs = [
+        SessionJob(run_dir, sample_map_path, Pb_Pb, settings, NIST610, name=name)
+        for name in names
+    ]
+
+    results = process_sessions(session_jobs, str(tmp_path / "out"), workers=3)
+
+    assert [result.name for result in results] == names
+    assert [result.ok for result in results] == [n != "crash" for n in names]
+    assert "died" in results[2].error
+    for result in results:
+        if result.ok:
+            assert len(pd.read_csv(result.output_path)) == result.n_results > 0
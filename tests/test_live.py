@@ -0,0 +1,76 @@
+import os
+
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor
+from icpmsprocess.instrumentation import EventKind, RecordingSink
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.live import LiveProcessor
+from icpmsprocess.utils import load_samples
+
+
+def as_results(corrected) -> pd.DataFrame:
+    """The corrected unknowns, as `DataProcessor.process` tabulates them"""
+    return pd.DataFrame(
+        [sample.reduced_data for sample in corrected],
+        index=pd.Index([sample.name for sample in corrected], name="name"),
+    )
+
+
+def assert_same_results(corrected, expected: pd.DataFrame) -> None:
+    results = as_results(corrected)
+    expected = expected.set_index("name")[results.columns]
+    pd.testing.assert_frame_equal(results, expected, check_exact=True)
+
+
+@pytest.mark.parametrize("bracketing", ["mean", "run_order", "time"])
+def test_files_wait_for_their_sample_map_row(run_dir, settings, bracketing):
+    settings.bracketing = bracketing
+    sample_map_path = os.path.join(run_dir, "sample_map.csv")
+    sample_map = pd.read_csv(sample_map_path)
+    late = sample_map.file_name == "S-008.exp"
+    sample_map[~late].to_csv(sample_map_path, index=False)
+
+    sink = RecordingSink()
+    live = LiveProcessor(
+        run_dir, sample_map_path, Pb_Pb, settings, NIST610, settle_time=0, sink=sink
+    )
+    corrected = live.poll()
+    # the unknowns bracketed by the standards before S-008
+    assert [s.name for s in corrected] == [f"my_smpl_00{i}" for i in range(1, 5)]
+    assert [e.kind for e in sink.events] == [EventKind.NOT_IN_SAMPLE_MAP]
+    assert live.poll() == []  # still waiting, and only reported once
+    assert len(sink.events) == 1
+
+    sample_map.to_csv(sample_map_path, index=False)
+    mtime = os.stat(sample_map_path).st_mtime
+    os.utime(sample_map_path, (mtime + 1, mtime + 1))
+    corrected += live.poll() + live.finish()
+
+    expected = DataProcessor(settings, NIST610).process(
+        load_samples(run_dir, sample_map_path, Pb_Pb)
+    )
+    assert [s.name for s in corrected] == list(expected.name)
+    assert_same_results(corrected, expected)
+
+
+def test_files_which_cannot_be_loaded_are_skipped(run_dir, settings):
+    sample_map_path = os.path.join(run_dir, "sample_map.csv")
+    samples = load_samples(run_dir, sample_map_path, Pb_Pb)
+    with open(os.path.join(run_dir, "S-003.exp"), "w") as f:
+        f.write("not a data file\n")
+
+    sink = RecordingSink()
+    live = LiveProcessor(
+        run_dir, sample_map_path, Pb_Pb, settings, NIST610, settle_time=0, sink=sink
+    )
+    corrected = live.poll() + live.finish()
+
+    assert [(e.kind, e.sample) for e in sink.events] == [
+        (EventKind.LOAD_FAILED, "my_smpl_001")
+    ]
+    expected = DataProcessor(settings, NIST610).process(
+        [sample for sample in samples if sample.name != "my_smpl_001"]
+    )
+    assert_same_results(corrected, expected)
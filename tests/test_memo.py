@@ -0,0 +1,94 @@
+import os
+from dataclasses import replace
+
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor, RecordingSink
+from icpmsprocess.lib import NIST610, NIST612, Pb_Pb
+from icpmsprocess.memo import MemoizedPipeline
+from icpmsprocess.utils import load_samples
+
+
+@pytest.fixture
+def samples(run_dir):
+    return load_samples(run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+
+
+def stages_run(sink: RecordingSink) -> list:
+    """The stages timed since the sink was last cleared, i.e. those which weren't cached"""
+    stages = [stage for stage, _ in sink.timings if stage != "assembly"]
+    sink.timings.clear()
+    return stages
+
+
+def test_cached_results_match_process_batch(samples, settings):
+    settings = replace(settings, uncertainty="monte_carlo", random_seed=3)
+    sink = RecordingSink()
+    pipeline = MemoizedPipeline(samples, sink)
+
+    for _ in range(2):
+        sink.events.clear()
+        result = pipeline.process(settings, NIST610)
+
+        expected_sink = RecordingSink()
+        expected = DataProcessor(settings, NIST610, expected_sink).process_batch(
+            samples
+        )
+        pd.testing.assert_frame_equal(result, expected, check_exact=True)
+        # the events of cached stages are sent again
+        assert sink.events == expected_sink.events
+
+
+def test_only_the_stages_depending_on_a_change_are_run(samples, settings):
+    sink = RecordingSink()
+    pipeline = MemoizedPipeline(samples, sink)
+    pipeline.process(settings, NIST610)
+    assert stages_run(sink) == [
+        "pack",
+        "internal_correction",
+        "reduce",
+        "mass_bias",
+    ]
+
+    pipeline.process(settings, NIST610)
+    assert stages_run(sink) == []
+
+    changes = [
+        (replace(settings, bracketing="run_order"), NIST610, ["mass_bias"]),
+        (settings, NIST612, ["mass_bias"]),
+        (
+            replace(settings, signal_cycles=(35, 58)),
+            NIST610,
+            ["internal_correction", "reduce", "mass_bias"],
+        ),
+        (
+            replace(settings, storage_dtype="float32"),
+            NIST610,
+            ["pack", "internal_correction", "reduce", "mass_bias"],
+        ),
+    ]
+    for changed, reference_material, stages in changes:
+        result = pipeline.process(changed, reference_material)
+
+        assert stages_run(sink) == stages
+        expected = DataProcessor(changed, reference_material).process_batch(samples)
+        pd.testing.assert_frame_equal(result, expected, check_exact=True)
+
+
+def test_least_recently_used_outputs_are_evicted(samples, settings):
+    sink = RecordingSink()
+    pipeline = MemoizedPipeline(samples, sink)
+    pipeline.process(settings, NIST610)
+    pipeline.max_bytes = pipeline.nbytes  # room for one run
+
+    pipeline.process(replace(settings, signal_cycles=(35, 58)), NIST610)
+    assert 0 < pipeline.nbytes <= pipeline.max_bytes
+    stages_run(sink)
+
+    # the packed run was used by both, so it is kept
+    pipeline.process(settings, NIST610)
+    assert stages_run(sink) == ["internal_correction", "reduce", "mass_bias"]
+
+    pipeline.clear()
+    assert pipeline.nbytes == 0
@@ -0,0 +1,48 @@
+import os
+import tracemalloc
+
+import numpy as np
+
+from icpmsprocess.lib import Pb_Pb
+from icpmsprocess.mstypes import RunStore, SampleInfo
+from icpmsprocess.utils import load_run_store, load_samples
+
+
+def make_store(n_samples: int, n_cycles: int) -> RunStore:
+    columns = ["202Hg", "204Pb", "206Pb", "207Pb", "208Pb"]
+    rng = np.random.default_rng(0)
+    return RunStore(
+        isotope_system=Pb_Pb,
+        info=[SampleInfo(f"s{i}", "sample") for i in range(n_samples)],
+        columns=columns,
+        data=rng.random((n_samples * n_cycles, len(columns))),
+        cycles=np.tile(np.arange(1, n_cycles + 1), n_samples),
+        offsets=np.arange(n_samples, dtype=np.int64) * n_cycles,
+        lengths=np.full(n_samples, n_cycles, dtype=np.int64),
+    )
+
+
+def test_to_batch_of_a_slice_reads_only_its_samples():
+    store = make_store(n_samples=5000, n_cycles=60)
+    part = store[100:110]
+
+    tracemalloc.start()
+    batch = part.to_batch(["204Pb", "206Pb"])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # the block is 2.4 MB and the slice's columns 9.6 kB
+    assert peak < store.data.nbytes / 100
+    np.testing.assert_array_equal(
+        batch.data.reshape(-1, 2), store.data[100 * 60 : 110 * 60, [1, 2]]
+    )
+
+
+def test_run_store_keeps_times_with_the_samples_not_the_intensities(run_dir):
+    args = (run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+    samples = load_samples(*args)
+    store = load_run_store(*args, storage_dtype="float32")
+
+    assert "Time" in samples[0].timeseries_data.columns
+    assert "Time" not in store.columns
+    assert [s.acquisition_time for s in store] == [s.acquisition_time for s in samples]
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess.lib import Pb_Pb
+from icpmsprocess.online import OnlineReducer, RunningStats
+from icpmsprocess.processors import InternalCorrector, RatioCalculator
+from icpmsprocess.utils import load_samples
+
+
+def load_run(run_dir):
+    return load_samples(run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+
+
+def reduce_sample(sample, settings):
+    """The mean ratios and errors of a sample, as `DataProcessor.process` reduces it"""
+    ratio_calculator = RatioCalculator()
+    corrected = InternalCorrector(settings).correct(sample)
+    return ratio_calculator.reduce_values(ratio_calculator.strip_peaks(corrected))
+
+
+def assert_values_equal(reducer, expected):
+    mean, sem = reducer.values()
+    np.testing.assert_allclose(mean, expected[0], rtol=1e-12)
+    np.testing.assert_allclose(sem, expected[1], rtol=1e-9)
+
+
+def test_running_stats_of_chunks_match_pandas():
+    rng = np.random.default_rng(0)
+    values = rng.normal(5, 2, (500, 3))
+    values[rng.random(values.shape) < 0.1] = np.nan
+
+    stats = RunningStats.empty(3)
+    for row in values[:200]:
+        stats.update(row)
+    rest = RunningStats.of(values[200:350])
+    rest.merge(RunningStats.of(values[350:]))
+    stats.merge(rest)
+
+    mean, sem = stats.values()
+    np.testing.assert_allclose(mean, np.nanmean(values, axis=0), rtol=1e-13)
+    np.testing.assert_allclose(
+        sem, pd.DataFrame(values).sem(ddof=0).to_numpy(), rtol=1e-12
+    )
+
+
+@pytest.mark.parametrize("method", ["zscore", "sigma_clip", "mad"])
+@pytest.mark.parametrize("chunk_cycles", [1, 7, 1000])
+def test_finished_values_match_the_per_sample_reduction(
+    run_dir, settings, method, chunk_cycles
+):
+    settings.outlier_method = method
+    for sample in load_run(run_dir):
+        reducer = OnlineReducer(sample, settings)
+        data = sample.timeseries_data
+        for start in range(0, len(data), chunk_cycles):
+            reducer.update(data.iloc[start : start + chunk_cycles])
+        reducer.finish()
+
+        assert_values_equal(reducer, reduce_sample(sample, settings))
+
+
+def test_reducers_of_parts_of_the_signal_can_be_merged(run_dir, settings):
+    sample = load_run(run_dir)[1]
+    data = sample.timeseries_data
+    blank, signal = data.loc[: settings.blank_cycles], data.loc[31:]
+
+    reducers = []
+    for part in (signal.iloc[::2], signal.iloc[1::2]):
+        reducer = OnlineReducer(sample, settings)
+        reducer.update(blank)
+        reducer.update(part)
+        reducers.append(reducer)
+    reducers[0].merge(reducers[1])
+    reducers[0].finish()
+
+    assert_values_equal(reducers[0], reduce_sample(sample, settings))
+
+
+def test_signal_outliers_are_removed_when_finished(run_dir, settings):
+    sample = load_run(run_dir)[1]
+    sample.timeseries_data.loc[40, "206Pb"] *= 1.5
+    expected = reduce_sample(sample, settings)
+
+    reducer = OnlineReducer(sample, settings)
+    reducer.update(sample.timeseries_data)
+    provisional, _ = reducer.values()
+    assert np.abs(provisional - expected[0]).max() > 1e-3
+
+    reducer.finish()
+    assert_values_equal(reducer, expected)
+    with pytest.raises(ValueError, match="finished"):
+        reducer.update(sample.timeseries_data.iloc[:1])
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from icpmsprocess.outliers import find_outliers
+
+
+def one_sample(*columns):
+    """A (1, cycles, columns) array of the given columns, and a mask using every cycle"""
+    values = np.array(columns, dtype=np.float64).T[np.newaxis]
+    return values, np.ones(values.shape[:2], dtype=bool)
+
+
+def test_zscore_matches_scipy():
+    # 11 is 3.16 population standard deviations from the mean of ten 0s, and
+    # scipy.stats.zscore gives NaN for the whole of a column with a NaN in it
+    values, cycle_mask = one_sample(
+        [0.0] * 10 + [11.0],
+        [0.0] * 9 + [11.0, 0.0],
+        [np.nan] + [0.0] * 9 + [100.0],
+    )
+
+    outliers = find_outliers(values, cycle_mask, "zscore")
+
+    # as np.any(np.abs(scipy.stats.zscore(values[0])) > 3, axis=1)
+    assert outliers[0].tolist() == [False] * 9 + [True, True]
+
+
+def test_sigma_clip_repeats_until_no_outliers_are_left():
+    # 100 hides 5 in the first pass; without it, 5 is 4.5 standard deviations from the mean
+    values, cycle_mask = one_sample([0.0] * 20 + [5.0, 100.0])
+
+    def outliers(method, **kwargs):
+        return find_outliers(values, cycle_mask, method, **kwargs)[0].tolist()
+
+    assert outliers("zscore") == [False] * 21 + [True]
+    assert outliers("sigma_clip") == [False] * 20 + [True, True]
+    assert outliers("sigma_clip", max_iterations=1) == [False] * 21 + [True]
+
+
+def test_mad_uses_the_scaled_median_absolute_deviation():
+    # median 5.5 and MAD 2.5, so the limit is 3 * 1.4826 * 2.5 = 11.1 from the median
+    values = np.full((2, 10, 1), np.nan)
+    values[0, :, 0] = [1, 2, 3, 4, 5, 6, 7, 8, 9, 100]
+    values[0, 8, 0] = 16.5  # 11 from the median
+    # a zero MAD can't find outliers
+    values[1, :5, 0] = [1, 1, 1, 1, 50]
+    cycle_mask = np.zeros((2, 10), dtype=bool)
+    cycle_mask[0] = True
+    cycle_mask[1, :5] = True
+
+    outliers = find_outliers(values, cycle_mask, "mad")
+
+    assert outliers.tolist() == [[False] * 9 + [True], [False] * 10]
+
+
+def test_only_masked_cycles_are_used():
+    values, cycle_mask = one_sample([0.0] * 10 + [11.0, 1000.0])
+    cycle_mask[0, -1] = False
+
+    outliers = find_outliers(values, cycle_mask, "zscore")
+
+    assert outliers[0].tolist() == [False] * 10 + [True, False]
+
+
+def test_unknown_methods_are_rejected():
+    values, cycle_mask = one_sample([1.0, 2.0])
+
+    with pytest.raises(ValueError, match="Unknown outlier method 'iqr'"):
+        find_outliers(values, cycle_mask, "iqr")
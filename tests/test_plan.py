@@ -0,0 +1,47 @@
+import copy
+from dataclasses import replace
+
+import pytest
+
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.mstypes import IsotopeRatio, PeakStripSettings
+from icpmsprocess.plan import compile_plan
+
+
+def test_interferences_which_depend_on_each_other_are_rejected():
+    isotope_system = replace(
+        Pb_Pb,
+        interferences=[PeakStripSettings("202Hg", IsotopeRatio("202X", "204Pb"), 1.0)],
+    )
+
+    with pytest.raises(ValueError, match=r"\['202Hg', '204Pb'\] depend on each other"):
+        compile_plan(isotope_system)
+
+
+def test_the_same_configuration_reuses_its_plan():
+    plan = compile_plan(Pb_Pb, "208Pb", NIST610)
+
+    assert compile_plan(Pb_Pb, "208Pb", NIST610) is plan
+    # equal values are the same configuration
+    assert compile_plan(copy.deepcopy(Pb_Pb), "208Pb", copy.deepcopy(NIST610)) is plan
+    assert compile_plan(Pb_Pb, None, NIST610) is not plan
+    assert not plan.numerator_indices.flags.writeable
+
+
+def test_modified_configurations_get_a_new_plan():
+    isotope_system = copy.deepcopy(Pb_Pb)
+    reference_material = copy.deepcopy(NIST610)
+    plan = compile_plan(isotope_system, "208Pb", reference_material)
+
+    isotope_system.ratios.pop()
+    fewer_ratios = compile_plan(isotope_system, "208Pb", reference_material)
+    assert fewer_ratios is not plan
+    assert fewer_ratios.ratio_names == plan.ratio_names[:-1]
+
+    first = plan.ratio_names[0]
+    reference_material.values[first] = replace(
+        reference_material.values[first], value=1.0
+    )
+    new_value = compile_plan(isotope_system, "208Pb", reference_material)
+    assert new_value is not fewer_ratios
+    assert new_value.reference_values[0] == 1.0
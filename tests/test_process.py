@@ -0,0 +1,130 @@
+import os
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor, RecordingSink
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.utils import load_samples
+
+
+def load_run(run_dir):
+    return load_samples(run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+
+
+def with_system(samples, isotope_system):
+    """The samples, with the unknowns measured in another isotope system"""
+    return [
+        (
+            sample
+            if sample.type == "standard"
+            else replace(sample, isotope_system=isotope_system)
+        )
+        for sample in samples
+    ]
+
+
+def test_unknowns_with_fewer_ratios_get_nan_for_the_others(run_dir, settings):
+    samples = load_run(run_dir)
+    fewer = replace(Pb_Pb, name="Pb-Pb 204", ratios=Pb_Pb.ratios[:3])
+
+    processor = DataProcessor(settings, NIST610)
+    expected = processor.process(samples)
+    result = processor.process(with_system(samples, fewer))
+
+    assert list(result.columns) == list(expected.columns)
+    kept = [c for r in fewer.ratios for c in (r.name, f"{r.name}_err")]
+    pd.testing.assert_frame_equal(result[kept], expected[kept])
+    dropped = [c for c in expected.columns[2:] if c not in kept]
+    assert result[dropped].isna().all().all()
+
+
+def test_unknowns_with_reordered_ratios_are_matched_by_name(run_dir, settings):
+    samples = load_run(run_dir)
+    reordered = replace(Pb_Pb, name="Pb-Pb reordered", ratios=Pb_Pb.ratios[::-1])
+
+    processor = DataProcessor(settings, NIST610)
+    expected = processor.process(samples)
+    result = processor.process(with_system(samples, reordered))
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_process_to_rejects_mixed_isotope_systems(run_dir, settings):
+    samples = with_system(load_run(run_dir), replace(Pb_Pb, name="Pb-Pb 2"))
+
+    with pytest.raises(ValueError, match="in a run must share"):
+        DataProcessor(settings, NIST610).process_to(samples, writer=None)
+
+
+@pytest.mark.parametrize("engine", ["process", "process_batch"])
+def test_float32_storage_moves_ratios_by_under_1_percent_of_their_errors(
+    run_dir, settings, engine
+):
+    results = {}
+    for storage_dtype in ("float64", "float32"):
+        samples = load_samples(
+            run_dir,
+            os.path.join(run_dir, "sample_map.csv"),
+            Pb_Pb,
+            storage_dtype=storage_dtype,
+        )
+        processor = DataProcessor(
+            replace(settings, storage_dtype=storage_dtype), NIST610
+        )
+        results[storage_dtype] = getattr(processor, engine)(samples)
+
+    exact, approx = results["float64"], results["float32"]
+    errors = [c for c in exact.columns if c.endswith("_err")]
+    ratios = [c[: -len("_err")] for c in errors]
+    shift = np.abs(approx[ratios].to_numpy() - exact[ratios].to_numpy())
+    assert shift.max() > 0  # really stored as float32
+    assert (shift < 0.01 * exact[errors].to_numpy()).all()
+
+
+def edit_run(samples):
+    """Give a generated run ragged cycle counts, cycles outside the intensity limits, and windows with no usable cycles"""
+    edited = []
+    for i, sample in enumerate(samples):
+        data = sample.timeseries_data.copy()
+        if i == 2:
+            data = data.iloc[:50]  # ends part way through the signal
+        elif i == 3:
+            data = data.iloc[:20]  # ends part way through the blank, with no signal
+        elif i == 4:
+            data.loc[[33, 40, 47], "208Pb"] = 0.5
+            data.loc[[2, 9], "208Pb"] = 1e-3
+        elif i == 5:
+            data.loc[31:, "208Pb"] = 0.5
+        elif i == 7:
+            data.loc[:28, "208Pb"] = 1e-3
+        edited.append(replace(sample, timeseries_data=data))
+    return edited
+
+
+@pytest.mark.parametrize("method", ["zscore", "sigma_clip", "mad"])
+def test_process_batch_matches_process(run_dir, settings, method):
+    samples = edit_run(load_run(run_dir))
+    settings.outlier_method = method
+
+    results, events = {}, {}
+    for engine in ("process", "process_batch"):
+        sink = RecordingSink()
+        results[engine] = getattr(DataProcessor(settings, NIST610, sink), engine)(
+            samples
+        )
+        events[engine] = sorted((e.kind.name, e.sample, e.window) for e in sink.events)
+
+    pd.testing.assert_frame_equal(
+        results["process_batch"], results["process"], rtol=1e-10
+    )
+    assert events["process_batch"] == events["process"]
+    # no signal, all of the signal below the limit, all of the blank above it
+    empty = (
+        results["process"]
+        .set_index("name")
+        .loc[["my_smpl_002", "my_smpl_004", "my_smpl_005"]]
+    )
+    assert empty.drop(columns="type").isna().all().all()
@@ -0,0 +1,165 @@
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess.instrumentation import EventKind, RecordingSink
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.mstypes import (
+    IsotopeRatio,
+    PeakStripSettings,
+    ProcessingSettings,
+    Sample,
+)
+from icpmsprocess.plan import compile_plan
+from icpmsprocess.processors import (
+    InternalCorrector,
+    MassBiasCorrector,
+    RatioCalculator,
+)
+
+SETTINGS = ProcessingSettings(
+    intensity_metric="208Pb",
+    min_signal_intensity=1,
+    max_blank_intensity=5e-4,
+    low_cycles_warning_frac=0.1,
+    blank_cycles=28,
+    signal_cycles=(31, 58),
+)
+
+# an unknown before the first standard, two and one between standards, and one after the last
+IS_STANDARD = np.array([False, True, False, False, True, False, True, False])
+ACQUISITION_TIMES = [0, 5, 15, 45, 105, 135, 155, 205]
+
+
+def make_sample(metric: np.ndarray, first_cycle: int = 1) -> Sample:
+    """A Pb-Pb sample with steady intensities, so only the given intensity metric can drop cycles"""
+    n = len(metric)
+    wobble = 1 + 1e-3 * np.sin(np.arange(n))
+    data = pd.DataFrame(
+        {
+            "202Hg": 7e-3 * wobble,
+            "204Pb": 1.4 * wobble,
+            "206Pb": 24 * wobble,
+            "207Pb": 22 * wobble,
+            "208Pb": metric,
+        },
+        index=pd.RangeIndex(first_cycle, first_cycle + n, name="Cycle"),
+    )
+    return Sample(
+        name="sample", type="sample", isotope_system=Pb_Pb, timeseries_data=data
+    )
+
+
+def test_signal_cycles_below_the_threshold_are_dropped():
+    metric = np.full(28, 2.0)
+    metric[[3, 10, 20]] = 0.5
+    sample = make_sample(metric, first_cycle=31)
+
+    kept = InternalCorrector(SETTINGS).remove_outliers(sample, limit_low=True)
+
+    assert list(kept.timeseries_data.index) == [
+        c for c in range(31, 59) if c not in (34, 41, 51)
+    ]
+
+
+def test_blank_cycles_above_the_threshold_are_dropped():
+    metric = np.full(28, 1e-4)
+    metric[[0, 5]] = 1e-3
+    sample = make_sample(metric)
+
+    kept = InternalCorrector(SETTINGS).remove_outliers(sample, limit_hi=True)
+
+    assert list(kept.timeseries_data.index) == [
+        c for c in range(1, 29) if c not in (1, 6)
+    ]
+
+
+def test_warns_when_few_cycles_are_left():
+    metric = np.full(28, 0.5)
+    metric[:2] = 2.0
+    sample = make_sample(metric, first_cycle=31)
+
+    with pytest.warns(UserWarning, match="left only 2 cycles"):
+        kept = InternalCorrector(SETTINGS).remove_outliers(sample, limit_low=True)
+    assert len(kept.timeseries_data) == 2
+
+
+def test_reduced_data_is_float():
+    metric = np.full(28, 2.0)
+    sample = make_sample(metric, first_cycle=31)
+
+    reduced = RatioCalculator().reduce(sample).reduced_data
+
+    assert reduced.dtype == np.float64
+    assert list(reduced.index[:2]) == ["206Pb_204Pb", "206Pb_204Pb_err"]
+
+
+def test_chained_interferences_match_stripping_one_after_the_other():
+    sample = make_sample(np.full(28, 2.0), first_cycle=31)
+    # 202Hg is itself corrected, here for a made up interference on 208Pb
+    hg202 = PeakStripSettings("202Hg", IsotopeRatio("202X", "208Pb"), 1e-4)
+    chained = replace(Pb_Pb, interferences=[hg202])
+    hg202_only = replace(Pb_Pb, peak_strip=None, interferences=[hg202])
+
+    ratio_calculator = RatioCalculator()
+    one_by_one = ratio_calculator.strip_peaks(
+        ratio_calculator.strip_peaks(replace(sample, isotope_system=hg202_only)),
+        compile_plan(Pb_Pb),
+    )
+    both = ratio_calculator.strip_peaks(replace(sample, isotope_system=chained))
+
+    pd.testing.assert_frame_equal(
+        both.timeseries_data, one_by_one.timeseries_data, rtol=1e-14
+    )
+    assert not np.allclose(
+        both.timeseries_data["204Pb"],
+        ratio_calculator.strip_peaks(sample).timeseries_data["204Pb"],
+        rtol=1e-9,
+        atol=0,
+    )
+
+
+@pytest.mark.parametrize(
+    "weighting, weight_next",
+    [
+        ("mean", [1.0, 0.5, 0.5, 0.5, 0.0]),
+        ("run_order", [1.0, 1 / 3, 2 / 3, 0.5, 0.0]),
+        ("time", [1.0, 0.1, 0.4, 0.6, 0.0]),
+    ],
+)
+def test_bracketing_weights(weighting, weight_next):
+    bracketing = MassBiasCorrector(NIST610, weighting).bracket(
+        IS_STANDARD, ACQUISITION_TIMES
+    )
+
+    assert bracketing.unknown_indices.tolist() == [0, 2, 3, 5, 7]
+    assert bracketing.prev_indices.tolist() == [1, 1, 1, 4, 6]
+    assert bracketing.next_indices.tolist() == [1, 4, 4, 6, 6]
+    np.testing.assert_allclose(bracketing.weight_next, weight_next, rtol=1e-14)
+    assert bracketing.is_after_last.tolist() == [False] * 4 + [True]
+
+
+def test_time_weighting_needs_acquisition_times():
+    with pytest.raises(ValueError, match="needs acquisition times"):
+        MassBiasCorrector(NIST610, "time").bracket(IS_STANDARD)
+
+
+def test_unknowns_after_the_last_standard_are_reported():
+    values = np.where(IS_STANDARD, [0, 2, 0, 0, 4, 0, 8, 0], 1.0)[:, np.newaxis]
+    names = [f"m{i}" for i in range(len(values))]
+    sink = RecordingSink()
+
+    corrected = MassBiasCorrector(NIST610, sink=sink).correct_arrays(
+        values,
+        IS_STANDARD,
+        ["206Pb_204Pb"],
+        names=names,
+        reference_values=np.array([1.0]),
+    )
+
+    np.testing.assert_allclose(corrected[:, 0], [1 / 2, 1 / 3, 1 / 3, 1 / 6, 1 / 8])
+    assert [(e.kind, e.sample) for e in sink.events] == [
+        (EventKind.AFTER_LAST_STANDARD, "m7")
+    ]
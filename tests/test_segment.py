@@ -0,0 +1,59 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from icpmsprocess.lib import Pb_Pb
+from icpmsprocess.mstypes import SegmentationSettings
+from icpmsprocess.segment import segment_samples
+
+SEGMENTATION = SegmentationSettings(
+    "208Pb", blank_threshold=1e-3, signal_threshold=1, trim_cycles=1
+)
+
+
+def write_long_file(run_dir: str, filepath: str) -> pd.DataFrame:
+    """Join the analyses of a generated run into one file, returning their sample map rows"""
+    files = sorted(glob.glob(os.path.join(run_dir, "*.exp")))
+    lines = open(files[0]).read().split("\n")[:23]
+    cycle = 0
+    for fp in files:
+        for line in open(fp).read().split("\n")[23:]:
+            if line and not line.startswith("*"):
+                cycle += 1
+                lines.append("\t".join([str(cycle)] + line.split("\t")[1:]))
+    with open(filepath, "w") as f:
+        f.write("\n".join(lines + ["*** end"]) + "\n")
+
+    sample_map = pd.read_csv(os.path.join(run_dir, "sample_map.csv"))
+    sample_map = sample_map.set_index("file_name").loc[
+        [os.path.basename(fp) for fp in files]
+    ]
+    return sample_map.reset_index().assign(file_name=os.path.basename(filepath))
+
+
+def test_only_the_files_own_sample_map_rows_are_used(run_dir, tmp_path):
+    run1 = write_long_file(run_dir, str(tmp_path / "run1.exp"))
+    run10 = run1.assign(file_name="run10.exp", sample_name=run1.sample_name + "_10")
+    sample_map_path = str(tmp_path / "sample_map.csv")
+    pd.concat([run10, run1]).to_csv(sample_map_path, index=False)
+
+    samples = segment_samples(
+        str(tmp_path / "run1.exp"), sample_map_path, Pb_Pb, SEGMENTATION
+    )
+
+    assert [s.name for s in samples] == list(run1.sample_name)
+
+
+def test_a_sample_map_of_the_wrong_length_fails_before_any_sample(run_dir, tmp_path):
+    run1 = write_long_file(run_dir, str(tmp_path / "run1.exp"))
+    sample_map_path = str(tmp_path / "sample_map.csv")
+    run1.iloc[:-1].to_csv(sample_map_path, index=False)
+
+    samples = segment_samples(
+        str(tmp_path / "run1.exp"), sample_map_path, Pb_Pb, SEGMENTATION
+    )
+
+    with pytest.raises(ValueError, match="Found 12 analyses"):
+        next(samples)
@@ -0,0 +1,71 @@
+import itertools
+import os
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor, RecordingSink
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.sweep import sweep
+from icpmsprocess.utils import load_samples
+
+GRID = {
+    "blank_cycles": [20, 28],
+    "signal_cycles": [(31, 58), (35, 55)],
+    # the signal of 208Pb is about 54.3, so these keep every cycle, some and none
+    "min_signal_intensity": [1, 54.3, 100],
+}
+
+
+@pytest.fixture
+def samples(run_dir):
+    return load_samples(run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+
+
+def as_long(results: pd.DataFrame, ratio_names) -> pd.DataFrame:
+    """`DataProcessor.process_batch` results, one row per unknown and ratio as in a sweep"""
+    return pd.DataFrame(
+        {
+            "name": np.repeat(results.name.to_numpy(), len(ratio_names)),
+            "type": np.repeat(results.type.to_numpy(), len(ratio_names)),
+            "ratio": np.tile(np.array(ratio_names, dtype=object), len(results)),
+            "value": results[ratio_names].to_numpy().ravel(),
+            "error": results[[f"{r}_err" for r in ratio_names]].to_numpy().ravel(),
+        }
+    )
+
+
+@pytest.mark.parametrize("bracketing", ["mean", "run_order"])
+def test_sweep_matches_process_batch(samples, settings, bracketing):
+    settings = replace(settings, bracketing=bracketing)
+
+    results = sweep(samples, settings, NIST610, GRID, sink=RecordingSink())
+
+    ratio_names = [r.name for r in Pb_Pb.ratios]
+    combinations = list(itertools.product(*GRID.values()))
+    assert len(results) == len(combinations) * 7 * len(ratio_names)
+    for values, (_, combination) in zip(
+        combinations, results.groupby(list(GRID), sort=False)
+    ):
+        changed = replace(settings, **dict(zip(GRID, values)))
+        expected = DataProcessor(changed, NIST610, RecordingSink()).process_batch(
+            samples
+        )
+
+        assert combination[list(GRID)].drop_duplicates().values.tolist() == [
+            list(values)
+        ]
+        pd.testing.assert_frame_equal(
+            combination.drop(columns=[*GRID, "accuracy"]).reset_index(drop=True),
+            as_long(expected, ratio_names),
+            rtol=1e-12,
+        )
+    all_rejected = results[results.min_signal_intensity == 100]
+    assert all_rejected.value.isna().all()
+
+
+def test_only_window_and_threshold_settings_can_be_swept(samples, settings):
+    with pytest.raises(ValueError, match=r"Can't sweep \['outlier_method'\]"):
+        sweep(samples, settings, NIST610, {"outlier_method": ["zscore", "mad"]})
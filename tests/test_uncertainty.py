@@ -0,0 +1,74 @@
+import os
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.processors import MassBiasCorrector
+from icpmsprocess.uncertainty import monte_carlo_errors
+from icpmsprocess.utils import load_samples
+
+
+def load_run(run_dir):
+    return load_samples(run_dir, os.path.join(run_dir, "sample_map.csv"), Pb_Pb)
+
+
+def test_monte_carlo_errors_are_reproducible_with_a_seed(run_dir, settings):
+    samples = load_run(run_dir)
+    settings = replace(settings, uncertainty="monte_carlo", uncertainty_draws=200)
+
+    def process(seed):
+        return DataProcessor(
+            replace(settings, random_seed=seed), NIST610
+        ).process_batch(samples)
+
+    first = process(1)
+    pd.testing.assert_frame_equal(first, process(1), check_exact=True)
+    errors = [c for c in first.columns if c.endswith("_err")]
+    assert not np.array_equal(first[errors], process(2)[errors])
+
+    sem = DataProcessor(replace(settings, uncertainty="sem"), NIST610).process_batch(
+        samples
+    )
+    ratios = [c[: -len("_err")] for c in errors]
+    pd.testing.assert_frame_equal(first[ratios], sem[ratios], check_exact=True)
+
+
+@pytest.mark.parametrize("reference_uncertainty", [None, 0.1])
+def test_reference_uncertainties_are_propagated(reference_uncertainty):
+    # a standard, an unknown and a standard, with no scatter between cycles
+    ratios = np.array([2.0, 3.0, 2.0])[:, np.newaxis, np.newaxis] * np.ones((3, 5, 1))
+    cycle_mask = np.ones((3, 5), dtype=bool)
+    mass_bias_corrector = MassBiasCorrector(NIST610)
+    bracketing = mass_bias_corrector.bracket(np.array([True, False, True]))
+
+    errors = monte_carlo_errors(
+        ratios,
+        cycle_mask,
+        bracketing,
+        mass_bias_corrector,
+        reference_values=np.array([4.0]),
+        reference_uncertainties=(
+            None if reference_uncertainty is None else np.array([reference_uncertainty])
+        ),
+        n_draws=4000,
+        seed=0,
+    )
+
+    if reference_uncertainty is None:
+        assert errors.tolist() == [[0.0]]
+    else:
+        # the corrected ratio is 3 / 2 * reference
+        np.testing.assert_allclose(errors, [[1.5 * reference_uncertainty]], rtol=0.05)
+
+
+@pytest.mark.parametrize("method", ["process", "process_to"])
+def test_only_process_batch_gives_monte_carlo_errors(run_dir, settings, method):
+    processor = DataProcessor(replace(settings, uncertainty="monte_carlo"), NIST610)
+    args = (load_run(run_dir),) if method == "process" else (load_run(run_dir), None)
+
+    with pytest.raises(ValueError, match="use process_batch"):
+        getattr(processor, method)(*args)
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from icpmsprocess import DataProcessor
+from icpmsprocess.lib import NIST610, Pb_Pb
+from icpmsprocess.utils import load_samples
+
+
+def zero_column(filepath: str, column: str) -> None:
+    """Write a column of a data file as integer zeros, as an instrument does for an isotope it didn't see"""
+    lines = open(filepath).read().split("\n")
+    i = lines[22].split("\t").index(column)
+    for n, line in enumerate(lines[23:], start=23):
+        if line and not line.startswith("*"):
+            fields = line.split("\t")
+            fields[i] = "0"
+            lines[n] = "\t".join(fields)
+    with open(filepath, "w") as f:
+        f.write("\n".join(lines))
+
+
+@pytest.mark.parametrize("storage_dtype", ["float64", "float32"])
+@pytest.mark.parametrize("intensity_metric", [None, "208Pb"])
+def test_integer_intensity_columns_are_loaded_as_floats(
+    run_dir, settings, storage_dtype, intensity_metric
+):
+    zero_column(os.path.join(run_dir, "S-003.exp"), "202Hg")
+
+    samples = load_samples(
+        run_dir,
+        os.path.join(run_dir, "sample_map.csv"),
+        Pb_Pb,
+        intensity_metric=intensity_metric,
+        storage_dtype=storage_dtype,
+    )
+    sample = samples[2]  # loaded in order of their file names
+    assert sample.timeseries_data["202Hg"].dtype == storage_dtype
+    assert sample.timeseries_data["Time"].dtype == np.int64
+
+    settings.storage_dtype = storage_dtype
+    processor = DataProcessor(settings, NIST610)
+    pd.testing.assert_frame_equal(
+        processor.process(samples), processor.process_batch(samples), rtol=1e-10
+    )